@@ -20,8 +20,24 @@ from .abstract_experiment import trseeker_logger
 from .abstract_experiment import runner
 from .abstract_manager import ProjectManagerException
 from .abstract_model import AbstractModel
+from .abstract_model import compile_model
+from .abstract_model import AbstractMongoModel
+from .mongo_pool import get_mongo_client
+from .model_table import ModelTable
+from .model_io import dump_many
+from .model_io import load_many
+from .model_io import dump_binary
+from .model_io import load_binary
+from .model_io import BinaryModelWriter
+from .model_io import BinaryModelReader
 from .abstract_manager import ProjectManager
+from .project_store import AbstractProjectStore
+from .project_store import YamlProjectStore
+from .project_store import SQLiteProjectStore
+from .step_cache import StepCache
 from .abstract_reader import WiseOpener
+from .abstract_reader import MappedFile
+from .line_index import LineIndex
 from .abstract_reader import AbstractFileIO
 from .abstract_reader import AbstractFolderIO
 from .abstract_reader import AbstractFoldersIO
@@ -30,26 +46,34 @@ from .abstract_reader import sc_iter_filename_folder
 from .abstract_reader import sc_iter_path_name_folder
 from .abstract_reader import sc_iter_filedata_folder
 from .abstract_reader import sc_move_files
+from .abstract_reader import sc_copy_files
 from .abstract_reader import sc_process_file
 from .abstract_reader import sc_process_folder
 from .abstract_reader import sc_process_folder_to_other
+from .abstract_reader import sc_process_folder_online
 from .abstract_reader import read_pickle_file
+from .abstract_reader import external_sort
 from .app import run_app
 
 
 __all__ = [
     Timer, AbstractStep, AbstractExperiment, AbstractExperimentSettings,
-    ProjectManagerException, AbstractModel, ProjectManager,
-    WiseOpener, AbstractFileIO, AbstractFolderIO, AbstractFoldersIO,
+    ProjectManagerException, AbstractModel, compile_model, AbstractMongoModel, get_mongo_client, ModelTable, dump_many, load_many,
+    dump_binary, load_binary, BinaryModelWriter, BinaryModelReader, ProjectManager,
+    AbstractProjectStore, YamlProjectStore, SQLiteProjectStore, StepCache,
+    WiseOpener, MappedFile, LineIndex, AbstractFileIO, AbstractFolderIO, AbstractFoldersIO,
     sc_iter_filepath_folder,
     sc_iter_filename_folder,
     sc_iter_path_name_folder,
     sc_iter_filedata_folder,
     sc_move_files,
+    sc_copy_files,
     sc_process_file,
     sc_process_folder,
     sc_process_folder_to_other,
+    sc_process_folder_online,
     read_pickle_file,
+    external_sort,
     run_app,
     core_logger,
     exp_logger,
@@ -9,7 +9,14 @@ Experiment abstraction.
 """
 import time
 import os
-import urllib
+import signal
+import asyncio
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
 try:
     import simplejson
     from logbook import Logger
@@ -25,6 +32,10 @@ except:
         
     print("No logbook installed")
 import subprocess
+from PyExp.reporter import get_reporter
+from PyExp.reporter import send_data
+from PyExp.reporter import flush_reporter
+from PyExp.step_cache import StepCache
 
 STARTED = "Started"
 FINISHED = "Finished"
@@ -92,35 +103,76 @@ class ProcessRunner(object):
 
     def run_asap(self, commands, cpu=10, mock=False):
         """
-        Run large number of commands in parallel with subprocess.Popen
+        Run large number of commands in parallel with subprocess.Popen.
+        Commands are started in the given order, a next command is started
+        as soon as any of running processes exits.
         :param commands: list of commands for shell
-        :param cpu: number of cpu
+        :param cpu: number of simultaneously running processes
         :param mock: don't run command
+        :return: list of dicts with command, returncode, start, end and elapsed keys in commands order
         """
         if not isinstance(commands, list):
             message = "Expected list get %s" % str(commands)
             runner_logger.error(message)
             raise Exception(message)
-        running = []
-        while commands:
-            while len(running) > cpu:
-                runner_logger.debug("Checking %s processes from (%s)" % (len(running), len(commands)))
-                for i, p in enumerate(running):
-                    returncode = p.poll()
-                    if returncode is not None:
-                        if returncode == 0:
-                            runner_logger.info('A process returned: %s (remains %s)' % (p.returncode, len(commands)))
-                        else:
-                            runner_logger.error('A process returned error: %s (remains %s)' % (p.returncode, len(commands)))
-                        running[i] = None
-                        running = [x for x in running if x is not None]
-                        break
-                time.sleep(1)
-            command = commands.pop()
-            runner_logger.info(command)
-            if not mock:
-                running.append(subprocess.Popen(command, shell=True))
-        
+        results = []
+        for command in commands:
+            results.append({
+                'command': command,
+                'returncode': None,
+                'start': None,
+                'end': None,
+                'elapsed': None,
+            })
+        if mock:
+            for command in commands:
+                runner_logger.info(command)
+            return results
+        cpu = max(1, cpu)
+        running = {}
+        next_i = 0
+        n = len(commands)
+        while next_i < n or running:
+            while next_i < n and len(running) < cpu:
+                command = commands[next_i]
+                runner_logger.info(command)
+                results[next_i]["start"] = time.time()
+                p = subprocess.Popen(command, shell=True)
+                running[p.pid] = (next_i, p)
+                next_i += 1
+            pid = self._wait_any(running)
+            i, p = running.pop(pid)
+            p.wait()
+            result = results[i]
+            result["returncode"] = p.returncode
+            result["end"] = time.time()
+            result["elapsed"] = result["end"] - result["start"]
+            if p.returncode == 0:
+                runner_logger.info('A process returned: %s (remains %s)' % (p.returncode, n - next_i + len(running)))
+            else:
+                runner_logger.error('A process returned error: %s (remains %s)' % (p.returncode, n - next_i + len(running)))
+        return results
+
+    def _wait_any(self, running):
+        """
+        Block until any of running processes exits.
+        The exited child is not reaped here, so Popen.wait() gets its return code.
+        :param running: dict pid -> (index, Popen)
+        :return: pid of the exited process
+        """
+        while True:
+            if hasattr(os, "waitid"):
+                try:
+                    info = os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOWAIT)
+                except ChildProcessError:
+                    info = None
+                if info is not None and info.si_pid in running:
+                    return info.si_pid
+            # an exited child isn't ours or waitid is unavailable
+            for pid, (i, p) in running.items():
+                if p.poll() is not None:
+                    return pid
+            time.sleep(0.01)
 
     def popen(self, command, silent=False):
         """
@@ -129,17 +181,143 @@ class ProcessRunner(object):
         :param command: command for shell
         """
         runner_logger.info("Running: %s" % command)
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         output, error = process.communicate()
         if not silent:
             runner_logger.debug("Output: %s" % output)
             runner_logger.debug("Error: %s" % error)
         if process.returncode != 0:
-            message = "ERROR when launching '%s', code %s, output %s" % (command, process.returncode, output)
+            message = "ERROR when launching '%s', code %s, output %s, error %s" % (command, process.returncode, output, error)
             runner_logger.error(message)
             raise Exception(message)
         return output, error
 
+    async def run_async(self, command, stdout=None, stderr=None, timeout=None, semaphore=None):
+        """
+        Run command with asyncio subprocess and stream its output line by line.
+        :param command: command for shell
+        :param stdout: None to discard output, callable for each line, file name or file object to write lines to
+        :param stderr: the same as stdout for error stream
+        :param timeout: kill command after timeout seconds, default None
+        :param semaphore: asyncio.Semaphore limiting number of running commands
+        :return: dict with command, returncode, start, end, elapsed and timeout keys
+        """
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(1)
+        async with semaphore:
+            result = {
+                'command': command,
+                'returncode': None,
+                'start': time.time(),
+                'end': None,
+                'elapsed': None,
+                'timeout': False,
+            }
+            runner_logger.info(command)
+            out_sink, out_fh = self._open_sink(stdout)
+            err_sink, err_fh = self._open_sink(stderr)
+            try:
+                process = await asyncio.create_subprocess_shell(
+                    command,
+                    stdout=subprocess.PIPE if out_sink else subprocess.DEVNULL,
+                    stderr=subprocess.PIPE if err_sink else subprocess.DEVNULL,
+                    start_new_session=True)
+                tasks = [process.wait()]
+                if out_sink:
+                    tasks.append(self._stream_lines(process.stdout, out_sink))
+                if err_sink:
+                    tasks.append(self._stream_lines(process.stderr, err_sink))
+                try:
+                    await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+                except asyncio.TimeoutError:
+                    result["timeout"] = True
+                    runner_logger.error("Timeout (%s sec) for command: %s" % (timeout, command))
+                    self._kill(process)
+                    await process.wait()
+            finally:
+                if out_fh:
+                    out_fh.close()
+                if err_fh:
+                    err_fh.close()
+            result["returncode"] = process.returncode
+            result["end"] = time.time()
+            result["elapsed"] = result["end"] - result["start"]
+            if process.returncode != 0:
+                runner_logger.error('A process returned error: %s (%s)' % (process.returncode, command))
+            return result
+
+    def gather(self, commands, cpu=10, timeout=None, stdout=None, stderr=None):
+        """
+        Run commands with asyncio, at most cpu commands at a time.
+        :param commands: list of commands for shell
+        :param cpu: number of simultaneously running commands
+        :param timeout: per command timeout in seconds
+        :param stdout: None, callable for each line or list of per command targets (see run_async)
+        :param stderr: the same as stdout for error stream
+        :return: list of run_async results in commands order
+        """
+        if not isinstance(commands, list):
+            message = "Expected list get %s" % str(commands)
+            runner_logger.error(message)
+            raise Exception(message)
+        return asyncio.run(self._gather(commands, cpu, timeout, stdout, stderr))
+
+    def map(self, template, items, cpu=10, timeout=None, stdout=None, stderr=None):
+        """
+        Run template % item command for each item with asyncio.
+        :param template: command template, e.g. "gzip %s" or "bwa %(index)s %(reads)s"
+        :param items: list of template values
+        :return: list of run_async results in items order
+        """
+        commands = [template % item for item in items]
+        return self.gather(commands, cpu=cpu, timeout=timeout, stdout=stdout, stderr=stderr)
+
+    async def _gather(self, commands, cpu, timeout, stdout, stderr):
+        """ Create run_async tasks sharing one semaphore."""
+        semaphore = asyncio.Semaphore(max(1, cpu))
+        tasks = []
+        for i, command in enumerate(commands):
+            out = stdout[i] if isinstance(stdout, list) else stdout
+            err = stderr[i] if isinstance(stderr, list) else stderr
+            tasks.append(self.run_async(command, stdout=out, stderr=err, timeout=timeout, semaphore=semaphore))
+        return await asyncio.gather(*tasks)
+
+    def _open_sink(self, target):
+        """ Return (line consumer, opened file or None) for stdout/stderr target."""
+        if target is None:
+            return None, None
+        if isinstance(target, str):
+            fh = open(target, "wb")
+            return fh.write, fh
+        if hasattr(target, "write"):
+            return target.write, None
+        assert hasattr(target, "__call__")
+        return target, None
+
+    async def _stream_lines(self, stream, sink, chunk_size=65536):
+        """ Read stream by chunks and pass complete lines to sink."""
+        tail = b""
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                sink(line + b"\n")
+        if tail:
+            sink(tail)
+
+    def _kill(self, process):
+        """ Kill process with its process group (shell children)."""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except OSError:
+            pass
+
 runner = ProcessRunner()
 
 
@@ -193,7 +371,8 @@ class AbstractStep(object):
     >>> step = AbstractStep(name, data, cf, use_env=False)
     """
 
-    def __init__(self, name, data, cf, save_output=False, check_f=None, check_p=None, check_value=None):
+    def __init__(self, name, data, cf, save_output=False, check_f=None, check_p=None, check_value=None,
+                 requires=None, cost=1, cache=True, outputs=None):
 
         self.name = name
         self.sid = None
@@ -203,6 +382,10 @@ class AbstractStep(object):
         self.check_p = check_p
         self.check_value = check_value
         self.save_output = save_output
+        self.requires = list(requires or [])
+        self.cost = cost
+        self.cache = cache
+        self.outputs = list(outputs or [])
         assert hasattr(cf, "__call__")
         if self.check_f:
             assert hasattr(self.check_f, "__call__")
@@ -267,6 +450,7 @@ class AbstractExperiment(object):
     """
 
     all_steps = None
+    step_cache = None
 
     ### Initialization section ###
 
@@ -278,7 +462,11 @@ class AbstractExperiment(object):
             - force
             - manager
             - send_to_server
+            - step_cache, StepCache instance, by default it is created
+              if step_cache_folder is set in config
         """
+        self._steps_graph = {}
+        self.step_timings = {}
         # init empty class
         if settings is None and project is None:
             self.init_steps()
@@ -302,6 +490,12 @@ class AbstractExperiment(object):
             self.send_to_server = kwargs['send_to_server']
         self.settings = settings
         self.project = project
+        self.step_cache = kwargs.get('step_cache')
+        config = settings.get("config") or {}
+        if self.step_cache is None and config.get("step_cache_folder"):
+            self.step_cache = StepCache(config["step_cache_folder"],
+                                        max_size=config.get("step_cache_size", 10 * 1024 ** 3),
+                                        fingerprint=config.get("step_cache_fingerprint", "stat"))
         self.sp = 0
         self.pid = project["pid"]
         self.sid2step = {}
@@ -309,12 +503,21 @@ class AbstractExperiment(object):
         self.init_steps()
         self.settings["manager"] = self.manager
         self.settings["experiment"] = self
-        self._skip_server_part = False
 
     def init_steps(self):
         """ Add available steps."""
         raise NotImplemented
 
+    @property
+    def _lock(self):
+        """ Lock for project refresh and update, it is created on first use,
+        so subclasses which don't call AbstractExperiment.__init__ have it too.
+        """
+        lock = self.__dict__.get("_step_lock")
+        if lock is None:
+            lock = self.__dict__.setdefault("_step_lock", threading.RLock())
+        return lock
+
     ### Steps management section ###
 
     def add_step(self, step):
@@ -326,9 +529,44 @@ class AbstractExperiment(object):
         self.sid2step[step.sid] = step
         self.sp += 1
 
+    def build_step(self, step_dict, manager=None, pid=None):
+        """ Create step from available step dict.
+        :param step_dict: step dict from available steps
+        :param manager: project manager for steps with manager flag
+        :param pid: project pid for steps with manager flag
+        :return: instance of AbstractStep
+
+        If "pre" is a step name or a list of step names then it is used as
+        step dependencies (together with "requires" list), otherwise it is a prerequisite function.
+        """
+        input = None
+        if "manager" in step_dict and step_dict["manager"]:
+            input = {"manager": manager,
+                     "pid": pid,
+                     }
+        pre = step_dict.get("pre")
+        requires = list(step_dict.get("requires") or [])
+        if isinstance(pre, str):
+            requires.append(pre)
+            pre = None
+        elif isinstance(pre, list) or isinstance(pre, tuple):
+            requires.extend(pre)
+            pre = None
+        return AbstractStep(step_dict["name"],
+                            input,
+                            step_dict["cf"],
+                            save_output=False,
+                            check_f=step_dict.get("check"),
+                            check_p=pre,
+                            check_value=step_dict.get("check_value"),
+                            requires=requires,
+                            cost=step_dict.get("cost", 1),
+                            cache=step_dict.get("cache", True),
+                            outputs=step_dict.get("outputs"))
+
     def get_all_steps(self):
         """ Get list of steps."""
-        return [self.sid2step[i] for i in xrange(0, self.sp) if self.sid2step[i]]
+        return [self.sid2step[i] for i in range(0, self.sp) if self.sid2step[i]]
 
     def get_step_names(self):
         """ Return list of all steps.
@@ -406,6 +644,16 @@ class AbstractExperiment(object):
         """
         steps = self.get_all_steps()
         for step in steps[start_sid:end_sid]:
+            self._execute_step(step, project_context=project_context)
+
+    def _execute_step(self, step, project_context=None):
+        """ Execute one step, see execute().
+        Project refresh and update are guarded with lock,
+        so steps can be executed from several threads.
+        :return: True if step was executed, False if it was skipped as finished,
+                 None if prerequisites failed
+        """
+        with self._lock:
             # refresh project
             self.project, _settings = self.manager.get_project(self.project["pid"], project_context=project_context)
             if not "status" in self.project:
@@ -419,52 +667,244 @@ class AbstractExperiment(object):
                     status_p = self.project["status"][step.name]
                     if status_p == step.check_value:
                         exp_logger.warning("Step skipped. Step %s was previously computed with %s" % (step.name, status_p))
-                        continue
-            if self.logger:
-                exp_logger.info("Logger, start event", self.logger(self.pid, self.name, step.sid, step.name, STARTED))
-            with Timer(step.name):
-                # save step output
-                if step.check_p is not None and hasattr(step.check_p, "__call__"):
-                    exp_logger.info("Compute prerequisites for step %s" % step.name)
-                    result = step.check_p(self.settings, self.project)
-                    if result is not None:
-                        exp_logger.error("Compute prerequisites for step %s is failed with %s" % (step.name, result))
+                        return False
+        if self.logger:
+            exp_logger.info("Logger, start event", self.logger(self.pid, self.name, step.sid, step.name, STARTED))
+        with Timer(step.name):
+            # save step output
+            if step.check_p is not None and hasattr(step.check_p, "__call__"):
+                exp_logger.info("Compute prerequisites for step %s" % step.name)
+                result = step.check_p(self.settings, self.project)
+                if result is not None:
+                    exp_logger.error("Compute prerequisites for step %s is failed with %s" % (step.name, result))
+                    with self._lock:
                         self.project["status"][step.name] = result
-                        continue
-                if step.input is None:
-                    result = step.cf(self.settings, self.project)
-                elif isinstance(step.input, dict):
-                    result = step.cf(self.settings, self.project, **step.input)
-                elif isinstance(step.input, list) or isinstance(step.input, tuple):
-                    result = step.cf(self.settings, self.project, *step.input)
+                    return None
+            cache_key = None
+            if self.step_cache is not None and step.cache:
+                cache_key, fingerprints = self.step_cache.get_key(step, self.settings)
+                entry = None if self.force else self.step_cache.get(cache_key)
+                if entry is not None:
+                    return self._restore_cached_step(step, cache_key, entry)
+            if step.input is None:
+                result = step.cf(self.settings, self.project)
+            elif isinstance(step.input, dict):
+                result = step.cf(self.settings, self.project, **step.input)
+            elif isinstance(step.input, list) or isinstance(step.input, tuple):
+                result = step.cf(self.settings, self.project, *step.input)
+            else:
+                result = step.cf(self.settings, self.project, step.input)
+            if cache_key is not None:
+                self.step_cache.put(cache_key, step, self.settings, fingerprints, result)
+            if self.logger:
+                exp_logger.info("Logger, finish event", self.logger(self.pid, self.name, step.sid, step.name, FINISHED))
+        self._finish_step(step, result)
+        return True
+
+    def _restore_cached_step(self, step, cache_key, entry):
+        """ Restore step outputs and result from step cache.
+        :return: False as for skipped step
+        """
+        exp_logger.warning("Step skipped. Step %s result was restored from cache" % step.name)
+        self.step_cache.restore(cache_key, entry, self.settings)
+        self._finish_step(step, entry["result"])
+        return False
+
+    def _finish_step(self, step, result):
+        """ Save step output, check step and update project."""
+        with self._lock:
+            # save step output
+            if step.save_output:
+                if isinstance(result, dict):
+                    for key, value in result.items():
+                        self.settings[key] = value
                 else:
-                    result = step.cf(self.settings, self.project, step.input)
-                if self.logger:
-                    exp_logger.info("Logger, finish event", self.logger(self.pid, self.name, step.sid, step.name, FINISHED))
-                # save step output
-                if step.save_output:
-                    if result is None:
-                        pass
-                    if isinstance(result, dict):
-                        for key, value in result.items():
-                            self.settings[key] = value
-                    else:
-                        self.settings[step.name] = result
+                    self.settings[step.name] = result
             # post verification
             self.check_step(step, result)
             # update project
             self.logger_update_project(self.project["pid"], self.project)
 
-    def execute_parallel(self, start_sid=0, end_sid=None, project_context=None, threads=1):
+    def get_steps_graph(self):
+        """ Return dependency graph of added steps: sid -> list of sids of required steps.
+        Required steps which weren't added are ignored.
+        """
+        steps = self.get_all_steps()
+        name2sids = {}
+        for step in steps:
+            name2sids.setdefault(step.name, []).append(step.sid)
+        graph = {}
+        for step in steps:
+            graph[step.sid] = []
+            for name in step.requires:
+                graph[step.sid].extend(name2sids.get(name, []))
+        return graph
+
+    def _sort_steps_graph(self, graph):
+        """ Return sids in topological order or raise exception for cyclic dependencies."""
+        order = []
+        state = {}
+        for sid in sorted(graph):
+            if sid in state:
+                continue
+            stack = [(sid, iter(graph[sid]))]
+            state[sid] = 1
+            while stack:
+                node, deps = stack[-1]
+                for dep in deps:
+                    if state.get(dep) == 1:
+                        raise Exception("Cyclic dependency between steps %s and %s" % (self.sid2step[node], self.sid2step[dep]))
+                    if dep not in state:
+                        state[dep] = 1
+                        stack.append((dep, iter(graph[dep])))
+                        break
+                else:
+                    stack.pop()
+                    state[node] = 2
+                    order.append(node)
+        return order
+
+    def execute_dag(self, workers=2, slots=None, project_context=None):
+        """ Execute added steps as a dependency graph.
+        Dependencies are step.requires names, see build_step().
+        Steps with finished dependencies are executed in a pool of threads,
+        running steps use at most slots units of step.cost (default slots is workers).
+        If a step fails no new steps are started and the exception is raised
+        after running steps are finished. Steps depending on a step
+        with failed prerequisites are not executed.
+        Cached steps without declared outputs are executed alone,
+        otherwise files of other running steps would be cached as their outputs.
+        :param workers: number of threads
+        :param slots: number of resource units, e.g. CPU
+        :param project_context: project context dictionary
+        :return: critical path, see get_critical_path()
+        """
+        steps = self.get_all_steps()
+        graph = self.get_steps_graph()
+        self._steps_graph = graph
+        self._sort_steps_graph(graph)
+        slots = slots or workers
+        free = slots
+        done = set()
+        started = set()
+        running = {}
+        exclusive = False
+        error = None
+        self.step_timings = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                for step in steps:
+                    if error is not None or len(running) >= workers or exclusive:
+                        break
+                    if step.sid in started:
+                        continue
+                    if not all(dep in done for dep in graph[step.sid]):
+                        continue
+                    cost = min(max(step.cost, 0), slots)
+                    if cost > free:
+                        continue
+                    if self._is_exclusive_step(step):
+                        if running:
+                            continue
+                        exclusive = True
+                    free -= cost
+                    started.add(step.sid)
+                    future = pool.submit(self._execute_timed_step, step, project_context)
+                    running[future] = (step, cost)
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step, cost = running.pop(future)
+                    free += cost
+                    exclusive = False
+                    try:
+                        if future.result() is not None:
+                            done.add(step.sid)
+                    except Exception as e:
+                        exp_logger.error("Step %s failed: %s" % (step.name, e))
+                        if error is None:
+                            error = e
+        if error is not None:
+            raise error
+        for step in steps:
+            if step.sid not in started:
+                exp_logger.warning("Step %s wasn't executed because of unfinished dependencies" % step.name)
+        return self.get_critical_path()
+
+    def _is_exclusive_step(self, step):
+        """ Check that step can't run together with other steps, see execute_dag()."""
+        return self.step_cache is not None and step.cache and not step.outputs
+
+    def _execute_timed_step(self, step, project_context):
+        start = time.time()
+        try:
+            return self._execute_step(step, project_context=project_context)
+        finally:
+            self.step_timings[step.sid] = time.time() - start
+
+    def get_critical_path(self):
+        """ Return the longest by elapsed time chain of dependent steps
+        from the last execute_dag() call.
+        :return: {"steps": [step names], "elapsed": seconds, "timings": {step name: seconds}}
+        """
+        graph = self._steps_graph
+        finish = {}
+        previous = {}
+        for sid in self._sort_steps_graph(graph):
+            elapsed = self.step_timings.get(sid, 0.0)
+            previous[sid] = None
+            finish[sid] = elapsed
+            for dep in graph[sid]:
+                if finish[dep] + elapsed > finish[sid]:
+                    finish[sid] = finish[dep] + elapsed
+                    previous[sid] = dep
+        result = {
+            "steps": [],
+            "elapsed": 0.0,
+            "timings": dict((str(self.sid2step[sid]), t) for sid, t in self.step_timings.items()),
+        }
+        if not finish:
+            return result
+        sid = max(finish, key=lambda x: finish[x])
+        result["elapsed"] = finish[sid]
+        while sid is not None:
+            result["steps"].insert(0, str(self.sid2step[sid]))
+            sid = previous[sid]
+        return result
+
+    def execute_parallel(self, start_sid=0, end_sid=None, project_context=None, threads=1, pids=None):
         """
         Run experiments on different datasets in parallel.
-        :param start_sid:
-        :param end_sid:
-        :param project_context:
-        :param threads:
+        Each worker process builds its own manager and experiment,
+        added steps are rebuilt by name from available steps.
+        :param start_sid: start step sid
+        :param end_sid: end step sid
+        :param project_context: project context dictionary
+        :param threads: number of worker processes
+        :param pids: list of project pids, default is the current project
+        :return: {"finished": {pid: status}, "failed": {pid: error}}
         """
-        raise NotImplemented
-    
+        if self.manager is None:
+            raise Exception("Parallel execution requires a project manager")
+        if pids is None:
+            pids = [self.pid]
+        steps = [step.name for step in self.get_all_steps()]
+        jobs = []
+        for pid in pids:
+            jobs.append(create_project_job(pid,
+                                           steps,
+                                           self.__class__,
+                                           self.manager.settings_class.__class__,
+                                           self.manager.__class__,
+                                           config_path=self.manager.config_path,
+                                           exp_name=self.name,
+                                           force=self.force,
+                                           project_context=project_context,
+                                           start_sid=start_sid,
+                                           end_sid=end_sid))
+        return execute_projects(jobs, threads=threads)
+
     ### Steps checking section ### 
 
     def check_step(self, step, exe_result):
@@ -577,10 +1017,10 @@ class AbstractExperiment(object):
             'step_name': step_name,
             'status':status,
         }
-        self._send_to_server(url, data)
+        self._send_to_server(url, data, key=("status", pid, step_name))
         
     def logger_update_project(self, pid, project):
-        """
+        """ Save project with step statuses and send it to server.
         """
         if self.manager:
             self.manager.save(pid, project)
@@ -592,7 +1032,7 @@ class AbstractExperiment(object):
         data = {
             'project': project,
         }
-        self._send_to_server(url, data)
+        self._send_to_server(url, data, key=("project", pid))
 
     def logger_send_project(self, pid, project):
         """ Send project to server.
@@ -608,7 +1048,7 @@ class AbstractExperiment(object):
         data = {
             'project': project,
         }
-        self._send_to_server(url, data)
+        self._send_to_server(url, data, key=("project", pid))
 
     def check_and_upload_project(self):
         """
@@ -624,31 +1064,116 @@ class AbstractExperiment(object):
         self.logger_update_project(self.project["pid"], self.project)
 
     def upload_to_server(self, url, data):
-        """
+        """ Send data to server immediately, waiting for response.
         :param url: server url
         :param data: data to send
         """
         self._send_to_server(url, data, force=True)
 
-    def _send_to_server(self, url, data, force=False):
-        """
+    def _send_to_server(self, url, data, force=False, key=None):
+        """ Queue data for background sending with the shared reporter (see reporter.py).
+        Pending data with the same key is replaced with the newer one.
+        With force flag data is sent immediately.
+        Reporter settings can be set in config: server_batch_size, server_queue_size.
         """
         if not force and self.send_to_server is None:
             return
-        if not force and self._skip_server_part:
-            exp_logger.info("Server part is skipped!")
+        if force:
+            send_data(url, data)
             return
-        attempts = 0
-        data = urllib.urlencode(data)
-        while attempts < 3:
-            try:
-                exp_logger.info("Sending data to url %s..." % (url))
-                response = urllib.urlopen(url, data).read()
-                exp_logger.info("Failed sent to url %s with response: %s" % (url, response))
-                break
-            except Exception as e:
-                print(e)
-                time.sleep(3)
-                attempts += 1
-        if attempts == 3:
-            self._skip_server_part = True
\ No newline at end of file
+        config = {}
+        if self.settings and "config" in self.settings and self.settings["config"]:
+            config = self.settings["config"]
+        reporter = get_reporter(batch_size=config.get("server_batch_size", 1),
+                                max_queue=config.get("server_queue_size", 10000))
+        reporter.put(url, data, key=key)
+
+
+def create_project_job(pid, steps, exp_class, exp_settings_class, manager_class,
+                       config_path=None, exp_name="default", force=False,
+                       settings_context=None, project_context=None, path_replacing=None,
+                       start_sid=0, end_sid=None):
+    """ Create a picklable description of experiment execution for one project.
+    :param pid: project pid
+    :param steps: list of step names from available steps
+    :return: job dictionary for execute_projects
+    """
+    return {
+        'pid': pid,
+        'steps': list(steps),
+        'exp_class': exp_class,
+        'exp_settings_class': exp_settings_class,
+        'manager_class': manager_class,
+        'config_path': config_path,
+        'exp_name': exp_name,
+        'force': force,
+        'settings_context': settings_context,
+        'project_context': project_context,
+        'path_replacing': path_replacing,
+        'start_sid': start_sid,
+        'end_sid': end_sid,
+    }
+
+
+def _execute_project(job):
+    """ Build manager and experiment for one project and execute its steps.
+    Exceptions are returned instead of raising, so a failed project doesn't stop others.
+    Queued server data is flushed at the end, because pool workers exit without atexit handlers.
+    :param job: job dictionary from create_project_job
+    :return: (pid, project status, error traceback or None)
+    """
+    pid = job["pid"]
+    try:
+        experiment_settings = job["exp_settings_class"]()
+        if job["config_path"]:
+            manager = job["manager_class"](experiment_settings, config_path=job["config_path"])
+        else:
+            manager = job["manager_class"](experiment_settings)
+        project, settings = manager.get_project(pid,
+                                                settings_context=job["settings_context"],
+                                                project_context=job["project_context"],
+                                                path_replacing=job["path_replacing"])
+        exp = job["exp_class"](settings, project, name=job["exp_name"], manager=manager, force=job["force"])
+        for name in job["steps"]:
+            step_dict = exp.find_step(name)
+            if step_dict is None:
+                raise Exception("Unknown step name: %s" % name)
+            exp.add_step(exp.build_step(step_dict, manager=manager, pid=pid))
+        exp.execute(start_sid=job["start_sid"], end_sid=job["end_sid"], project_context=job["project_context"])
+        return pid, exp.project.get("status", {}), None
+    except Exception:
+        return pid, None, traceback.format_exc()
+    finally:
+        flush_reporter()
+
+
+def execute_projects(jobs, threads=1):
+    """ Execute project jobs in a pool of worker processes.
+    :param jobs: list of job dictionaries from create_project_job
+    :param threads: number of worker processes, with 1 jobs are executed in the current process
+    :return: {"finished": {pid: status}, "failed": {pid: error}}
+    """
+    result = {
+        "finished": {},
+        "failed": {},
+    }
+    n = len(jobs)
+    pool = None
+    if threads > 1 and n > 1:
+        pool = multiprocessing.Pool(processes=min(threads, n))
+        outputs = pool.imap_unordered(_execute_project, jobs)
+    else:
+        outputs = (_execute_project(job) for job in jobs)
+    try:
+        for i, (pid, status, error) in enumerate(outputs):
+            if error is None:
+                result["finished"][pid] = status
+                exp_logger.info("Project %s finished (%s/%s)" % (pid, i + 1, n))
+            else:
+                result["failed"][pid] = error
+                exp_logger.error("Project %s failed (%s/%s): %s" % (pid, i + 1, n, error))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return result
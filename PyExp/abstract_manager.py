@@ -7,10 +7,10 @@
 ''' Code related to ProjectManager.
 '''
 import os
-try:
-    import yaml
-except:
-    print("Install pyyaml module")
+import copy
+from PyExp.yaml_codec import yaml_load
+from PyExp.project_store import YamlProjectStore
+from PyExp.project_store import SQLiteProjectStore
 import platform
 try:
     from logbook import Logger
@@ -28,39 +28,88 @@ class ProjectManagerException(Exception):
         return repr(self.value)
 
 
+# parsed configs by file path, see ProjectManager.load_config()
+_configs = {}
+# folders which were checked or created in this process
+_checked_folders = set()
+# shared sqlite stores by database path
+_sqlite_stores = {}
+manager_logger = Logger('Manager logger')
+
+
 class ProjectManager(object):
     """ Class for controlling project's settings.
     A project is a collection of setting 
     for some data transformation.
     Each project is yaml file with settings. 
     Project PID is a yaml file name.
+    Projects are kept with a store (see project_store.py), 
+    by default it is YamlProjectStore with projects_folder,
+    if projects_db is set in config then SQLiteProjectStore is used.
     """
 
     config_path = None
 
-    def __init__(self, settings_class, config_path=None):
+    def __init__(self, settings_class, config_path=None, store=None):
         """ Init projects_folder. 
         Manager loads settings from default location in PySatDNA root or from given config_path.
         Then create work and projects folders if they were not found.
         And set config values for settings class.
+        Projects store can be given explicitly with store argument.
+        Config file is parsed only once per process and each manager
+        gets its own copy of parsed config, see reload_config().
         """
-        self.manager_logger = Logger('Manager logger')
+        self.manager_logger = manager_logger
         if config_path:
-            self.load_config(config_path)
-        else:
-            self.load_config(self.config_path)
+            self.config_path = config_path
+        self.settings_class = settings_class
+        self.force_folder_creation = False
+        self.load_config(self.config_path)
+        self._set_config(store)
+
+    def _set_config(self, store=None):
+        """ Set folders, settings config and store according to self.config."""
         self.projects_folder = self.config["projects_folder"]
         self.work_folder = self.config["path_work_folder"]
-        self.settings_class = settings_class
         self.settings_class.config = self.config
-        self.force_folder_creation = False
-        if self.projects_folder and not os.path.isdir(self.projects_folder):
-            os.makedirs(self.projects_folder)
-        if self.work_folder and not os.path.isdir(self.work_folder):
-            os.makedirs(self.work_folder)
+        self._check_folder(self.projects_folder)
+        self._check_folder(self.work_folder)
+        if store is None:
+            store = self.create_store()
+        self.store = store
+
+    def _check_folder(self, folder):
+        """ Create folder if it doesn't exist, each folder is checked once per process."""
+        if not folder or folder in _checked_folders:
+            return
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        _checked_folders.add(folder)
+
+    def create_store(self):
+        """ Create projects store according to config.
+        SQLite stores are shared by managers with the same database."""
+        db_path = self.config.get("projects_db")
+        if db_path:
+            if not db_path in _sqlite_stores:
+                _sqlite_stores[db_path] = SQLiteProjectStore(db_path)
+            return _sqlite_stores[db_path]
+        return YamlProjectStore(self.projects_folder)
+
+    def reload_config(self):
+        """ Parse config file again and update this manager.
+        Managers created later get the new config too.
+        """
+        _configs.pop(self.config_file, None)
+        _checked_folders.clear()
+        self.load_config(self.config_path)
+        self._set_config()
 
     def load_config(self, config_path):
-        ''' Load OS-specific configs.'''
+        ''' Load OS-specific configs.
+        Parsed config is reused if the same config file was already loaded in the process,
+        self.config is a copy of it, so changes of self.config don't affect other managers.
+        '''
         if config_path:
             file_path = config_path
             if not os.path.isfile(file_path):
@@ -77,17 +126,23 @@ class ProjectManager(object):
                 file_path = os.path.expanduser("~/Dropbox/workspace/PySatDNA/config.yaml")
                 if not os.path.isfile(file_path):
                     file_path = os.path.expanduser("~/Dropbox/PySatDNA/config.dobi.yaml")
+        self.config_file = file_path
+        if file_path in _configs:
+            self.config = copy.deepcopy(_configs[file_path])
+            return
         try:
             with open(file_path) as fh:
-                self.config = yaml.load(fh)
+                config = yaml_load(fh)
         except Exception as e:
             self.manager_logger.error("ERROR with open config file: %s" % file_path)
             self.manager_logger.warning("Loading default settings")
-            self.config = {
+            config = {
                 'path_work_folder': 'data',
                 'path_workspace_folder': '../..',
                 'projects_folder': 'projects',
             }
+        _configs[file_path] = config
+        self.config = copy.deepcopy(config)
             
     def add_project(self, pid, project_data, init=False, force=False, force_folder_creation=False):
         """ Add project to manager.
@@ -122,12 +177,17 @@ class ProjectManager(object):
 
     def _check_pid(self, pid):
         """ Check project existance."""
-        file_path = os.path.join(self.projects_folder, "%s.yaml" % pid)
-        if os.path.isfile(file_path):
+        if self.store.exists(pid):
             return True
-        self.manager_logger.error("Can't find %s" % file_path)
+        self.manager_logger.error("Can't find project %s" % pid)
         return False
 
+    def invalidate_cache(self, pid=None):
+        """ Remove project from the store cache.
+        Without pid all cached projects are removed.
+        """
+        self.store.invalidate_cache(pid)
+
     def _init_project(self, project_data):
         """ Add initial data to project data dictionary."""
         return project_data
@@ -150,7 +210,7 @@ class ProjectManager(object):
         Subdict's won't be overwritten but also updated.
         From http://stackoverflow.com/a/8310229/385489
         """
-        for key, value in original.iteritems(): 
+        for key, value in original.items():
             if not key in update:
                 update[key] = value
             elif isinstance(value, dict):
@@ -158,19 +218,31 @@ class ProjectManager(object):
         return update
 
     def save(self, pid, project_data):
-        """ Save project data to yaml project file. 
+        """ Save project data to project store. 
         - load project
         - add absent fields from loaded project
         - save project
 
+        Stores with shared_data keep saved data, so they get a copy.
         """
-        file_name = os.path.join(self.projects_folder, "%s.yaml" % pid)
-        if os.path.isfile(file_name):
-            with open(file_name, "r") as fh:
-                old_project_data = yaml.load(fh)
+        old_project_data = self.store.load(pid)
+        if old_project_data is not None:
             project_data = self._deepupdate(old_project_data, project_data)
-        with open(file_name, "w") as fh:
-            yaml.dump(project_data, fh, default_flow_style=False)
+        if self.store.shared_data:
+            project_data = copy.deepcopy(project_data)
+        self.store.save(pid, project_data)
+
+    def update_status(self, pid, step_name, status):
+        """ Update status of one step without rewriting the whole project
+        if the store supports it. Raise exception for unknown project."""
+        self.store.update_status(pid, step_name, status)
+
+    def get_pids_by_status(self, step_name, value, negate=False):
+        """ Get pids of projects with given step status.
+        With negate flag get projects with other or absent status,
+        e.g. manager.get_pids_by_status("step", "ok", negate=True).
+        """
+        return self.store.get_pids_by_status(step_name, value, negate=negate)
 
     def recheck_folders_and_params(self, pid, project, project_data=None):
         if not project_data:
@@ -185,11 +257,12 @@ class ProjectManager(object):
     def get_project(self, pid, settings_context=None, project_context=None, path_replacing=None):
         """ Get project data by pid. You can change settings and project fields according to given contexts.
         """
-        if not self._check_pid(pid):
+        project_data = self.store.load(pid)
+        if project_data is None:
+            self.manager_logger.error("Can't find project %s" % pid)
             raise ProjectManagerException("PID (%s) doesn't exists." % pid)
-        file_path = os.path.join(self.projects_folder, "%s.yaml" % pid)
-        with open(file_path, "r") as fh:
-            project_data = yaml.load(fh)
+        if self.store.shared_data:
+            project_data = copy.deepcopy(project_data)
         if path_replacing:
             path_from = path_replacing[1]
             path_to = path_replacing[2]
@@ -224,11 +297,12 @@ class ProjectManager(object):
         return data
 
     def get_all_projects(self):
-        """ Get a list of avaliable projects."""
-        result = []
-        for root, dirs, files in os.walk(self.projects_folder, topdown=False):
-            result.extend(files)
-        return list(set(result))
+        """ Get a list of avaliable project file names."""
+        return self.store.get_all_projects()
+
+    def get_all_pids(self):
+        """ Get a list of avaliable project pids."""
+        return self.store.get_all_pids()
 
     @staticmethod
     def get_id_by_pid(pid, dataset_dict):
@@ -243,5 +317,4 @@ class ProjectManager(object):
         """ Remove project."""
         if not self._check_pid(pid):
             raise ProjectManagerException("PID (%s) doesn't exists." % pid)
-        file_path = os.path.join(self.projects_folder, "%s.yaml" % pid)
-        os.remove(file_path)
+        self.store.remove(pid)
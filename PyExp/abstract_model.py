@@ -5,14 +5,205 @@
 #@author: Aleksey Komissarov
 #@contact: ad3002@gmail.com 
 
+import keyword
+from PyExp.mongo_pool import get_mongo_client
+from PyExp.mongo_pool import iter_batches
+from PyExp.mongo_pool import insert_batch
+from PyExp.mongo_pool import mongo_upsert_many as _mongo_upsert_many
 try:
     import simplejson
 except:
     print("Install simplejson module")
 
 
+def _is_identifier(name):
+    return isinstance(name, str) and name.isidentifier() and not keyword.iskeyword(name)
 
-class AbstractModel(object):
+
+# attribute lists used by generated methods and converters
+_TYPED_ATTRIBUTES = ("dumpable_attributes", "int_attributes", "float_attributes", "list_attributes")
+
+
+def _list_converter(cls, key):
+    """ Return converter of comma separated string to typed list."""
+    def convert(value):
+        item_type = cls.list_attributes_types[key]
+        return [item_type(x) for x in value.split(",")]
+    return convert
+
+
+def _has_own_typed_attributes(model):
+    """ Check that model instance has own typed attribute lists (e.g. set in __init__).
+    Lists are compared with class lists by identity, so instance dictionary isn't used."""
+    cls = type(model)
+    for name in _TYPED_ATTRIBUTES:
+        if getattr(model, name) is not getattr(cls, name):
+            return True
+    return False
+
+
+def _get_converters(obj):
+    """ Return field converters for typed attribute lists of model class or instance."""
+    converters = {}
+    for key in obj.list_attributes:
+        converters[key] = _list_converter(obj, key)
+    for key in obj.float_attributes:
+        converters[key] = float
+    for key in obj.int_attributes:
+        converters[key] = int
+    return converters
+
+
+class ModelMeta(type):
+    """ Metaclass of AbstractModel.
+
+    For each model class it precomputes converters of fields
+    (int, float, list or None) from typed attribute lists,
+    and generates specialized set_with_list() and __str__() methods
+    without per-field list scans and getattr/setattr calls,
+    if they weren't redefined in the model.
+
+    With use_slots = True in the class __slots__ are generated for all model
+    attributes, so instances don't have per-instance dictionary
+    if base classes don't have it. See also compile_model().
+
+    Assigning a new typed attribute list to the class (Model.int_attributes = [...])
+    compiles it and its subclasses again, call Model.compile() if lists were changed in place.
+    Generated methods fall back to the generic ones for instances with own
+    typed attribute lists (e.g. set in __init__), they are found by comparing
+    instance lists with class lists by identity.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        if namespace.get("use_slots", any(getattr(base, "use_slots", False) for base in bases)):
+            if not "__slots__" in namespace:
+                namespace["__slots__"] = mcs._get_slots(name, bases, namespace)
+        cls = type.__new__(mcs, name, bases, namespace)
+        cls.compile()
+        return cls
+
+    def __setattr__(cls, name, value):
+        changed = name in _TYPED_ATTRIBUTES and getattr(cls, name, None) is not value
+        type.__setattr__(cls, name, value)
+        if changed:
+            cls._compile_with_subclasses(name)
+
+    def _compile_with_subclasses(cls, name):
+        """ Compile class and subclasses which inherit attribute name from it."""
+        cls.compile()
+        for subclass in cls.__subclasses__():
+            if not name in subclass.__dict__:
+                subclass._compile_with_subclasses(name)
+
+    @staticmethod
+    def _get_slots(name, bases, namespace):
+        def lookup(attr):
+            if attr in namespace:
+                return namespace[attr]
+            for base in bases:
+                if hasattr(base, attr):
+                    return getattr(base, attr)
+            return []
+        slotted = set()
+        for base in bases:
+            for klass in base.__mro__:
+                slotted.update(klass.__dict__.get("__slots__", ()))
+        slots = []
+        for attrs in ("dumpable_attributes", "int_attributes", "float_attributes",
+                      "list_attributes", "other_attributes", "alt_dumpable_attributes"):
+            for attr in lookup(attrs):
+                if not _is_identifier(attr) or attr in slots or attr in slotted or attr in namespace:
+                    continue
+                slots.append(attr)
+        return tuple(slots)
+
+    def compile(cls):
+        """ Precompute field converters and generate specialized methods."""
+        cls._converters = _get_converters(cls)
+        for method_name, generator in (("set_with_list", cls._generate_set_with_list),
+                                       ("__str__", cls._generate_str)):
+            if method_name in cls.__dict__ and not getattr(cls.__dict__[method_name], "_model_default", False):
+                continue
+            inherited = getattr(cls, method_name, None)
+            if method_name not in cls.__dict__ and not getattr(inherited, "_model_default", False):
+                continue
+            method = generator()
+            if method is not None:
+                method._model_default = True
+                setattr(cls, method_name, method)
+
+    def _get_field_code(cls, key, value, context):
+        """ Return expression converting string value for key."""
+        converter = cls._converters.get(key)
+        if converter is None:
+            return value
+        if converter is int:
+            return "int(%s)" % value
+        if converter is float:
+            return "float(%s)" % value
+        name = "_convert_%s" % len(context)
+        context[name] = converter
+        return "%s(%s)" % (name, value)
+
+    def _generate_set_with_list(cls):
+        """ Generate set_with_list() for fields in dumpable_attributes."""
+        generic = _generic_methods.get("set_with_list")
+        fields = list(cls.dumpable_attributes)
+        if generic is None or not all(_is_identifier(key) for key in fields):
+            return None
+        context = {"_generic": generic}
+        lines = ["def set_with_list(self, data):",
+                 "    if len(data) != %s or %s:" % (len(fields), cls._get_override_check(context)),
+                 "        return _generic(self, data)"]
+        for i, key in enumerate(fields):
+            lines.append("    value = data[%s]" % i)
+            lines.append("    self.%s = None if value == 'None' else %s" % (key, cls._get_field_code(key, "value", context)))
+        lines.append("    return None")
+        exec(compile("\n".join(lines), "<%s.set_with_list>" % cls.__name__, "exec"), context)
+        method = context["set_with_list"]
+        method.__doc__ = generic.__doc__
+        return method
+
+    def _get_override_check(cls, context):
+        """ Return expression checking that instance has own typed attribute lists,
+        class lists are added to context."""
+        checks = []
+        for name in _TYPED_ATTRIBUTES:
+            context["_%s" % name] = getattr(cls, name)
+            checks.append("self.%s is not _%s" % (name, name))
+        return " or ".join(checks)
+
+    def _generate_str(cls):
+        """ Generate __str__() for fields in dumpable_attributes."""
+        fields = list(cls.dumpable_attributes)
+        if not all(_is_identifier(key) for key in fields):
+            return None
+        context = {"_generic": _generic_methods["__str__"]}
+        lines = ["def __str__(self):",
+                 "    if %s:" % cls._get_override_check(context),
+                 "        return _generic(self)",
+                 "    self.preprocess_data()"]
+        values = []
+        for i, key in enumerate(fields):
+            if key in cls.list_attributes:
+                lines.append("    value_%s = self.%s" % (i, key))
+                lines.append("    if value_%s is None:" % i)
+                lines.append("        value_%s = []" % i)
+                values.append('",".join([str(x) for x in value_%s]).strip()' % i)
+            else:
+                values.append("str(self.%s).strip()" % key)
+        lines.append('    return "%%s\\n" %% "\\t".join([%s])' % ", ".join(values))
+        exec(compile("\n".join(lines), "<%s.__str__>" % cls.__name__, "exec"), context)
+        method = context["__str__"]
+        method.__doc__ = _generic_methods["__str__"].__doc__
+        return method
+
+
+# generic implementations of AbstractModel methods used as fallback
+_generic_methods = {}
+
+
+class AbstractModel(object, metaclass=ModelMeta):
     """ Сlass for data wrapping.
         
     
@@ -32,15 +223,19 @@ class AbstractModel(object):
     - list_attributes
     - list_attributes_types
     - other_attributes
+    - use_slots, generate __slots__ for attributes, see ModelMeta
 
     """
 
+    __slots__ = ()
+
     dumpable_attributes = []
     int_attributes = []
     float_attributes = []
     list_attributes = []
     list_attributes_types = {}
     other_attributes = {}
+    use_slots = False
 
     def __init__(self):
         ''' Create attributes accordong to
@@ -106,21 +301,17 @@ class AbstractModel(object):
 
     def set_with_dict(self, dictionary):
         """ Set object with dictionaty."""
+        converters = self._get_converters()
         for key, value in dictionary.items():
             key, value = self.preprocess_pair(key, value)
             try:
                 if value == "None" or value is None:
                     value = None
-                elif key in self.int_attributes:
-                    value = int(value)
-                elif key in self.float_attributes:
-                    value = float(value)
-                elif key in self.list_attributes:
-                    if not value:
-                        value = []
+                elif key in converters:
+                    converter = converters[key]
+                    if not converter is int and not converter is float and not value:
                         continue
-                    value = value.split(",")
-                    value = [self.list_attributes_types[key](x) for x in value]
+                    value = converter(value)
                 setattr(self, key, value)
             except ValueError as e:
                 print(self.dumpable_attributes)
@@ -141,19 +332,21 @@ class AbstractModel(object):
             else:
                 print(data)
                 raise Exception("Wrong number of fields in data.")
+        converters = self._get_converters()
         for i, value in enumerate(data):
             key = dumpable_attributes[i]
             if value == "None":
                 value = None
-            elif key in self.int_attributes:
-                value = int(value)
-            elif key in self.float_attributes:
-                value = float(value)
-            elif key in self.list_attributes:
-                value = value.split(",")
-                value = [self.list_attributes_types[key](x) for x in value]
+            elif key in converters:
+                value = converters[key](value)
             setattr(self, key, value)
 
+    def _get_converters(self):
+        """ Return field converters of the class or of own typed attribute lists of the instance."""
+        if _has_own_typed_attributes(self):
+            return _get_converters(self)
+        return self._converters
+
     def as_dict(self):
         """
         """
@@ -193,25 +386,166 @@ class AbstractModel(object):
         return setattr(self, key, value)
 
 
-class AbstractMongoModel(object):
+for _method_name in ("set_with_list", "__str__"):
+    _generic_methods[_method_name] = AbstractModel.__dict__[_method_name]
+    AbstractModel.__dict__[_method_name]._model_default = True
 
-    mongo_key = lambda x: x
 
-    def __init__(self, mongo_db, mongo_collection):
-        mongo_db = ""
+def compile_model(model_class, name=None):
+    """ Return subclass of model_class with __slots__ for model attributes.
+    Instances have no per-instance dictionary only if model_class and its bases
+    have no dictionary too, i.e. they are slotted, otherwise the dictionary
+    is created only when other attributes are set.
+    Assign it to a module level variable with the same name to pickle instances.
+    """
+    return ModelMeta(name or model_class.__name__, (model_class,),
+                     {"use_slots": True, "__module__": model_class.__module__})
+
+
+class AbstractMongoModel(AbstractModel):
+    """ Model stored in MongoDB collection.
+
+    Class attributes (database and collection can be also set in constructor):
+
+    - mongo_uri and mongo_client_options, see get_mongo_client()
+    - mongo_db, a database name
+    - mongo_collection, a collection name
+    - mongo_key_attributes, attributes identifying model document for updates and upserts,
+      _id is used if they aren't set
+    - mongo_batch_size, a number of documents in bulk writes
+
+    >>> class Repeat(AbstractMongoModel):
+    ...     dumpable_attributes = ["name", "start"]
+    ...     int_attributes = ["start"]
+    ...     mongo_db = "trf"
+    ...     mongo_collection = "repeats"
+    ...     mongo_key_attributes = ["name"]
+    >>> Repeat.mongo_upsert_many(repeats)
+    """
+
+    mongo_uri = None
+    mongo_client_options = {}
+    mongo_db = None
+    mongo_collection = None
+    mongo_key_attributes = []
+    mongo_batch_size = 1000
+
+    def __init__(self, mongo_db=None, mongo_collection=None):
+        super(AbstractMongoModel, self).__init__()
+        if mongo_db is not None:
+            self.mongo_db = mongo_db
+        if mongo_collection is not None:
+            self.mongo_collection = mongo_collection
+
+    @classmethod
+    def get_mongo_collection(cls, mongo_db=None, mongo_collection=None):
+        """ Return collection from the shared client."""
+        mongo_db = mongo_db or cls.mongo_db
+        mongo_collection = mongo_collection or cls.mongo_collection
+        if not mongo_db or not mongo_collection:
+            raise Exception("Mongo database or collection isn't set for %s" % cls.__name__)
+        client = get_mongo_client(cls.mongo_uri, **cls.mongo_client_options)
+        return client[mongo_db][mongo_collection]
+
+    def _get_collection(self):
+        return self.get_mongo_collection(self.mongo_db, self.mongo_collection)
+
+    def mongo_key(self):
+        """ Return filter of model document."""
+        if self.mongo_key_attributes:
+            return dict((attr, getattr(self, attr)) for attr in self.mongo_key_attributes)
+        _id = getattr(self, "_id", None)
+        if _id is None:
+            raise Exception("Model has no _id and mongo_key_attributes aren't set")
+        return {"_id": _id}
+
+    def mongo_document(self):
+        """ Return model document."""
+        return self.as_dict()
+
+    def set_with_document(self, document):
+        """ Set object with document, values are already typed."""
+        for key, value in document.items():
+            setattr(self, key, value)
 
     def mongo_add(self):
-        pass
+        """ Insert model document, _id is saved in the model."""
+        self._id = self._get_collection().insert_one(self.mongo_document()).inserted_id
+        return self._id
 
     def mongo_get(self, id):
-        pass
+        """ Set model with document found by _id or filter dictionary.
+        :return: True if document was found
+        """
+        query = id if isinstance(id, dict) else {"_id": id}
+        document = self._get_collection().find_one(query)
+        if document is None:
+            return False
+        self.set_with_document(document)
+        return True
 
     def mongo_update(self):
-        pass
+        """ Replace model document found by mongo_key() or insert it.
+        :return: number of matched documents
+        """
+        result = self._get_collection().replace_one(self.mongo_key(), self.mongo_document(), upsert=True)
+        if result.upserted_id is not None:
+            self._id = result.upserted_id
+        return result.matched_count
 
     def mongo_remove(self):
-        pass
-
-    def mongo_update_fields(self):
-        pass
+        """ Remove model document found by mongo_key().
+        :return: number of removed documents
+        """
+        return self._get_collection().delete_one(self.mongo_key()).deleted_count
 
+    def mongo_update_fields(self, fields=None):
+        """ Set fields of model document found by mongo_key(), all dumpable attributes by default.
+        :return: number of modified documents
+        """
+        document = self.mongo_document()
+        if fields is not None:
+            document = dict((field, getattr(self, field)) for field in fields)
+        return self._get_collection().update_one(self.mongo_key(), {"$set": document}).modified_count
+
+    @classmethod
+    def mongo_insert_many(cls, models, batch_size=None, ordered=False, collection=None):
+        """ Insert models by batches with unordered insert_many() by default.
+        _id is saved in inserted models.
+        :return: {"inserted": n, "failed": n}
+        """
+        if collection is None:
+            collection = cls.get_mongo_collection()
+        report = {"inserted": 0, "failed": 0}
+        for batch in iter_batches(models, batch_size or cls.mongo_batch_size):
+            documents = [model.mongo_document() for model in batch]
+            not_inserted, n_failed = insert_batch(collection, documents, ordered=ordered)
+            report["inserted"] += len(documents) - len(not_inserted)
+            report["failed"] += n_failed
+            not_inserted = set(not_inserted)
+            for i, (model, document) in enumerate(zip(batch, documents)):
+                if i not in not_inserted and "_id" in document:
+                    model._id = document["_id"]
+            if ordered and n_failed:
+                break
+        return report
+
+    @classmethod
+    def mongo_upsert_many(cls, models, batch_size=None, ordered=False, collection=None):
+        """ Replace or insert models by mongo_key() by batches with unordered bulk_write() by default.
+        :return: {"matched": n, "modified": n, "upserted": n, "failed": n}
+        """
+        if collection is None:
+            collection = cls.get_mongo_collection()
+        pairs = ((model.mongo_key(), model.mongo_document()) for model in models)
+        return _mongo_upsert_many(collection, pairs, batch_size=batch_size or cls.mongo_batch_size, ordered=ordered)
+
+    @classmethod
+    def mongo_find(cls, query=None, batch_size=None, collection=None):
+        """ Yield models for documents matching query."""
+        if collection is None:
+            collection = cls.get_mongo_collection()
+        for document in collection.find(query or {}, batch_size=batch_size or cls.mongo_batch_size):
+            model = cls()
+            model.set_with_document(document)
+            yield model
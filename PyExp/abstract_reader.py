@@ -8,7 +8,10 @@
     Classes:
     
     - WiseOpener(object)
+    - MappedFile(object)
+    - LazyData(object)
     - AbstractFileIO(object)
+    - FolderSnapshot(object)
     - AbstractFolderIO(object)
     - AbstractFoldersIO(object)
     
@@ -17,23 +20,141 @@
     - sc_iter_filepath_folder(folder, mask=".")
     - sc_iter_filename_folder(folder, mask=".")
     - sc_iter_filedata_folder(folder, mask=".")
-    - sc_move_files(folder, dist_folder, mask=".")
+    - sc_move_files(folder, dist_folder, mask=".", workers=1, skip_identical=False)
+    - sc_copy_files(folder, dist_folder, mask=".", workers=1, skip_identical=False)
+
+    Functions:
+
+    - get_compression(file_name, sniff=True) -> "gz", "bz2", "xz", "zst", "lz4" or None
+    - external_sort(items, sort_func, reverse=False, max_memory=..., temp_folder=None) ~> item
+    - get_line_chunks(file_name, chunksize) -> [(start, end),]
+    - write_atomic(file_name, text)
+    - copy_file(source, target)
 
 """
 import os
 import re
+import errno
 import pickle
 import shutil
 import gzip
 import bz2
+import lzma
+import signal
+import subprocess
+import io
+import mmap
+import time
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import itertools
+import tempfile
+import collections
+import multiprocessing
 from PyExp import exp_logger
+from PyExp.mongo_pool import mongo_insert_many
+
+
+# compression formats by file suffix
+COMPRESSION_SUFFIXES = [
+    (".gz", "gz"),
+    (".bgz", "gz"),
+    (".bz2", "bz2"),
+    (".xz", "xz"),
+    (".zst", "zst"),
+    (".lz4", "lz4"),
+]
+# compression formats by first bytes of file
+COMPRESSION_MAGICS = [
+    (b"\x1f\x8b", "gz"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zst"),
+    (b"\x04\x22\x4d\x18", "lz4"),
+]
+# external (multithreaded) compressors
+COMPRESSION_TOOLS = {
+    "gz": "pigz",
+    "bz2": "pbzip2",
+    "xz": "xz",
+    "zst": "zstd",
+    "lz4": "lz4",
+}
+
+# python modules for compression formats
+COMPRESSION_MODULES = {
+    "gz": "gzip",
+    "bz2": "bz2",
+    "xz": "lzma",
+    "zst": "zstandard",
+    "lz4": "lz4.frame",
+}
+
+_tools_paths = {}
+_modules = {}
+
+
+def _which(tool):
+    """ Return path to external tool or None, result is cached."""
+    if not tool in _tools_paths:
+        _tools_paths[tool] = shutil.which(tool)
+    return _tools_paths[tool]
+
+
+def _has_module(compression):
+    """ Check that python module for compression format can be imported."""
+    if not compression in _modules:
+        try:
+            __import__(COMPRESSION_MODULES[compression])
+            _modules[compression] = True
+        except ImportError:
+            _modules[compression] = False
+    return _modules[compression]
+
+
+def get_compression(file_name, sniff=True):
+    """ Return compression format of file ("gz", "bz2", "xz", "zst", "lz4") or None.
+    For existing files format is detected by magic bytes, otherwise by suffix.
+    """
+    if sniff and os.path.isfile(file_name):
+        with open(file_name, "rb") as fh:
+            head = fh.read(6)
+        for magic, compression in COMPRESSION_MAGICS:
+            if head.startswith(magic):
+                if compression == "bz2" and not head[3:4].isdigit():
+                    continue
+                return compression
+        if head:
+            return None
+    for suffix, compression in COMPRESSION_SUFFIXES:
+        if file_name.endswith(suffix):
+            return compression
+    return None
 
 
 class WiseOpener(object):
-    """ Opener to open usual files and gzip or bzip archives.
-    """ 
+    """ Opener to open usual files and gzip, bzip2, xz, zstd or lz4 archives.
+    Archive format is detected by magic bytes for existing files or by suffix.
+    Archives are always opened in binary mode.
+
+    If an external compressor (pigz, pbzip2, xz, zstd, lz4) is available it is used
+    through a pipe for writing and for reading files larger than external_min_size,
+    otherwise gzip, bz2, lzma, zstandard or lz4 modules are used.
+
+    :param level: compression level for writing
+    :param threads: number of compression threads for pigz, pbzip2, xz and zstd
+
+    >>> with WiseOpener("reads.fastq.zst", "w", level=3, threads=8) as fh:
+    ...     fh.write(data)
+    """
+
+    use_external = True
+    external_min_size = 1024 ** 2
       
-    def __init__(self, file_name, mode=None):
+    def __init__(self, file_name, mode=None, level=None, threads=None):
         self.file_name = file_name
         if not mode:
             mode = "r"
@@ -41,29 +162,396 @@ class WiseOpener(object):
             exp_logger.error("Wrong file mode: %s" % mode)
             raise Exception("Wrong file mode: %s" % mode)
         self.mode = mode
+        self.level = level
+        self.threads = threads
         self.fh = None
+        self.process = None
+        self._output = None
     
     def __enter__(self):
-        if self.file_name.endswith(".gz"):
-            exp_logger.info("Open as gz archive")
-            if not "b" in self.mode:
-                self.mode += "b"
-            self.fh = gzip.open(self.file_name, self.mode)
-        elif self.file_name.endswith(".bz2"):
-            exp_logger.info("Open as bz2 archive")
-            if not "b" in self.mode:
-                self.mode += "b"
-            self.fh = bz2.BZ2File(self.file_name, self.mode)
-        else:
+        compression = get_compression(self.file_name, sniff="r" in self.mode)
+        if compression is None:
             self.fh = open(self.file_name, self.mode)
+            return self.fh
+        exp_logger.info("Open as %s archive" % compression)
+        if not "b" in self.mode:
+            self.mode += "b"
+        if self._use_external(compression):
+            self.fh = self._open_external(compression)
+        else:
+            self.fh = self._open_module(compression)
         return self.fh
 
+    def _use_external(self, compression):
+        if not self.use_external or not _which(COMPRESSION_TOOLS[compression]):
+            return False
+        if "r" in self.mode and _has_module(compression):
+            return os.path.getsize(self.file_name) >= self.external_min_size
+        return True
+
+    def _open_external(self, compression):
+        """ Open pipe to external compressor."""
+        tool = COMPRESSION_TOOLS[compression]
+        command = [_which(tool), "-c"]
+        if compression in ("zst", "lz4"):
+            command.append("-q")
+        if self.threads:
+            if compression == "gz":
+                command += ["-p", str(self.threads)]
+            elif compression == "bz2":
+                command.append("-p%s" % self.threads)
+            elif compression in ("xz", "zst"):
+                command.append("-T%s" % self.threads)
+        if "r" in self.mode:
+            command += ["-d", self.file_name]
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE)
+            return self.process.stdout
+        if self.level is not None:
+            command.append("-%s" % self.level)
+        self._output = open(self.file_name, self.mode)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self._output)
+        return self.process.stdin
+
+    def _open_module(self, compression):
+        """ Open archive with python module."""
+        if compression == "gz":
+            return gzip.open(self.file_name, self.mode, compresslevel=9 if self.level is None else self.level)
+        if compression == "bz2":
+            return bz2.BZ2File(self.file_name, self.mode, compresslevel=9 if self.level is None else self.level)
+        if compression == "xz":
+            if "r" in self.mode or self.level is None:
+                return lzma.open(self.file_name, self.mode)
+            return lzma.open(self.file_name, self.mode, preset=self.level)
+        if compression == "zst":
+            try:
+                import zstandard
+            except ImportError:
+                raise Exception("Install zstd tool or zstandard module to open %s" % self.file_name)
+            if "r" in self.mode:
+                return zstandard.open(self.file_name, self.mode)
+            cctx = zstandard.ZstdCompressor(level=3 if self.level is None else self.level,
+                                            threads=self.threads or 0)
+            return zstandard.open(self.file_name, self.mode, cctx=cctx)
+        if compression == "lz4":
+            try:
+                import lz4.frame
+            except ImportError:
+                raise Exception("Install lz4 tool or lz4 module to open %s" % self.file_name)
+            if "r" in self.mode or self.level is None:
+                return lz4.frame.open(self.file_name, self.mode)
+            return lz4.frame.open(self.file_name, self.mode, compression_level=self.level)
+        raise Exception("Unknown compression: %s" % compression)
+
+    def __exit__(self, *args):
+        self.fh.close()
+        if self.process is None:
+            return
+        returncode = self.process.wait()
+        if self._output is not None:
+            self._output.close()
+        # reading can be stopped before the end of file
+        if returncode == -signal.SIGPIPE and "r" in self.mode:
+            return
+        if returncode:
+            raise Exception("%s failed with exit code %s for %s" % (self.process.args[0], returncode, self.file_name))
+
+
+class MappedFile(object):
+    """ Memory-mapped uncompressed file.
+    Lines and records are memoryview slices of the mapped file,
+    so data isn't copied and no string is created per line
+    until a slice is converted with bytes(view) or view.tobytes().
+    Slices can't be used after the file is closed.
+
+    >>> with MappedFile("reads.fasta") as mf:
+    ...     for record in mf.iter_records(b">"):
+    ...         n += record.tobytes().count(b"N")
+    ...     header = mf.line_at(offset)
+    """
+
+    def __init__(self, file_name):
+        if get_compression(file_name):
+            raise Exception("Can't map compressed file: %s" % file_name)
+        self.file_name = file_name
+        self.fh = None
+        self.mm = None
+        self.view = None
+        self.size = 0
+
+    def __enter__(self):
+        self.fh = open(self.file_name, "rb")
+        self.size = os.fstat(self.fh.fileno()).st_size
+        if self.size:
+            self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # empty file can't be mapped
+            self.mm = b""
+        self.view = memoryview(self.mm)
+        return self
+
     def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Unmap file. If slices are still referenced the map is closed by garbage collector."""
+        if self.view is not None:
+            try:
+                self.view.release()
+            except BufferError:
+                pass
+            self.view = None
+        if isinstance(self.mm, mmap.mmap):
+            try:
+                self.mm.close()
+            except BufferError:
+                pass
+        self.mm = None
         self.fh.close()
 
+    def __len__(self):
+        return self.size
+
+    def _advise_sequential(self):
+        if isinstance(self.mm, mmap.mmap) and hasattr(self.mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.mm.madvise(mmap.MADV_SEQUENTIAL)
+
+    def find(self, sub, start=0, end=None):
+        """ Return the lowest offset of sub or -1."""
+        return self.mm.find(sub, start, self.size if end is None else end)
+
+    def read_at(self, offset, size):
+        """ Return memoryview of size bytes from offset."""
+        return self.view[offset:offset + size]
+
+    def line_at(self, offset):
+        """ Return memoryview of line starting at offset including line end."""
+        end = self.mm.find(b"\n", offset, self.size)
+        if end == -1:
+            return self.view[offset:self.size]
+        return self.view[offset:end + 1]
+
+    def iter_lines(self, start=0, end=None):
+        """ Yield memoryview of each line including line end in [start, end) byte range."""
+        if end is None:
+            end = self.size
+        self._advise_sequential()
+        find = self.mm.find
+        view = self.view
+        position = start
+        while position < end:
+            line_end = find(b"\n", position, end)
+            if line_end == -1:
+                yield view[position:end]
+                break
+            yield view[position:line_end + 1]
+            position = line_end + 1
+
+    def iter_records(self, marker=b">", start=0, end=None):
+        """ Yield memoryview of each record starting with marker at line start,
+        e.g. b">" for fasta. Data before the first record is skipped.
+        """
+        if end is None:
+            end = self.size
+        self._advise_sequential()
+        find = self.mm.find
+        view = self.view
+        separator = b"\n" + marker
+        if self.mm[start:start + len(marker)] == marker:
+            position = start
+        else:
+            position = find(separator, start, end)
+            if position == -1:
+                return
+            position += 1
+        while position < end:
+            record_end = find(separator, position, end)
+            if record_end == -1:
+                yield view[position:end]
+                break
+            yield view[position:record_end + 1]
+            position = record_end + 1
+
+
+class LazyData(object):
+    """ Lazy data for AbstractFileIO in lazy mode.
+    It is a chain of sources and a pipeline of stages,
+    each stage is a function from iterator to iterator.
+    Nothing is read until data is iterated and
+    each iteration reads sources again.
+    Only re-iterable sources (lists, functions returning iterator) can be
+    read several times, an iterator source (e.g. generator) can be read once
+    and the second iteration raises exception.
+    """
+
+    def __init__(self, source=None, file_name=None):
+        self.sources = []
+        self.stages = []
+        self.file_name = file_name
+        self._consumed = set()
+        if source is not None:
+            self.add_source(source)
+
+    def add_source(self, source):
+        """ Add iterable or function returning iterator."""
+        self.sources.append(source)
+
+    def add_stage(self, stage):
+        """ Add function from iterator to iterator."""
+        self.stages.append(stage)
+
+    def __iter__(self):
+        for i, source in enumerate(self.sources):
+            if hasattr(source, "__call__") or iter(source) is not source:
+                continue
+            if i in self._consumed:
+                raise Exception("Lazy data source %s is an iterator and it was already read, "
+                                "use a list or a function returning iterator" % source)
+            self._consumed.add(i)
+        items = itertools.chain.from_iterable(
+            source() if hasattr(source, "__call__") else source for source in self.sources)
+        for stage in self.stages:
+            items = stage(items)
+        return iter(items)
+
+
+def _write_run(items, temp_folder, n):
+    """ Save items to gzipped pickle run file."""
+    run_file = os.path.join(temp_folder, "run_%s.gz" % n)
+    with WiseOpener(run_file, "wb", level=1) as fh:
+        for item in items:
+            pickle.dump(item, fh, pickle.HIGHEST_PROTOCOL)
+    return run_file
+
+
+def _read_run(run_file):
+    """ Yield items from run file."""
+    with WiseOpener(run_file, "rb") as fh:
+        while True:
+            try:
+                yield pickle.load(fh)
+            except EOFError:
+                break
+
+
+def _get_pickled_size(item):
+    """ Return length of pickled item."""
+    return len(pickle.dumps(item, pickle.HIGHEST_PROTOCOL))
+
+
+def external_sort(items, sort_func, reverse=False, max_memory=256 * 1024 ** 2, temp_folder=None, sizeof=None):
+    """ Sort items larger than memory.
+    Items are collected until their size reaches max_memory bytes,
+    each sorted chunk is saved to a temporary gzipped run file
+    and then runs are merged with heapq.merge.
+    Sorting is stable as list.sort().
+    :param temp_folder: folder for run files, default is system temporary folder
+    :param sizeof: function returning item size in bytes, default is length of pickled item
+    :return: generator of sorted items
+    """
+    assert hasattr(sort_func, "__call__")
+    if sizeof is None:
+        sizeof = _get_pickled_size
+    run_folder = tempfile.mkdtemp(prefix="pyexp_sort_", dir=temp_folder)
+    try:
+        run_files = []
+        chunk = []
+        size = 0
+        for item in items:
+            chunk.append(item)
+            size += sizeof(item)
+            if size >= max_memory:
+                chunk.sort(key=sort_func, reverse=reverse)
+                run_files.append(_write_run(chunk, run_folder, len(run_files)))
+                chunk = []
+                size = 0
+        chunk.sort(key=sort_func, reverse=reverse)
+        if not run_files:
+            for item in chunk:
+                yield item
+            return
+        if chunk:
+            run_files.append(_write_run(chunk, run_folder, len(run_files)))
+        chunk = None
+        exp_logger.info("Merging %s sorted runs" % len(run_files))
+        runs = [_read_run(run_file) for run_file in run_files]
+        for item in heapq.merge(*runs, key=sort_func, reverse=reverse):
+            yield item
+    finally:
+        shutil.rmtree(run_folder, ignore_errors=True)
+
+
+def get_line_chunks(file_name, chunksize):
+    """ Split file into byte ranges of about chunksize bytes aligned to line ends.
+    :return: list of (start, end) offsets
+    """
+    size = os.path.getsize(file_name)
+    offsets = [0]
+    with open(file_name, "rb") as fh:
+        position = chunksize
+        while position < size:
+            fh.seek(position)
+            fh.readline()
+            position = fh.tell()
+            if position >= size:
+                break
+            offsets.append(position)
+            position += chunksize
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets[:-1], offsets[1:]) if end > start]
+
+
+def _iter_chunks(items, chunksize):
+    """ Yield lists of chunksize items."""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunksize))
+        if not chunk:
+            break
+        yield chunk
+
+
+def _map_chunk(task):
+    cf, chunk, args = task
+    return [cf(item, **args) for item in chunk]
+
+
+def _map_file_range(task):
+    """ Apply cf to lines in byte range of file, lines are the same as with open(file_name)."""
+    file_name, start, end, cf, args = task
+    with open(file_name, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    return [cf(line, **args) for line in io.TextIOWrapper(io.BytesIO(data))]
+
+
+def _imap_ordered(func, tasks, workers, prefetch=2):
+    """ Yield func(task) results in tasks order computed in a pool of processes.
+    Only workers * prefetch tasks are submitted ahead, so tasks are consumed lazily.
+    """
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(func, (task,)))
+            if len(pending) >= workers * prefetch:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
 
 class AbstractFileIO(object):
     """ Abstract class for working with abstract data.
+
+    With lazy=True data isn't loaded into memory: read_from_file() and
+    read_as_iter() add sources, process(), process_with_iter(),
+    filter_with_iter() and sort() add stages to generator pipeline, and
+    data is read only by write_to_file(), do(), iterate(), do_with_iter() or N.
+    Except in-memory sort(), memory usage doesn't depend on data size.
     
     Public properties:
     
@@ -84,18 +572,32 @@ class AbstractFileIO(object):
     - clear(self)
     - do_with_iter(self, cf, **args) -> [result,]
     - process_with_iter(self, cf, **args)
+    - filter_with_iter(self, cf, **args)
+
+    >>> reader = AbstractFileIO(lazy=True)
+    >>> reader.read_from_file("big.tsv.gz")
+    >>> reader.filter_with_iter(lambda line: not line.startswith(b"#"))
+    >>> reader.process_with_iter(lambda line: line.upper())
+    >>> reader.write_to_file("big.upper.tsv.gz")
     """
 
     
-    def __init__(self):
-        """ Do nothing."""
+    def __init__(self, lazy=False):
+        """ Init empty data.
+        :param lazy: use generator pipeline instead of list
+        """
         self._data = None
+        self.lazy = lazy
 
     def get_opener(self):
         return WiseOpener
 
     def read_from_file(self, input_file):
-        """ Read data from given input_file."""
+        """ Read data from given input_file.
+        In lazy mode file is read only when data is used."""
+        if self.lazy:
+            self._data = LazyData(lambda: self.read_online(input_file), file_name=input_file)
+            return
         with WiseOpener(input_file) as fh:
             self._data = fh.readlines()
 
@@ -105,28 +607,28 @@ class AbstractFileIO(object):
             for item in fh:
                 yield item
 
+    def read_online_mapped(self, input_file):
+        """ Yield lines of uncompressed input_file as memoryview slices
+        of memory-mapped file, see MappedFile."""
+        with MappedFile(input_file) as mf:
+            for line in mf.iter_lines():
+                yield line
+
     def read_from_db(self, db_cursor):
         """ Read data from database cursor."""
         for item in db_cursor:
             yield item
 
-    def read_from_mongodb(self, table, query):
-        """ Read data online from mongodb."""
-        cursor = table.find(query)
-        n = cursor.count(query)
-        start = 0
-        limit = 2000
-        end = start + limit
-        while True:
-            for x in cursor[start:end]:
-                yield x
-            start = end
-            end += limit
-            if start > n:
-                break
+    def read_from_mongodb(self, table, query, batch_size=2000):
+        """ Read data online from mongodb, documents are fetched by batches."""
+        for x in table.find(query, batch_size=batch_size):
+            yield x
 
     def update_mongodb(self, table, what, wherewith):
-        table.update(what, wherewith, False, True)
+        """ Update all documents matching what.
+        :return: number of modified documents
+        """
+        return table.update_many(what, wherewith).modified_count
 
     def write_to_file(self, output_file):
         """ Write data to given output_file."""
@@ -137,11 +639,25 @@ class AbstractFileIO(object):
         """ Write data with given database cursor."""
         raise NotImplementedError
 
-    def write_to_mongodb(self, table, item):
-        table.insert(item)
+    def write_to_mongodb(self, table, item, batch_size=1000, ordered=False):
+        """ Insert a document or iterable of documents by batches
+        with unordered insert_many() by default.
+        :return: number of inserted documents
+        """
+        if isinstance(item, dict):
+            table.insert_one(item)
+            return 1
+        return mongo_insert_many(table, item, batch_size=batch_size, ordered=ordered)["inserted"]
 
     def read_as_iter(self, source):
-        """ Read data from iterable source."""
+        """ Read data from iterable source.
+        In lazy mode source is added to data sources, iterator sources
+        (e.g. generators) can be read only once, see LazyData."""
+        if self.lazy:
+            if self._data is None:
+                self._data = LazyData()
+            self._data.add_source(source)
+            return
         for item in source:
             self._data.append(item)
 
@@ -159,6 +675,11 @@ class AbstractFileIO(object):
     def iterate_with_func(self, pre_func, iter_func):
         """ Iterate over data with given iter_func.
         And data can be preprocessed with pre_func."""
+        if self.lazy:
+            self._data.add_stage(pre_func)
+            for item in iter_func(self._data):
+                yield item
+            return
         self._data = pre_func(self._data)
         for item in iter_func(self._data):
             yield item
@@ -171,118 +692,447 @@ class AbstractFileIO(object):
         return result
 
     def process(self, cf, **args):
-        """ Process data with given core function."""
+        """ Process data with given core function.
+        In lazy mode cf gets and should return iterator."""
+        if self.lazy:
+            self._data.add_stage(lambda items: cf(items, **args))
+            return
         self._data = cf(self._data, **args)
 
     def clear(self):
         """ Remove data."""
         self._data = None
 
-    def do_with_iter(self, cf, **args):
+    def do_with_iter(self, cf, n_workers=1, pool_chunksize=None, **args):
         """ Do something by iterating over data with given core function and args.
             And get a list of results of doing.
+            In lazy mode a generator of results is returned.
+            With n_workers > 1 cf is applied in a pool of processes,
+            see do_with_iter_online(). Other args are passed to cf.
         """
+        if self.lazy or n_workers > 1:
+            result = self.do_with_iter_online(cf, n_workers=n_workers, pool_chunksize=pool_chunksize, **args)
+            if self.lazy:
+                return result
+            return list(result)
         result = []
         for item in self._data:
             result.append(cf(item, **args))
         return result
 
-    def process_with_iter(self, cf, **args):
-        """ Process by iterating over data with given core function."""
+    def do_with_iter_online(self, cf, n_workers=1, pool_chunksize=None, **args):
+        """ Yield results of core function for data items in data order.
+        With n_workers > 1 data is split into chunks of pool_chunksize items
+        (default 1000), processed in a pool of processes, so cf and args
+        should be picklable, e.g. module level functions.
+        If data is a plain file read in lazy mode without stages
+        then worker processes read their own byte ranges of the file of pool_chunksize bytes
+        (default is file size / (4 * n_workers)) aligned to line ends.
+        Only a few chunks per worker are kept in memory.
+        """
+        if n_workers <= 1:
+            for item in self._data:
+                yield cf(item, **args)
+            return
+        file_name = self._get_plain_file()
+        if file_name:
+            if not pool_chunksize:
+                pool_chunksize = max(1024 ** 2, os.path.getsize(file_name) // (4 * n_workers))
+            tasks = ((file_name, start, end, cf, args) for start, end in get_line_chunks(file_name, pool_chunksize))
+            for result in _imap_ordered(_map_file_range, tasks, n_workers):
+                yield result
+            return
+        tasks = ((cf, chunk, args) for chunk in _iter_chunks(self._data, pool_chunksize or 1000))
+        for result in _imap_ordered(_map_chunk, tasks, n_workers):
+            yield result
+
+    def _get_plain_file(self):
+        """ Return file name if data is uncompressed file read in lazy mode without stages."""
+        if not self.lazy or not self._data.file_name:
+            return None
+        if len(self._data.sources) != 1 or self._data.stages:
+            return None
+        if get_compression(self._data.file_name):
+            return None
+        return self._data.file_name
+
+    def process_with_iter(self, cf, n_workers=1, pool_chunksize=None, **args):
+        """ Process by iterating over data with given core function.
+        With n_workers > 1 cf is applied in a pool of processes, see do_with_iter_online().
+        """
+        if self.lazy:
+            if n_workers > 1:
+                self._data.add_stage(lambda items: _imap_ordered(
+                    _map_chunk, ((cf, chunk, args) for chunk in _iter_chunks(items, pool_chunksize or 1000)), n_workers))
+            else:
+                self._data.add_stage(lambda items: (cf(item, **args) for item in items))
+            return
+        if n_workers > 1:
+            self._data = list(self.do_with_iter_online(cf, n_workers=n_workers, pool_chunksize=pool_chunksize, **args))
+            return
         for i, item in enumerate(self._data):
             self._data[i] = cf(item, **args)
 
-    def sort(self, sort_func, reverse=False):
-        """ Sort data with sort_func and reversed param."""
+    def filter_with_iter(self, cf, **args):
+        """ Keep only items for which core function returns true."""
+        if self.lazy:
+            self._data.add_stage(lambda items: (item for item in items if cf(item, **args)))
+            return
+        self._data = [item for item in self._data if cf(item, **args)]
+
+    def sort(self, sort_func, reverse=False, max_memory=None, temp_folder=None, sizeof=None):
+        """ Sort data with sort_func and reversed param.
+        In lazy mode sorting stage keeps all items in memory,
+        unless max_memory (bytes) is set, then external merge sort is used,
+        see external_sort(). Without lazy mode data is already in memory,
+        so max_memory can't be used.
+        """
         assert hasattr(sort_func, "__call__")
+        if self.lazy:
+            if max_memory:
+                self._data.add_stage(lambda items: external_sort(items, sort_func, reverse=reverse,
+                                                                 max_memory=max_memory,
+                                                                 temp_folder=temp_folder,
+                                                                 sizeof=sizeof))
+            else:
+                self._data.add_stage(lambda items: iter(sorted(items, key=sort_func, reverse=reverse)))
+            return
+        if max_memory:
+            raise Exception("max_memory is supported only in lazy mode")
         self._data.sort(key=sort_func, reverse=reverse)
 
+    def sort_file(self, input_file, output_file, sort_func, reverse=False, max_memory=256 * 1024 ** 2, temp_folder=None, sizeof=None):
+        """ Sort lines of input_file larger than memory and write them to output_file.
+        Lines are the same as with read_from_file(), sort() and write_to_file().
+        """
+        reader = AbstractFileIO(lazy=True)
+        reader.read_from_file(input_file)
+        reader.sort(sort_func, reverse=reverse, max_memory=max_memory, temp_folder=temp_folder, sizeof=sizeof)
+        reader.write_to_file(output_file)
+
     @property
     def data(self):
         return self._data
 
     @property
     def N(self):
+        if self.lazy:
+            return sum(1 for item in self._data)
         return len(self._data)
 
 
+class FolderSnapshot(object):
+    """ Cached recursive listing of folder made with os.scandir.
+    refresh() lists again only directories with changed mtime,
+    unchanged directories are only stat'ed. Directories modified
+    less than a second before they were listed are always listed again,
+    because mtime resolution can hide later changes.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        # path -> (mtime_ns, dirs, files, symlinked dirs, listing time)
+        self.dirs = {}
+
+    def _scan_dir(self, path, st):
+        dirs = []
+        files = []
+        links = set()
+        scanned_at = time.time()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        dirs.append(entry.name)
+                        if entry.is_symlink():
+                            links.add(entry.name)
+                    else:
+                        files.append(entry.name)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, dirs, files, links, scanned_at)
+
+    def refresh(self):
+        """ Update listing of changed directories.
+        :return: number of listed directories
+        """
+        dirs = {}
+        n = 0
+        stack = [self.folder]
+        while stack:
+            path = stack.pop()
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            cached = self.dirs.get(path)
+            if cached is not None and cached[0] == st.st_mtime_ns and st.st_mtime < cached[4] - 1:
+                entry = cached
+            else:
+                entry = self._scan_dir(path, st)
+                n += 1
+                if entry is None:
+                    continue
+            dirs[path] = entry
+            for name in entry[1]:
+                if not name in entry[3]:
+                    stack.append(os.path.join(path, name))
+        self.dirs = dirs
+        return n
+
+    def walk(self):
+        """ Yield (root, dirs, files) as os.walk(folder, topdown=False)."""
+        dirs = self.dirs
+        if not self.folder in dirs:
+            return
+        # iterative post-order traversal
+        stack = [(self.folder, False)]
+        while stack:
+            path, expanded = stack.pop()
+            entry = dirs.get(path)
+            if entry is None:
+                continue
+            if expanded:
+                yield path, entry[1], entry[2]
+                continue
+            stack.append((path, True))
+            for name in reversed(entry[1]):
+                if not name in entry[3]:
+                    stack.append((os.path.join(path, name), False))
+
+
+# shared folder snapshots by folder path, see AbstractFolderIO
+_folder_snapshots = {}
+
+
+def _get_matcher(mask, glob=None, suffix=None):
+    """ Return function checking file name.
+    Regular expression mask is compiled once,
+    masks without special characters are checked as substrings or suffixes.
+    """
+    if suffix is not None:
+        if isinstance(suffix, list):
+            suffix = tuple(suffix)
+        return lambda name: name.endswith(suffix)
+    if glob is not None:
+        return re.compile(fnmatch.translate(glob)).match
+    if not mask or mask == ".":
+        return lambda name: True
+    if re.escape(mask) == mask:
+        return lambda name: mask in name
+    if mask.endswith("$") and not mask.endswith("\\$"):
+        literal = re.sub(r"\\(.)", r"\1", mask[:-1])
+        if re.escape(literal) == mask[:-1]:
+            return lambda name: name.endswith(literal)
+    return re.compile(mask).search
+
+
+def _copy_data(source_fh, target_fh, size):
+    """ Copy size bytes in kernel with copy_file_range or sendfile if possible."""
+    source_fd = source_fh.fileno()
+    target_fd = target_fh.fileno()
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                n = os.copy_file_range(source_fd, target_fd, size - copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            if copied or not e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            while copied < size:
+                n = os.sendfile(target_fd, source_fd, copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            if copied or not e.errno in (errno.ENOSYS, errno.EINVAL, errno.ENOTSOCK):
+                raise
+    shutil.copyfileobj(source_fh, target_fh, 1024 * 1024)
+    return size
+
+
+def copy_file(source, target):
+    """ Copy file with metadata as shutil.copy2 using zero-copy kernel transfer
+    (copy_file_range, sendfile) if it is available. Data is copied to a temporary
+    file which is renamed to target.
+    :return: number of copied bytes
+    """
+    temp_file = get_temp_path(target)
+    try:
+        with open(source, "rb") as source_fh:
+            size = os.fstat(source_fh.fileno()).st_size
+            with open(temp_file, "wb") as target_fh:
+                copied = _copy_data(source_fh, target_fh, size)
+        shutil.copystat(source, temp_file)
+        os.replace(temp_file, target)
+    except:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return copied
+
+
+def _is_identical(source, target, modify_window=0):
+    """ Check that target exists and has the same size and mtime as source."""
+    try:
+        source_st = os.stat(source)
+        target_st = os.stat(target)
+    except OSError:
+        return False
+    if source_st.st_size != target_st.st_size:
+        return False
+    return abs(source_st.st_mtime - target_st.st_mtime) <= modify_window
+
+
+def _transfer_file(source, target, move=False, skip_identical=False):
+    """ Copy or move file.
+    If target is the same file as source (e.g. the same folder or a hard link) it is skipped.
+    :return: (action, number of bytes), action is "copied", "moved" or "skipped"
+    """
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return "skipped", 0
+    if skip_identical and _is_identical(source, target):
+        if move:
+            os.remove(source)
+        return "skipped", 0
+    if move:
+        try:
+            os.replace(source, target)
+            return "moved", 0
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        # different devices
+        size = copy_file(source, target)
+        os.remove(source)
+        return "moved", size
+    return "copied", copy_file(source, target)
+
+
 class AbstractFolderIO(object):
     """ Abstract class for working with abstract data in folder.
+
+    Folder is listed with os.scandir once and the listing (FolderSnapshot)
+    is shared by all readers of the folder. Before each iteration
+    it is refreshed incrementally: only directories with changed mtime are listed again.
+    With refresh=False the listing isn't updated, call refresh() manually.
+
+    File names are matched with precompiled regular expression mask (re.search),
+    shell pattern glob, e.g. "*.fa.gz", or suffix (string or tuple of suffixes).
     
     Public methods:
     
-    - __init__(self, folder, mask=None)
+    - __init__(self, folder, mask=".", glob=None, suffix=None, refresh=True)
+    - refresh(self)
+    - walk(self) ~> (root, dirs, files)
     - iter_files(self)
     - get_files(self)
     - iter_filenames(self)
     - get_filenames(self)
     - iter_file_content(self)
-    - copy_files_by_mask(self, dist_folder)
+    - copy_files_by_mask(self, dist_folder, workers=1, skip_identical=False)
+    - move_files_by_mask(self, dist_folder, workers=1, skip_identical=False)
+    - transfer_files_by_mask(self, dist_folder, move=False, workers=1, skip_identical=False)
     
     >>> folder_reader = AbstractFolderIO(folder, mask=".")
+    >>> folder_reader = AbstractFolderIO(folder, suffix=(".fa", ".fa.gz"))
 
 
     """
 
-    def __init__(self, folder, mask="."):
+    def __init__(self, folder, mask=".", glob=None, suffix=None, refresh=True):
         self.folder = folder
         self.mask = mask
+        self.match = _get_matcher(mask, glob=glob, suffix=suffix)
+        self.auto_refresh = refresh
+        if not folder in _folder_snapshots:
+            _folder_snapshots[folder] = FolderSnapshot(folder)
+        self.snapshot = _folder_snapshots[folder]
+        self._refreshed = False
+
+    def refresh(self):
+        """ Update folder listing."""
+        self.snapshot.refresh()
+        self._refreshed = True
+
+    def walk(self):
+        """ Yield (root, dirs, files) from folder listing as os.walk(folder, topdown=False)."""
+        if self.auto_refresh or not self._refreshed:
+            self.refresh()
+        return self.snapshot.walk()
 
     def iter_files(self):
         """ iter over files in folder. Return file name."""
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+        for root, dirs, files in self.walk():
             for name in files:
-                if re.search(self.mask, name):
+                if self.match(name):
                     yield name
 
     def iter_folders(self):
         """ iter over folders in folder. Return folder name."""
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+        for root, dirs, files in self.walk():
             for folder in dirs:
-                if re.search(self.mask, folder):
+                if self.match(folder):
                     yield folder
 
     def get_files(self):
         """ Get files in folder. Return file name."""
         result = []
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+        for root, dirs, files in self.walk():
             for name in files:
-                if re.search(self.mask, name):
+                if self.match(name):
                     result.append(name)
         return result
 
     def iter_filenames(self):
         """ iter over files in folder. Return file name path."""
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+        for root, dirs, files in self.walk():
             for name in files:
-                if re.search(self.mask, name):
+                if self.match(name):
                     apath = os.path.join(root, name)
                     yield apath
 
     def get_filenames(self):
         """ Get files in folder. Return path."""
         result = []
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+        for root, dirs, files in self.walk():
             for name in files:
-                if re.search(self.mask, name):
+                if self.match(name):
                     path = os.path.join(root, name)
                     result.append(path)
         return result
 
     def iter_path_names(self):
         """ iter over files in folder. Return file name and path."""
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+        for root, dirs, files in self.walk():
             for name in files:
-                if re.search(self.mask, name):
+                if self.match(name):
                     apath = os.path.join(root, name)
                     yield name, apath
 
-    def iter_file_content(self):
-        """ iter over files in folder. Return file content."""
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+    def iter_file_content(self, mapped=False):
+        """ iter over files in folder. Return file content.
+        With mapped flag uncompressed files are returned as memoryview
+        of memory-mapped file, it is valid only until the next file."""
+        for root, dirs, files in self.walk():
             for name in files:
-                if re.search(self.mask, name):
+                if self.match(name):
                     path = os.path.join(root, name)
+                    if mapped and not get_compression(path):
+                        with MappedFile(path) as mf:
+                            yield mf.view
+                        continue
                     with WiseOpener(path, "rb") as fh:
                         yield fh.read()
 
@@ -290,29 +1140,62 @@ class AbstractFolderIO(object):
         """
         Iterate over files in folder. Return file content, file_name, file_path.
         """
-        for root, dirs, files in os.walk(self.folder, topdown=False):
+        for root, dirs, files in self.walk():
             for name in files:
-                if re.search(self.mask, name):
+                if self.match(name):
                     path = os.path.join(root, name)
                     with WiseOpener(path, "rb") as fh:
                         yield fh.read(), name, path
 
-    def move_files_by_mask(self, dist_folder):
-        for file_path in self.iter_filenames():
-            dist_file = os.path.join(dist_folder, os.path.split(file_path)[-1])
-            print("Move: ", file_path, dist_file)
-            if os.path.isfile(dist_file):
-                os.remove(dist_file)
-                #TODO: fix me
-            os.rename(file_path, dist_file)
-
-    def copy_files_by_mask(self, dist_folder):
-        for file_path in self.iter_filenames():
+    def transfer_files_by_mask(self, dist_folder, move=False, workers=1, skip_identical=False):
+        """ Copy or move files to dist_folder with workers threads.
+        Data is copied in kernel (copy_file_range, sendfile) if possible,
+        moving between devices is done with copying and removing.
+        By default existing files in dist_folder are overwritten, with skip_identical
+        files with the same size and mtime in dist_folder are not copied (and removed in source when moving).
+        Files which are already in dist_folder (the same file or a hard link) are skipped.
+        :return: report {"copied": n, "moved": n, "skipped": n, "failed": {path: error},
+                 "bytes": n, "elapsed": sec, "throughput": bytes per sec}
+        """
+        report = {"copied": 0, "moved": 0, "skipped": 0, "failed": {}, "bytes": 0}
+        start = time.time()
+
+        def transfer(file_path):
             dist_file = os.path.join(dist_folder, os.path.split(file_path)[-1])
-            print("Copy: ", file_path, dist_file)
-            if os.path.isfile(dist_file):
-                os.remove(dist_file)
-            shutil.copy2(file_path, dist_file)
+            exp_logger.info("%s: %s %s" % ("Move" if move else "Copy", file_path, dist_file))
+            try:
+                return file_path, _transfer_file(file_path, dist_file, move=move, skip_identical=skip_identical), None
+            except Exception as e:
+                return file_path, None, "%s: %s" % (e.__class__.__name__, e)
+
+        file_paths = self.get_filenames()
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(transfer, file_paths))
+        else:
+            results = [transfer(file_path) for file_path in file_paths]
+        for file_path, result, error in results:
+            if error is not None:
+                exp_logger.error("Transfer of %s failed with %s" % (file_path, error))
+                report["failed"][file_path] = error
+                continue
+            action, size = result
+            report[action] += 1
+            report["bytes"] += size
+        report["elapsed"] = time.time() - start
+        report["throughput"] = report["bytes"] / report["elapsed"] if report["elapsed"] else 0.0
+        exp_logger.info("Copied %s, moved %s, skipped %s, failed %s files: %.1f Mb in %.1f sec (%.1f Mb/s)" % (
+            report["copied"], report["moved"], report["skipped"], len(report["failed"]),
+            report["bytes"] / 1024. ** 2, report["elapsed"], report["throughput"] / 1024. ** 2))
+        return report
+
+    def move_files_by_mask(self, dist_folder, workers=1, skip_identical=False):
+        """ Move files to dist_folder, see transfer_files_by_mask()."""
+        return self.transfer_files_by_mask(dist_folder, move=True, workers=workers, skip_identical=skip_identical)
+
+    def copy_files_by_mask(self, dist_folder, workers=1, skip_identical=False):
+        """ Copy files to dist_folder, see transfer_files_by_mask()."""
+        return self.transfer_files_by_mask(dist_folder, move=False, workers=workers, skip_identical=skip_identical)
 
 
 class AbstractFoldersIO(AbstractFileIO):
@@ -355,10 +1238,16 @@ def sc_iter_filedata_folder(folder, mask="."):
         yield data
 
 
-def sc_move_files(folder, dist_folder, mask="."):
+def sc_move_files(folder, dist_folder, mask=".", workers=1, skip_identical=False):
     """ Shortcut for moving file from folder to dist."""
     reader = AbstractFolderIO(folder, mask=mask)
-    reader.move_files_by_mask(dist_folder)
+    return reader.move_files_by_mask(dist_folder, workers=workers, skip_identical=skip_identical)
+
+
+def sc_copy_files(folder, dist_folder, mask=".", workers=1, skip_identical=False):
+    """ Shortcut for copying file from folder to dist."""
+    reader = AbstractFolderIO(folder, mask=mask)
+    return reader.copy_files_by_mask(dist_folder, workers=workers, skip_identical=skip_identical)
 
 
 def sc_process_file(file_name, cf, args_dict):
@@ -372,34 +1261,180 @@ def sc_process_file(file_name, cf, args_dict):
         fh.write(text)
 
 
-def sc_process_folder(folder, cf, args_dict, mask="."):
-    """ Shortcut for processing each file in folder
-        with given cf funciton."""
-    reader = AbstractFolderIO(folder, mask=mask)
-    for text, name, file_name in reader.iter_file_content_and_names():
+def get_temp_path(file_name):
+    """ Return temporary path in the same folder with the same suffix,
+    so it can be renamed over file_name and is compressed as file_name."""
+    folder, name = os.path.split(file_name)
+    return os.path.join(folder, ".tmp.%s.%s.%s" % (os.getpid(), threading.current_thread().ident, name))
+
+
+def write_atomic(file_name, text):
+    """ Write text to temporary file and rename it to file_name."""
+    temp_file = get_temp_path(file_name)
+    try:
+        with WiseOpener(temp_file, "w") as fh:
+            fh.write(text)
+        os.rename(temp_file, file_name)
+    except:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def _process_file(task):
+    """ Read file, apply cf and write result.
+    :return: (file_path, None) or (file_path, error message)
+    """
+    file_path, name, output_file, cf, args_dict = task
+    try:
+        with WiseOpener(file_path, "rb") as fh:
+            text = fh.read()
+        args_dict = dict(args_dict)
         args_dict["name"] = name
         text = cf(text, **args_dict)
-        with WiseOpener(file_name, "w") as fh:
-            fh.write(text)
+        write_atomic(output_file, text)
+    except Exception as e:
+        return file_path, "%s: %s" % (e.__class__.__name__, e)
+    return file_path, None
 
 
-def sc_process_folder_to_other(folder, output_folder, cf, args_dict, mask=".", verbose=False):
+def _process_file_online(task):
+    """ Stream file through generator cf to output file.
+    :return: (file_path, None) or (file_path, error message)
+    """
+    file_path, name, output_file, cf, args_dict, chunksize = task
+    temp_file = get_temp_path(output_file)
+    try:
+        args_dict = dict(args_dict)
+        args_dict["name"] = name
+        with WiseOpener(file_path, "rb") as fh:
+            with WiseOpener(temp_file, "wb") as output_fh:
+                if chunksize:
+                    items = iter(lambda: fh.read(chunksize), b"")
+                else:
+                    items = fh
+                for piece in cf(items, **args_dict):
+                    if not isinstance(piece, bytes):
+                        piece = piece.encode("utf-8")
+                    output_fh.write(piece)
+        os.rename(temp_file, output_file)
+    except Exception as e:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return file_path, "%s: %s" % (e.__class__.__name__, e)
+    return file_path, None
+
+
+def _is_output_newer(file_path, output_file):
+    """ Check that output file exists and is newer than file."""
+    if not os.path.isfile(output_file):
+        return False
+    return os.path.getmtime(output_file) >= os.path.getmtime(file_path)
+
+
+def _process_files(tasks, workers=1, executor="thread", skipped=None, func=_process_file):
+    """ Process files in a pool of threads or processes.
+    :return: summary dictionary {"processed": [path,], "failed": {path: error}, "skipped": [path,]}
+    """
+    summary = {"processed": [], "failed": {}, "skipped": skipped or []}
+    if workers > 1:
+        if executor == "process":
+            pool = ProcessPoolExecutor(max_workers=workers)
+        elif executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=workers)
+        else:
+            raise Exception("Unknown executor: %s" % executor)
+        with pool:
+            results = pool.map(func, tasks)
+            for file_path, error in results:
+                _add_to_summary(summary, file_path, error)
+    else:
+        for task in tasks:
+            file_path, error = func(task)
+            _add_to_summary(summary, file_path, error)
+    exp_logger.info("Processed %s files, failed %s, skipped %s" % (len(summary["processed"]),
+                                                                 len(summary["failed"]),
+                                                                 len(summary["skipped"])))
+    return summary
+
+
+def _add_to_summary(summary, file_path, error):
+    if error is None:
+        summary["processed"].append(file_path)
+    else:
+        exp_logger.error("Processing of %s failed with %s" % (file_path, error))
+        summary["failed"][file_path] = error
+
+
+def sc_process_folder(folder, cf, args_dict, mask=".", workers=1, executor="thread"):
+    """ Shortcut for processing each file in folder
+        with given cf funciton.
+
+        Files are processed in a pool of workers threads or processes (executor="process"),
+        for processes cf should be picklable. Files are replaced atomically.
+        :return: summary {"processed": [path,], "failed": {path: error}, "skipped": []}
+    """
+    reader = AbstractFolderIO(folder, mask=mask)
+    tasks = [(file_name, name, file_name, cf, args_dict) for name, file_name in reader.iter_path_names()]
+    return _process_files(tasks, workers=workers, executor=executor)
+
+
+def sc_process_folder_to_other(folder, output_folder, cf, args_dict, mask=".", verbose=False,
+                               workers=1, executor="thread", skip_newer=False):
     """ Shortcut for processing each file in folder
         with given cf funciton.
 
         To print names set *verbose* to True.
+        Files are processed in a pool of workers threads or processes (executor="process"),
+        for processes cf should be picklable. Output files are written atomically.
+        With *skip_newer* files with output newer than input are skipped.
+        :return: summary {"processed": [path,], "failed": {path: error}, "skipped": [path,]}
     """
     assert hasattr(cf, "__call__")
     reader = AbstractFolderIO(folder, mask=mask)
-    for text, name, file in reader.iter_file_content_and_names():
-        if verbose:
-            print(file)
-        args_dict["name"] = name
-        text = cf(text, **args_dict)
+    tasks = []
+    skipped = []
+    for name, file in reader.iter_path_names():
         output_file = os.path.join(output_folder,
                                    name)
-        with WiseOpener(output_file, "w") as fh:
-            fh.write(text)
+        if skip_newer and _is_output_newer(file, output_file):
+            skipped.append(file)
+            continue
+        if verbose:
+            print(file)
+        tasks.append((file, name, output_file, cf, args_dict))
+    return _process_files(tasks, workers=workers, executor=executor, skipped=skipped)
+
+
+def sc_process_folder_online(folder, cf, args_dict, mask=".", output_folder=None, chunksize=None,
+                             workers=1, executor="thread", skip_newer=False):
+    """ Shortcut for processing each file in folder without loading it into memory.
+        cf is a generator function getting an iterator over lines (bytes)
+        or chunks of chunksize bytes and yielding bytes or strings,
+        they are written at once to output file (compressed according to its suffix).
+        Without output_folder files are replaced.
+
+        >>> def cf(lines, name=None):
+        ...     for line in lines:
+        ...         if not line.startswith(b"#"):
+        ...             yield line
+        >>> sc_process_folder_online(folder, cf, {}, mask=".gz$", output_folder=output_folder)
+
+        Workers, executor and skip_newer are the same as for sc_process_folder_to_other().
+        :return: summary {"processed": [path,], "failed": {path: error}, "skipped": [path,]}
+    """
+    assert hasattr(cf, "__call__")
+    reader = AbstractFolderIO(folder, mask=mask)
+    tasks = []
+    skipped = []
+    for name, file in reader.iter_path_names():
+        output_file = os.path.join(output_folder, name) if output_folder else file
+        if skip_newer and output_folder and _is_output_newer(file, output_file):
+            skipped.append(file)
+            continue
+        tasks.append((file, name, output_file, cf, args_dict, chunksize))
+    return _process_files(tasks, workers=workers, executor=executor, skipped=skipped,
+                          func=_process_file_online)
 
 
 def read_pickle_file(pickle_file):
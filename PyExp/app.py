@@ -8,9 +8,14 @@ import sys
 import os
 import re
 import shutil
-import yaml
-from PyExp.abstract_experiment import AbstractStep
+from PyExp.yaml_codec import yaml_load
+from PyExp.yaml_codec import yaml_dump
+from PyExp.abstract_experiment import create_project_job
+from PyExp.abstract_experiment import execute_projects
 from PyExp.abstract_manager import ProjectManagerException
+from PyExp.project_store import YamlProjectStore
+from PyExp.project_store import SQLiteProjectStore
+from PyExp.project_store import migrate_projects
 try:
     from logbook import Logger
 
@@ -21,6 +26,32 @@ except:
 
 app_logger = Logger('App logger')
 
+
+def _pop_jobs_option(args):
+    ''' Remove --jobs N (or --jobs=N) option from args and return number of jobs.
+    Raise ValueError if value is missing or isn't a positive integer.
+    '''
+    for i, arg in enumerate(args):
+        if arg == "--jobs":
+            if i + 1 == len(args):
+                raise ValueError("--jobs option requires a value")
+            value = args[i + 1]
+            del args[i:i + 2]
+        elif arg.startswith("--jobs="):
+            value = arg.split("=", 1)[1]
+            del args[i]
+        else:
+            continue
+        try:
+            jobs = int(value)
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            raise ValueError("--jobs value should be a positive integer, got: %s" % value)
+        return jobs
+    return 1
+
+
 def _create_projects(exp_settings_class, manager_class, all_projects):
     ''' Init project data and settings.
     '''    
@@ -42,7 +73,7 @@ def _create_projects(exp_settings_class, manager_class, all_projects):
             app_logger.info("Project %s added" % pid)
 
 
-def execute(args, usage, dataset_dict, exp_settings, exp_class, manager_class):
+def execute(args, usage, dataset_dict, exp_settings, exp_class, manager_class, jobs=1):
     ''' Execute experiment with givent args.
     '''
     if not len(args) in [5,7]:
@@ -78,7 +109,8 @@ def execute(args, usage, dataset_dict, exp_settings, exp_class, manager_class):
                     exp_class = exp_class,
                     manager_class = manager_class,
                     settings_context = settings_context,
-                    project_context = project_context
+                    project_context = project_context,
+                    jobs = jobs
                     )
     if command == "force":
         execute_task(dataset,
@@ -91,9 +123,12 @@ def execute(args, usage, dataset_dict, exp_settings, exp_class, manager_class):
                     exp_class = exp_class,
                     manager_class = manager_class,
                     settings_context = settings_context,
-                    project_context = project_context                    
+                    project_context = project_context,
+                    jobs = jobs
                     )
     if command == "check":
+        if jobs > 1:
+            app_logger.warning("--jobs option is ignored for check command")
         check_task(dataset, 
                     tasks, 
                     start=start, 
@@ -120,36 +155,20 @@ def execute(args, usage, dataset_dict, exp_settings, exp_class, manager_class):
                     settings_context = settings_context,
                     project_context = project_context,
                     path_replacing = commands,
+                    jobs = jobs
                     )
 
 def add_step(exp, task, manager, pid):
     ''' Add step to experiment.
     '''
     s = exp.find_step(task)
-    input = None
     if not s:
-        print("Unknown step name:" % task)
+        print("Unknown step name: %s" % task)
         print("Avaliable steps: ")
         for x in exp.get_available_steps():
             print("\t%s" % x["name"])
         sys.exit(0)
-    if "manager" in s and s["manager"]:
-            input = {"manager":manager, 
-                     "pid":pid,
-                     }
-    check =None
-    if "check" in  s:
-        check = s["check"]
-    pre =None
-    if "pre" in  s:
-        pre = s["pre"]
-    check_value = None
-    if "check_value" in  s:
-        check_value = s["check_value"]
-    if input:
-        step = AbstractStep(s["name"], input, s["cf"], save_output=False, check_f=check, check_p=pre, check_value=check_value)
-    else:
-        step = AbstractStep(s["name"], None, s["cf"], save_output=False, check_f=check, check_p=pre, check_value=check_value)
+    step = exp.build_step(s, manager=manager, pid=pid)
     exp.add_step(step)
     
 def execute_task(dataset_gen, 
@@ -164,14 +183,36 @@ def execute_task(dataset_gen,
                                     settings_context = None,
                                     project_context = None,
                                     path_replacing= None,
+                                    jobs=1,
                                     ):
     ''' Execute task.
+    With jobs > 1 projects are executed in a pool of worker processes.
     '''
     if not start is None and not end is None:
         dataset = dataset_gen()[start:end]
     else:
         dataset = dataset_gen()
     n = len(dataset)
+    if jobs > 1:
+        steps = task.strip().split(",")
+        project_jobs = []
+        for pid, project_init in dataset:
+            project_jobs.append(create_project_job(pid,
+                                                   steps,
+                                                   exp_class,
+                                                   exp_settings_class,
+                                                   manager_class,
+                                                   exp_name=exp_name,
+                                                   force=force,
+                                                   settings_context=settings_context,
+                                                   project_context=project_context,
+                                                   path_replacing=path_replacing))
+        result = execute_projects(project_jobs, threads=jobs)
+        print("Finished: %s, failed: %s" % (len(result["finished"]), len(result["failed"])))
+        for pid in result["failed"]:
+            print("Failed project: %s" % pid)
+        print("\a\a\a\a")
+        return result
     for i, (pid, project_init) in enumerate(dataset):
         print(i, n, pid, task)
         experiment_settings = exp_settings_class()
@@ -198,9 +239,11 @@ def check_task(dataset_gen,
                                 force=None,
                                 exp_settings_class=None,
                                 exp_class = None,
-                                manager_class = None
+                                manager_class = None,
+                                settings_context = None,
+                                project_context = None,
                                 ):
-    ''' Check given task.
+    ''' Check given task. Projects are checked sequentially.
     '''
     if not start is None and not end is None:
         dataset = dataset_gen()[start:end]
@@ -211,7 +254,7 @@ def check_task(dataset_gen,
         print(i, n, pid, task)
         experiment_settings = exp_settings_class()
         manager = manager_class(experiment_settings)
-        project, settings = manager.get_project(pid)
+        project, settings = manager.get_project(pid, settings_context=settings_context, project_context=project_context)
         exp = exp_class(settings, project, name=exp_name, manager=manager, force=force)
         if "," in task:
             print("Complex task")
@@ -228,16 +271,23 @@ def check_task(dataset_gen,
 def run_app(exp_class, exp_settings_class, manager_class, dataset_dict):
     #TODO: add check command
     #TODO: add submit command
-    usage = ("command task1,task2 from to dataset, e.g."
+    usage = ("command task1,task2 from to dataset [--jobs N], e.g."
                       "\n\tforce annotate human"
                       "\nOR\ncreate dataset"
                       "\nOR\nshow dataset"
                       "\nOR\ncheck dataset"
                       "\nOR\nyaml file_name"
                       "\nOR\nyaml generate file_name"
+                      "\nOR\nmigrate sqlite_file"
                       )
 
     args = sys.argv[1:]
+    try:
+        jobs = _pop_jobs_option(args)
+    except ValueError as e:
+        print(e)
+        print(usage)
+        sys.exit(1)
     
     if len(args) == 2:
         if args[0] == "create":
@@ -255,11 +305,19 @@ def run_app(exp_class, exp_settings_class, manager_class, dataset_dict):
             else:
                 print("Available datasets:", ", ".join(dataset_dict.keys()))
                 sys.exit(1)
+        elif args[0] == "migrate":
+            manager = manager_class(exp_settings_class())
+            source = YamlProjectStore(manager.projects_folder)
+            target = SQLiteProjectStore(args[1])
+            n = migrate_projects(source, target)
+            target.close()
+            print("Migrated %s projects from %s to %s" % (n, manager.projects_folder, args[1]))
+            print("Set projects_db: %s in config file to use it" % args[1])
         elif args[0] == "yaml":
             file_name = args[1]
             try:
                 with open(file_name) as fh:
-                    data = yaml.load(fh.read())
+                    data = yaml_load(fh)
             except Exception as e:
                 print(e)
                 print("Can't read yaml file %s" % file_name)
@@ -300,7 +358,8 @@ def run_app(exp_class, exp_settings_class, manager_class, dataset_dict):
                 dataset_dict, 
                 exp_settings_class, 
                 exp_class, 
-                manager_class
+                manager_class,
+                jobs=jobs
             )
         else:
             print(usage)
@@ -320,7 +379,8 @@ def run_app(exp_class, exp_settings_class, manager_class, dataset_dict):
                 dataset_dict, 
                 exp_settings_class, 
                 exp_class, 
-                manager_class
+                manager_class,
+                jobs=jobs
            )
      
         if args[0] == "yaml" and args[1]=="generate":
@@ -337,12 +397,13 @@ def run_app(exp_class, exp_settings_class, manager_class, dataset_dict):
                 'avaliable_steps': exp_class(None, None).get_step_names(),
             }
             with open(file_name, "w") as fh:
-                fh.write(yaml.dump(data))
+                fh.write(yaml_dump(data))
     else:
         execute(args,
                 usage, 
                 dataset_dict, 
                 exp_settings_class, 
                 exp_class, 
-                manager_class
+                manager_class,
+                jobs=jobs
         )
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" Byte-offset index of lines or records for random access into large files.
+
+    Index is saved next to the file as <file>.pyidx and rebuilt if mtime
+    or size of the file were changed. Supported files:
+
+    - uncompressed files, item is read with one seek
+    - BGZF files (bgzip), virtual offsets (block start << 16 | offset in block)
+      are kept, so item is read with one seek and one block decompression
+    - other gzip files, uncompressed offsets are kept and gzip stream is
+      decompressed up to the item, use slice() and sample() to read items in order
+
+    Classes:
+
+    - LineIndex(object)
+
+"""
+import os
+import json
+import mmap
+import zlib
+import gzip
+import array
+import random
+import struct
+import shutil
+import hashlib
+import tempfile
+from PyExp import exp_logger
+from PyExp.abstract_reader import get_compression
+
+INDEX_MAGIC = b"PYEXPIDX"
+INDEX_VERSION = 1
+READ_CHUNK = 16 * 1024 * 1024
+OFFSETS_BUFFER = 1024 * 1024
+
+
+def is_bgzf(file_name):
+    """ Check that file is BGZF (blocked gzip with BC extra field)."""
+    with open(file_name, "rb") as fh:
+        header = fh.read(18)
+    if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04":
+        return False
+    return header[12:14] == b"BC"
+
+
+def _iter_bgzf_blocks(file_name):
+    """ Yield (block start, uncompressed data) for BGZF blocks."""
+    with open(file_name, "rb") as fh:
+        while True:
+            start = fh.tell()
+            header = fh.read(12)
+            if not header:
+                break
+            if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+                raise Exception("Broken BGZF block at %s in %s" % (start, file_name))
+            xlen = struct.unpack("<H", header[10:12])[0]
+            extra = fh.read(xlen)
+            bsize = None
+            i = 0
+            while i + 4 <= len(extra):
+                slen = struct.unpack("<H", extra[i + 2:i + 4])[0]
+                if extra[i:i + 2] == b"BC" and slen == 2:
+                    bsize = struct.unpack("<H", extra[i + 4:i + 6])[0]
+                i += 4 + slen
+            if bsize is None:
+                raise Exception("No BGZF block size at %s in %s" % (start, file_name))
+            cdata = fh.read(bsize - xlen - 19)
+            fh.read(8)
+            yield start, zlib.decompress(cdata, -15)
+
+
+def _iter_chunks(fh):
+    while True:
+        data = fh.read(READ_CHUNK)
+        if not data:
+            break
+        yield data
+
+
+class _OffsetsWriter(object):
+    """ Buffered writer of uint64 values to a temporary file."""
+
+    def __init__(self, folder):
+        self.fh = tempfile.TemporaryFile(dir=folder)
+        self.buffer = array.array("Q")
+        self.n = 0
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= OFFSETS_BUFFER:
+            self.flush()
+
+    def flush(self):
+        self.n += len(self.buffer)
+        self.buffer.tofile(self.fh)
+        self.buffer = array.array("Q")
+
+    def copy_to(self, fh):
+        self.flush()
+        self.fh.seek(0)
+        shutil.copyfileobj(self.fh, fh)
+        self.fh.close()
+
+
+class LineIndex(object):
+    """ Random access to lines or records of a file by their number.
+    Without marker items are lines, with marker items are records
+    starting with lines beginning with marker, e.g. b">" for fasta.
+    Items are bytes including line ends.
+
+    >>> with LineIndex("reads.fasta.gz", marker=b">") as index:
+    ...     n = len(index)
+    ...     record = index.get(1000)
+    ...     records = index.slice(1000, 2000)
+    ...     records = index.sample(100, seed=1)
+    ...     ranges = index.get_ranges(32)
+    """
+
+    def __init__(self, file_name, marker=None, index_file=None):
+        self.file_name = file_name
+        self.marker = marker
+        self.index_file = index_file or "%s.pyidx" % file_name
+        self.kind = None
+        self.offsets = None
+        self.voffsets = None
+        self._mm = None
+        self._fh = None
+        self._gz = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    ### Index building and loading ###
+
+    def open(self):
+        """ Load index, build it if index is absent or outdated."""
+        if self.offsets is not None:
+            return
+        st = os.stat(self.file_name)
+        self._stamp = [getattr(st, "st_mtime_ns", int(st.st_mtime * 10 ** 9)), st.st_size]
+        if not self._load(self.index_file):
+            alternative_file = self._get_temp_index_file()
+            if not self._load(alternative_file):
+                try:
+                    self.build(self.index_file)
+                except (IOError, OSError) as e:
+                    exp_logger.warning("Can't save index next to file (%s), %s is used" % (e, alternative_file))
+                    self.index_file = alternative_file
+                    self.build(alternative_file)
+                self._load(self.index_file)
+            else:
+                self.index_file = alternative_file
+        self._fh = open(self.file_name, "rb")
+        if self.kind == "gzip":
+            self._gz = gzip.GzipFile(fileobj=self._fh, mode="rb")
+
+    def _get_temp_index_file(self):
+        """ Index location for files in read-only folders."""
+        name = hashlib.sha1(os.path.abspath(self.file_name).encode("utf-8")).hexdigest()
+        return os.path.join(tempfile.gettempdir(), "%s.pyidx" % name)
+
+    def _load(self, index_file):
+        """ Map index file if it exists and matches the file.
+        :return: True if index was loaded
+        """
+        if not os.path.isfile(index_file):
+            return False
+        with open(index_file, "rb") as fh:
+            if fh.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                return False
+            header_size = struct.unpack("<Q", fh.read(8))[0]
+            try:
+                header = json.loads(fh.read(header_size).decode("utf-8"))
+            except ValueError:
+                return False
+            if header.get("version") != INDEX_VERSION or header.get("stamp") != self._stamp:
+                return False
+            if header.get("marker") != self._get_marker_key():
+                return False
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        start = header["data_offset"]
+        n = header["n"]
+        view = memoryview(mm)
+        self.offsets = view[start:start + 8 * (n + 1)].cast("Q")
+        if header["kind"] == "bgzf":
+            start += 8 * (n + 1)
+            self.voffsets = view[start:start + 8 * n].cast("Q")
+        self.kind = header["kind"]
+        self._mm = mm
+        return True
+
+    def _get_marker_key(self):
+        if self.marker is None:
+            return None
+        return self.marker.hex()
+
+    def _iter_blocks(self, kind):
+        """ Yield (block start or None, uncompressed data) of the file."""
+        if kind == "bgzf":
+            for block in _iter_bgzf_blocks(self.file_name):
+                yield block
+        elif kind == "gzip":
+            with gzip.open(self.file_name, "rb") as fh:
+                for data in _iter_chunks(fh):
+                    yield None, data
+        else:
+            with open(self.file_name, "rb") as fh:
+                for data in _iter_chunks(fh):
+                    yield None, data
+
+    def build(self, index_file=None):
+        """ Scan file and save index of item offsets."""
+        index_file = index_file or self.index_file
+        compression = get_compression(self.file_name)
+        if compression is None:
+            kind = "plain"
+        elif compression != "gz":
+            raise Exception("Index for %s files isn't supported: %s" % (compression, self.file_name))
+        elif is_bgzf(self.file_name):
+            kind = "bgzf"
+        else:
+            kind = "gzip"
+        exp_logger.info("Build %s index for %s" % (kind, self.file_name))
+        folder = os.path.dirname(os.path.abspath(index_file))
+        offsets = _OffsetsWriter(folder)
+        voffsets = _OffsetsWriter(folder)
+        marker = self.marker
+        m = len(marker) if marker else 0
+        # candidates of item start which need bytes of the next block to check marker
+        pending = []
+        at_line_start = True
+        total = 0
+        for block_start, data in self._iter_blocks(kind):
+            size = len(data)
+            still_pending = []
+            for uoffset, voffset, prefix in pending:
+                prefix += data[:m - len(prefix)]
+                if len(prefix) < m:
+                    still_pending.append((uoffset, voffset, prefix))
+                elif prefix == marker:
+                    offsets.append(uoffset)
+                    if kind == "bgzf":
+                        voffsets.append(voffset)
+            pending = still_pending
+            positions = []
+            if at_line_start and size:
+                positions.append(0)
+            position = data.find(b"\n")
+            while position != -1:
+                if position + 1 < size:
+                    positions.append(position + 1)
+                position = data.find(b"\n", position + 1)
+            at_line_start = (size > 0 and data[-1:] == b"\n") or (size == 0 and at_line_start)
+            for position in positions:
+                voffset = 0 if block_start is None else (block_start << 16) | position
+                if m:
+                    prefix = data[position:position + m]
+                    if len(prefix) < m:
+                        pending.append((total + position, voffset, prefix))
+                        continue
+                    if prefix != marker:
+                        continue
+                offsets.append(total + position)
+                if kind == "bgzf":
+                    voffsets.append(voffset)
+            total += size
+        # end of the last item
+        offsets.append(total)
+        n = offsets.n + len(offsets.buffer) - 1
+        header = {
+            "version": INDEX_VERSION,
+            "stamp": self._stamp,
+            "marker": self._get_marker_key(),
+            "kind": kind,
+            "n": n,
+        }
+        # data is aligned to 8 bytes
+        header_size = len(json.dumps(dict(header, data_offset=0)).encode("utf-8")) + 32
+        header["data_offset"] = (len(INDEX_MAGIC) + 8 + header_size + 7) // 8 * 8
+        header_data = json.dumps(header).encode("utf-8")
+        header_data += b" " * (header["data_offset"] - len(INDEX_MAGIC) - 8 - len(header_data))
+        temp_file = "%s.%s.tmp" % (index_file, os.getpid())
+        with open(temp_file, "wb") as fh:
+            fh.write(INDEX_MAGIC)
+            fh.write(struct.pack("<Q", len(header_data)))
+            fh.write(header_data)
+            offsets.copy_to(fh)
+            if kind == "bgzf":
+                voffsets.copy_to(fh)
+        voffsets.fh.close()
+        os.rename(temp_file, index_file)
+        return n
+
+    def close(self):
+        """ Close file and index."""
+        for fh in (self._gz, self._fh):
+            if fh is not None:
+                fh.close()
+        self._gz = None
+        self._fh = None
+        if self.offsets is not None:
+            self.offsets.release()
+            self.offsets = None
+        if self.voffsets is not None:
+            self.voffsets.release()
+            self.voffsets = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass
+            self._mm = None
+
+    ### Random access ###
+
+    def __len__(self):
+        self.open()
+        return len(self.offsets) - 1
+
+    def _check(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("Item %s is out of range for %s items" % (i, n))
+        return i
+
+    def get_offset(self, i):
+        """ Return uncompressed byte offset of item i."""
+        return self.offsets[self._check(i)]
+
+    def _reader_at(self, i):
+        """ Return file object positioned at item i."""
+        if self.kind == "plain":
+            self._fh.seek(self.offsets[i])
+            return self._fh
+        if self.kind == "gzip":
+            self._gz.seek(self.offsets[i])
+            return self._gz
+        voffset = self.voffsets[i]
+        self._fh.seek(voffset >> 16)
+        reader = gzip.GzipFile(fileobj=self._fh, mode="rb")
+        reader.read(voffset & 0xFFFF)
+        return reader
+
+    def get(self, i):
+        """ Return item i as bytes."""
+        i = self._check(i)
+        return self._reader_at(i).read(self.offsets[i + 1] - self.offsets[i])
+
+    def iter_slice(self, start, end):
+        """ Yield items from start to end (exclusive) with one seek."""
+        n = len(self)
+        start, end, step = slice(start, end).indices(n)
+        if start >= end:
+            return
+        reader = self._reader_at(start)
+        for i in range(start, end):
+            yield reader.read(self.offsets[i + 1] - self.offsets[i])
+
+    def slice(self, start, end):
+        """ Return list of items from start to end (exclusive)."""
+        return list(self.iter_slice(start, end))
+
+    def sample(self, k, seed=None):
+        """ Return k random items in file order."""
+        n = len(self)
+        rng = random.Random(seed)
+        return [self.get(i) for i in sorted(rng.sample(range(n), min(k, n)))]
+
+    def get_ranges(self, parts):
+        """ Split items into parts ranges with about equal uncompressed size.
+        :return: list of (start, end) item ranges for slice()
+        """
+        n = len(self)
+        total = self.offsets[n]
+        result = []
+        start = 0
+        for part in range(1, parts + 1):
+            target = total * part // parts
+            # binary search of the first item starting at or after target
+            lo, hi = start, n
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.offsets[mid] < target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            end = n if part == parts else lo
+            if end > start:
+                result.append((start, end))
+                start = end
+        return result
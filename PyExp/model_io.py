@@ -0,0 +1,563 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" Bulk serialization of AbstractModel collections.
+
+    Functions:
+
+    - dump_many(models, fh, chunksize=10000, level=None, threads=None)
+    - load_many(fh, model_class, chunksize=10000)
+    - get_schema(model_class)
+    - dump_binary(models, fh, model_class=None, level=None, threads=None)
+    - load_binary(fh, model_class=None)
+
+    Classes:
+
+    - BinaryModelWriter(object)
+    - BinaryModelReader(object)
+
+    Binary format: magic, uint32 header length and json header with schema,
+    then records as uint32 length and payload, see _BinaryLayout.
+    All numbers are little-endian.
+
+"""
+import io
+import json
+import struct
+import operator
+import itertools
+from PyExp.abstract_model import AbstractModel
+from PyExp.abstract_model import _is_identifier
+from PyExp.abstract_model import _TYPED_ATTRIBUTES
+from PyExp.abstract_reader import WiseOpener
+
+# model class -> (converters table, generated function)
+_formatters = {}
+_parsers = {}
+
+
+def _generate_formatter(model_class):
+    """ Return function formatting a list of models of model_class to lines
+    equal to their string representations.
+    Models with own typed attribute lists are formatted with str().
+    """
+    fields = list(model_class.dumpable_attributes)
+    if not fields or not getattr(model_class.__str__, "_model_default", False) \
+            or not all(_is_identifier(key) for key in fields):
+        return lambda models: [str(model) for model in models]
+    context = {}
+    checks = []
+    for name in _TYPED_ATTRIBUTES:
+        context["_%s" % name] = getattr(model_class, name)
+        checks.append("model.%s is not _%s" % (name, name))
+    lines = ["def format_models(models):",
+             "    result = []",
+             "    append = result.append",
+             "    for model in models:",
+             "        if %s:" % " or ".join(checks),
+             "            append(str(model))",
+             "            continue"]
+    if model_class.preprocess_data is not AbstractModel.preprocess_data:
+        lines.append("        model.preprocess_data()")
+    values = []
+    for i, key in enumerate(fields):
+        kind = model_class._converters.get(key)
+        if kind is int or kind is float:
+            values.append("model.%s" % key)
+        elif kind is not None:
+            lines.append("        value_%s = model.%s" % (i, key))
+            values.append('",".join([str(x) for x in value_%s]).strip() if value_%s is not None else ""' % (i, i))
+        else:
+            values.append("str(model.%s).strip()" % key)
+    line_format = "\\t".join(["%s"] * len(fields)) + "\\n"
+    lines.append('        append("%s" %% (%s,))' % (line_format, ", ".join(values)))
+    lines.append("    return result")
+    exec(compile("\n".join(lines), "<%s.format_models>" % model_class.__name__, "exec"), context)
+    return context["format_models"]
+
+
+def _generate_parser(model_class):
+    """ Return function creating models of model_class from lists of field values.
+    If model has default __init__ and set_with_list() they are inlined.
+    """
+    fields = list(model_class.dumpable_attributes)
+    defaults = {}
+    for attr in model_class.int_attributes:
+        defaults[attr] = 0
+    for attr in model_class.float_attributes:
+        defaults[attr] = 0.0
+    for attr in model_class.other_attributes:
+        defaults[attr] = model_class.other_attributes[attr]
+    if model_class.__init__ is not AbstractModel.__init__ \
+            or model_class.__setattr__ is not object.__setattr__ \
+            or not getattr(model_class.set_with_list, "_model_default", False) \
+            or not all(_is_identifier(key) for key in fields) \
+            or not all(_is_identifier(key) for key in defaults):
+        def parse_rows(rows):
+            result = []
+            for row in rows:
+                model = model_class()
+                model.set_with_list(row)
+                result.append(model)
+            return result
+        return parse_rows
+    context = {"_class": model_class, "_new": object.__new__}
+    lines = ["def parse_rows(rows):",
+             "    result = []",
+             "    append = result.append",
+             "    for row in rows:",
+             "        if len(row) != %s:" % len(fields),
+             "            model = _class()",
+             "            model.set_with_list(row)",
+             "            append(model)",
+             "            continue",
+             "        model = _new(_class)"]
+    for attr, value in defaults.items():
+        if attr in fields:
+            continue
+        context["_default_%s" % attr] = value
+        lines.append("        model.%s = _default_%s" % (attr, attr))
+    for i, key in enumerate(fields):
+        converter = model_class._converters.get(key)
+        item_type = model_class.list_attributes_types.get(key)
+        if converter is int or converter is float:
+            code = "%s(value)" % converter.__name__
+        elif converter is not None and item_type is not None:
+            context["_type_%s" % i] = item_type
+            code = '[_type_%s(x) for x in value.split(",")]' % i
+        elif converter is not None:
+            context["_convert_%s" % i] = converter
+            code = "_convert_%s(value)" % i
+        else:
+            code = "value"
+        lines.append("        value = row[%s]" % i)
+        lines.append("        model.%s = None if value == 'None' else %s" % (key, code))
+    lines.append("        append(model)")
+    lines.append("    return result")
+    exec(compile("\n".join(lines), "<%s.parse_rows>" % model_class.__name__, "exec"), context)
+    return context["parse_rows"]
+
+
+def _get_generated(cache, generator, model_class):
+    """ Return cached generated function, it is regenerated after model_class.compile()."""
+    cached = cache.get(model_class)
+    if cached is None or cached[0] is not model_class._converters:
+        cached = (model_class._converters, generator(model_class))
+        cache[model_class] = cached
+    return cached[1]
+
+
+def get_formatter(model_class):
+    """ Return function formatting a list of models of model_class to lines."""
+    return _get_generated(_formatters, _generate_formatter, model_class)
+
+
+def get_parser(model_class):
+    """ Return function creating models of model_class from lists of field values."""
+    return _get_generated(_parsers, _generate_parser, model_class)
+
+
+def _iter_chunks(items, chunksize):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def dump_many(models, fh, chunksize=10000, level=None, threads=None):
+    """ Write models as tab-delimited lines, the same as str(model).
+    Models are formatted by chunks with precomputed formatters of their classes
+    and each chunk is written at once.
+    :param fh: file object (text or binary) or file name, archives are written with WiseOpener
+    :param level: compression level for archives
+    :param threads: number of compression threads for archives
+    :return: number of written models
+    """
+    if isinstance(fh, str):
+        with WiseOpener(fh, "w", level=level, threads=threads) as output:
+            return dump_many(models, output, chunksize=chunksize)
+    binary = not isinstance(fh, io.TextIOBase)
+    n = 0
+    for chunk in _iter_chunks(models, chunksize):
+        lines = []
+        for model_class, group in itertools.groupby(chunk, type):
+            lines.extend(get_formatter(model_class)(list(group)))
+        if binary:
+            fh.write("".join(lines).encode("utf-8"))
+        else:
+            fh.writelines(lines)
+        n += len(lines)
+    return n
+
+
+def load_many(fh, model_class, chunksize=10000):
+    """ Yield models of model_class from tab-delimited lines.
+    Lines are read and decoded by chunks, empty lines are skipped.
+    :param fh: file object (text or binary) or file name, archives are read with WiseOpener
+    """
+    if isinstance(fh, str):
+        with WiseOpener(fh) as source:
+            for model in load_many(source, model_class, chunksize=chunksize):
+                yield model
+        return
+    binary = not isinstance(fh, io.TextIOBase)
+    parse_rows = get_parser(model_class)
+    for chunk in _iter_chunks(fh, chunksize):
+        if binary:
+            text = b"".join(chunk).decode("utf-8")
+        else:
+            text = "".join(chunk)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        rows = [line.split("\t") for line in text.split("\n") if line]
+        for model in parse_rows(rows):
+            yield model
+
+
+BINARY_MAGIC = b"PYEXPBIN"
+BINARY_VERSION = 1
+_UINT32 = struct.Struct("<I")
+_ITEM_CODES = {"int": "q", "float": "d"}
+
+
+def get_schema(model_class):
+    """ Return list of [field, kind, item kind] for dumpable attributes of model_class.
+    Kinds are "int", "float", "str" and "list" with items "int", "float" or "str".
+    """
+    schema = []
+    for key in model_class.dumpable_attributes:
+        converter = model_class._converters.get(key)
+        item = None
+        if converter is int:
+            kind = "int"
+        elif converter is float:
+            kind = "float"
+        elif converter is not None:
+            kind = "list"
+            item_type = model_class.list_attributes_types.get(key)
+            item = "int" if item_type is int else "float" if item_type is float else "str"
+        else:
+            kind = "str"
+        schema.append([key, kind, item])
+    return schema
+
+
+def _get_init_lines(model_class, fields, context):
+    """ Return code lines creating model object without __init__ call
+    or None if model has custom __init__ or __setattr__."""
+    defaults = {}
+    for attr in model_class.int_attributes:
+        defaults[attr] = 0
+    for attr in model_class.float_attributes:
+        defaults[attr] = 0.0
+    for attr in model_class.other_attributes:
+        defaults[attr] = model_class.other_attributes[attr]
+    if model_class.__init__ is not AbstractModel.__init__ \
+            or model_class.__setattr__ is not object.__setattr__ \
+            or not all(_is_identifier(key) for key in fields) \
+            or not all(_is_identifier(key) for key in defaults):
+        return None
+    context["_class"] = model_class
+    context["_new"] = object.__new__
+    lines = ["model = _new(_class)"]
+    for attr, value in defaults.items():
+        if attr in fields:
+            continue
+        context["_default_%s" % attr] = value
+        lines.append("model.%s = _default_%s" % (attr, attr))
+    return lines
+
+
+class _BinaryLayout(object):
+    """ Record layout computed from schema with generated encoder and decoder.
+
+    Record is a fixed part packed with one struct: uint32 size of the rest of record,
+    null bitmap as uint64 words, int64 and double fields, uint32 lengths of strings and lists;
+    then utf-8 strings and lists data, items of str lists are prefixed with uint32 length.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fields = [field for field, kind, item in schema]
+        self.n_words = (len(schema) + 63) // 64
+        self.numeric = [i for i, (field, kind, item) in enumerate(schema) if kind in ("int", "float")]
+        self.variable = [i for i, (field, kind, item) in enumerate(schema) if not kind in ("int", "float")]
+        self.fixed = struct.Struct("<I" + "Q" * self.n_words
+                                   + "".join(_ITEM_CODES[schema[i][1]] for i in self.numeric)
+                                   + "I" * len(self.variable))
+        self.encode = self._generate_encoder()
+
+    def _get_context(self):
+        return {"_fixed": self.fixed, "_uint32": _UINT32, "_pack": struct.pack,
+                "_unpack_from": struct.unpack_from, "_join": b"".join}
+
+    def _generate_encoder(self):
+        """ Generate function returning record for a list of field values."""
+        lines = ["def encode(values):",
+                 "    %s, = values" % ", ".join("value_%s" % i for i in range(len(self.schema)))]
+        for word in range(self.n_words):
+            bits = ["(value_%s is None) << %s" % (i, i % 64)
+                    for i in range(word * 64, min(len(self.schema), (word + 1) * 64))]
+            lines.append("    null_%s = %s" % (word, " | ".join(bits)))
+        fixed = ["null_%s" % word for word in range(self.n_words)]
+        for i in self.numeric:
+            fixed.append("0 if value_%s is None else value_%s" % (i, i))
+        parts = []
+        for i in self.variable:
+            field, kind, item = self.schema[i]
+            if kind == "str":
+                lines.append('    data_%s = b"" if value_%s is None else str(value_%s).encode("utf-8")' % (i, i, i))
+                fixed.append("len(data_%s)" % i)
+            elif item in _ITEM_CODES:
+                lines.append("    if value_%s is None:" % i)
+                lines.append("        value_%s = ()" % i)
+                lines.append('    data_%s = _pack("<%%s%s" %% len(value_%s), *value_%s)' % (i, _ITEM_CODES[item], i, i))
+                fixed.append("len(value_%s)" % i)
+            else:
+                lines.append("    if value_%s is None:" % i)
+                lines.append("        value_%s = ()" % i)
+                lines.append('    items_%s = [str(x).encode("utf-8") for x in value_%s]' % (i, i))
+                lines.append("    data_%s = _join([_uint32.pack(len(x)) + x for x in items_%s])" % (i, i))
+                fixed.append("len(value_%s)" % i)
+            parts.append("data_%s" % i)
+        size = " + ".join(["%s" % (self.fixed.size - 4)] + ["len(%s)" % x for x in parts])
+        lines.append("    return _join([_fixed.pack(%s, %s)%s])" % (size, ", ".join(fixed), "".join(", " + x for x in parts)))
+        context = self._get_context()
+        exec(compile("\n".join(lines), "<binary encoder>", "exec"), context)
+        return context["encode"]
+
+    def generate_decoder(self, model_class=None):
+        """ Generate function returning model (or list of values without model_class)
+        for record starting at start of data.
+        Items of str lists are converted with list_attributes_types of model_class.
+        """
+        context = self._get_context()
+        names = ["size"] + ["null_%s" % word for word in range(self.n_words)]
+        names += ["value_%s" % i for i in self.numeric]
+        names += ["size_%s" % i for i in self.variable]
+        lines = ["def decode(data, start):",
+                 "    %s, = _fixed.unpack_from(data, start)" % ", ".join(names),
+                 "    pos = start + %s" % self.fixed.size]
+        for i in self.variable:
+            field, kind, item = self.schema[i]
+            if kind == "str":
+                lines.append('    value_%s = data[pos:pos + size_%s].decode("utf-8")' % (i, i))
+                lines.append("    pos += size_%s" % i)
+            elif item in _ITEM_CODES:
+                lines.append('    value_%s = list(_unpack_from("<%%s%s" %% size_%s, data, pos))' % (i, _ITEM_CODES[item], i))
+                lines.append("    pos += %s * size_%s" % (struct.calcsize(_ITEM_CODES[item]), i))
+            else:
+                lines.append("    value_%s = []" % i)
+                lines.append("    for j in range(size_%s):" % i)
+                lines.append("        size = _uint32.unpack_from(data, pos)[0]")
+                lines.append('        value_%s.append(data[pos + 4:pos + 4 + size].decode("utf-8"))' % i)
+                lines.append("        pos += 4 + size")
+                item_type = None if model_class is None else model_class.list_attributes_types.get(field)
+                if item_type is not None and item_type is not str:
+                    context["_type_%s" % i] = item_type
+                    lines.append("    value_%s = [_type_%s(x) for x in value_%s]" % (i, i, i))
+        for word in range(self.n_words):
+            lines.append("    if null_%s:" % word)
+            for i in range(word * 64, min(len(self.schema), (word + 1) * 64)):
+                lines.append("        if null_%s >> %s & 1:" % (word, i % 64))
+                lines.append("            value_%s = None" % i)
+        values = ", ".join("value_%s" % i for i in range(len(self.schema)))
+        init_lines = None
+        if model_class is not None:
+            init_lines = _get_init_lines(model_class, self.fields, context)
+        if model_class is None:
+            lines.append("    return [%s]" % values)
+        elif init_lines is None:
+            context["_class"] = model_class
+            context["_fields"] = self.fields
+            lines.append("    model = _class()")
+            lines.append("    for field, value in zip(_fields, [%s]):" % values)
+            lines.append("        setattr(model, field, value)")
+            lines.append("    return model")
+        else:
+            lines.extend("    %s" % line for line in init_lines)
+            for i, field in enumerate(self.fields):
+                lines.append("    model.%s = value_%s" % (field, i))
+            lines.append("    return model")
+        exec(compile("\n".join(lines), "<binary decoder>", "exec"), context)
+        return context["decode"]
+
+
+class BinaryModelWriter(object):
+    """ Streaming writer of models in binary format.
+    File names are opened with WiseOpener, so archive suffixes enable compression.
+
+    >>> with BinaryModelWriter("repeats.pyexp.zst", RepeatModel, level=3) as writer:
+    ...     writer.write_many(models)
+    """
+
+    def __init__(self, fh, model_class, level=None, threads=None, buffer_size=1024 ** 2):
+        self.model_class = model_class
+        self.layout = _BinaryLayout(get_schema(model_class))
+        self._get_values = operator.attrgetter(*self.layout.fields)
+        if len(self.layout.fields) == 1:
+            getter = self._get_values
+            self._get_values = lambda model: (getter(model),)
+        self.buffer_size = buffer_size
+        self.n = 0
+        self._buffer = bytearray()
+        self._opener = None
+        if isinstance(fh, str):
+            self._opener = WiseOpener(fh, "wb", level=level, threads=threads)
+            fh = self._opener.__enter__()
+        self.fh = fh
+        header = json.dumps({
+            "version": BINARY_VERSION,
+            "model": model_class.__name__,
+            "schema": self.layout.schema,
+        }).encode("utf-8")
+        self.fh.write(BINARY_MAGIC + _UINT32.pack(len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, model):
+        """ Add model, preprocess_data() is called as for str(model)."""
+        model.preprocess_data()
+        self._buffer += self.layout.encode(self._get_values(model))
+        self.n += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, models):
+        """ Add models, they are encoded by chunks."""
+        encode = self.layout.encode
+        get_values = self._get_values
+        for chunk in _iter_chunks(models, 10000):
+            for model in chunk:
+                model.preprocess_data()
+            self._buffer += b"".join([encode(get_values(model)) for model in chunk])
+            self.n += len(chunk)
+            if len(self._buffer) >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.fh.write(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        if self._opener is not None:
+            self._opener.__exit__(None, None, None)
+            self._opener = None
+
+
+class BinaryModelReader(object):
+    """ Streaming reader of models in binary format.
+    Without model_class dictionaries are yielded.
+    Items of str lists are converted with list_attributes_types of model_class.
+
+    >>> with BinaryModelReader("repeats.pyexp.zst", RepeatModel) as reader:
+    ...     for model in reader:
+    ...         print(model.name)
+    """
+
+    def __init__(self, fh, model_class=None, buffer_size=1024 ** 2):
+        self.model_class = model_class
+        self.buffer_size = buffer_size
+        self._opener = None
+        if isinstance(fh, str):
+            self._opener = WiseOpener(fh, "rb")
+            fh = self._opener.__enter__()
+        self.fh = fh
+        head = self._read_exactly(len(BINARY_MAGIC) + _UINT32.size)
+        if head[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+            self.close()
+            raise Exception("Not a binary model file")
+        header = json.loads(self._read_exactly(_UINT32.unpack_from(head, len(BINARY_MAGIC))[0]).decode("utf-8"))
+        if header["version"] > BINARY_VERSION:
+            self.close()
+            raise Exception("Unsupported binary model format version: %s" % header["version"])
+        self.schema = header["schema"]
+        self.model_name = header["model"]
+        self.layout = _BinaryLayout(self.schema)
+        if model_class is not None and list(model_class.dumpable_attributes) != self.layout.fields:
+            self.close()
+            raise Exception("Schema of %s doesn't match model %s" % (self.model_name, model_class.__name__))
+
+    def _read_exactly(self, size):
+        data = self.fh.read(size)
+        if len(data) != size:
+            self.close()
+            raise Exception("Truncated binary model file")
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _iter_records(self, decode):
+        data = b""
+        pos = 0
+        while True:
+            block = self.fh.read(self.buffer_size)
+            if not block:
+                break
+            data = data[pos:] + block
+            pos = 0
+            while pos + 4 <= len(data):
+                size = _UINT32.unpack_from(data, pos)[0]
+                if pos + 4 + size > len(data):
+                    break
+                yield decode(data, pos)
+                pos += 4 + size
+        if pos != len(data):
+            raise Exception("Truncated binary model file")
+
+    def iter_values(self):
+        """ Yield lists of field values."""
+        return self._iter_records(self.layout.generate_decoder())
+
+    def __iter__(self):
+        if self.model_class is None:
+            fields = self.layout.fields
+            for values in self.iter_values():
+                yield dict(zip(fields, values))
+            return
+        for model in self._iter_records(self.layout.generate_decoder(self.model_class)):
+            yield model
+
+    def close(self):
+        if self._opener is not None:
+            self._opener.__exit__(None, None, None)
+            self._opener = None
+
+
+def dump_binary(models, fh, model_class=None, level=None, threads=None):
+    """ Write models to file object or file name in binary format.
+    :param model_class: schema source, class of the first model by default
+    :return: number of written models
+    """
+    models = iter(models)
+    if model_class is None:
+        first = next(models, None)
+        if first is None:
+            raise Exception("Model class is required for empty collection")
+        model_class = type(first)
+        models = itertools.chain([first], models)
+    with BinaryModelWriter(fh, model_class, level=level, threads=threads) as writer:
+        writer.write_many(models)
+    return writer.n
+
+
+def load_binary(fh, model_class=None):
+    """ Yield models (or dictionaries without model_class) from binary file."""
+    with BinaryModelReader(fh, model_class) as reader:
+        for item in reader:
+            yield item
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" Columnar tables of AbstractModel records.
+
+    Int and float attributes are kept in typed arrays (array module),
+    string and list attributes are kept as utf-8 bytes in a single buffer
+    with offsets. Missing values ("None") are marked in a byte mask.
+    If numpy is installed numeric columns are returned as numpy arrays
+    without copying.
+
+    Classes:
+
+    - ModelTable(object)
+
+"""
+import itertools
+from array import array
+from PyExp.abstract_reader import WiseOpener
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INT_TYPECODE = "q"
+FLOAT_TYPECODE = "d"
+_INVERT_MASK = bytes([1, 0]) + bytes(254)
+
+
+class _BytesColumn(object):
+    """ Byte strings in one buffer with offsets."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+
+    def extend(self, values):
+        self.data += b"".join(values)
+        offsets = itertools.accumulate(map(len, values), initial=self.offsets[-1])
+        self.offsets.extend(itertools.islice(offsets, 1, None))
+
+    def get(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_size(self):
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+
+class ModelTable(object):
+    """ Columnar container for records of model_class.
+    Columns are built from model dumpable attributes: int_attributes and
+    float_attributes are numeric columns, other attributes are byte string columns
+    converted to strings or typed lists only in row views.
+
+    >>> table = ModelTable.from_file(RepeatModel, "repeats.tsv.gz")
+    >>> table.sum("length"), table.mean("gc")
+    >>> gc = table.column("gc")
+    >>> rich = table.select(table.filter("gc", lambda x: x > 0.6))
+    >>> model = rich[0]
+    """
+
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.fields = list(model_class.dumpable_attributes)
+        self.kinds = {}
+        self.columns = {}
+        self.masks = {}
+        self._size = 0
+        for field in self.fields:
+            converter = model_class._converters.get(field)
+            if converter is int:
+                self.kinds[field] = "int"
+                self.columns[field] = array(INT_TYPECODE)
+            elif converter is float:
+                self.kinds[field] = "float"
+                self.columns[field] = array(FLOAT_TYPECODE)
+            else:
+                self.kinds[field] = "list" if converter is not None else "str"
+                self.columns[field] = _BytesColumn()
+            self.masks[field] = None
+
+    @classmethod
+    def from_file(cls, model_class, file_name, chunksize=100000):
+        """ Create table and load tab-delimited file of model records."""
+        table = cls(model_class)
+        table.load(file_name, chunksize=chunksize)
+        return table
+
+    def load(self, file_name, chunksize=100000):
+        """ Load tab-delimited file (plain or archive) by chunks of chunksize lines.
+        Empty lines are skipped.
+        """
+        rows = []
+        with WiseOpener(file_name, "rb") as fh:
+            for line in fh:
+                line = line.rstrip(b"\r\n")
+                if not line:
+                    continue
+                rows.append(line.split(b"\t"))
+                if len(rows) == chunksize:
+                    self.append_rows(rows)
+                    rows = []
+        if rows:
+            self.append_rows(rows)
+        return self
+
+    def append_rows(self, rows):
+        """ Add rows, lists of string or bytes field values as in set_with_list().
+        Each column is converted at once for the whole chunk.
+        Columns are extended only after all values were converted,
+        so the table isn't changed if conversion fails.
+        """
+        if not rows:
+            return
+        n_fields = len(self.fields)
+        if any(len(row) != n_fields for row in rows):
+            raise Exception("Wrong number of fields in data.")
+        if isinstance(rows[0][0], str):
+            rows = [[value.encode("utf-8") for value in row] for row in rows]
+        n = len(rows)
+        converted = []
+        for field, values in zip(self.fields, zip(*rows)):
+            kind = self.kinds[field]
+            mask = None
+            if b"None" in values:
+                mask = bytes([value == b"None" for value in values])
+                default = b"0" if kind in ("int", "float") else b""
+                values = [default if missing else value for value, missing in zip(values, mask)]
+            if kind == "int":
+                values = array(INT_TYPECODE, map(int, values))
+            elif kind == "float":
+                values = array(FLOAT_TYPECODE, map(float, values))
+            else:
+                values = list(values)
+            converted.append((field, values, mask))
+        for field, values, mask in converted:
+            if mask is not None:
+                if self.masks[field] is None:
+                    self.masks[field] = bytearray(self._size)
+                self.masks[field] += mask
+            elif self.masks[field] is not None:
+                self.masks[field] += bytes(n)
+            self.columns[field].extend(values)
+        self._size += n
+
+    def append(self, model):
+        """ Add model as its string representation."""
+        self.extend([model])
+
+    def extend(self, models):
+        """ Add models as their string representations."""
+        self.append_rows([str(model).rstrip("\n").split("\t") for model in models])
+
+    def __len__(self):
+        return self._size
+
+    def is_missing(self, field, i):
+        """ Check that value of field in row i is None."""
+        mask = self.masks[field]
+        return mask is not None and mask[i] == 1
+
+    def get_value(self, field, i):
+        """ Return value of field in row i converted as in the model."""
+        if self.is_missing(field, i):
+            return None
+        kind = self.kinds[field]
+        if kind in ("int", "float"):
+            return self.columns[field][i]
+        value = self.columns[field].get(i).decode("utf-8")
+        if kind == "list":
+            if not value:
+                return []
+            return self.model_class._converters[field](value)
+        return value
+
+    def __getitem__(self, i):
+        """ Return row i as a model object."""
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("Row index out of range: %s" % i)
+        model = self.model_class()
+        for field in self.fields:
+            setattr(model, field, self.get_value(field, i))
+        return model
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def column(self, field):
+        """ Return column values.
+        Numeric columns are returned as numpy arrays sharing memory with the table
+        if numpy is installed, otherwise as arrays, missing values are 0 there, see get_mask().
+        Don't add rows while numpy arrays of the table are used.
+        Other columns are returned as lists.
+        """
+        if self.kinds[field] in ("int", "float"):
+            if numpy is not None:
+                return numpy.frombuffer(self.columns[field], dtype=self.columns[field].typecode)
+            return self.columns[field]
+        return [self.get_value(field, i) for i in range(self._size)]
+
+    def get_mask(self, field):
+        """ Return bytearray with 1 for missing values or None if there are no missing values."""
+        return self.masks[field]
+
+    def iter_present(self, field):
+        """ Yield numeric values of field without missing ones."""
+        mask = self.masks[field]
+        if mask is None:
+            return iter(self.columns[field])
+        return itertools.compress(self.columns[field], mask.translate(_INVERT_MASK))
+
+    def count(self, field):
+        """ Return number of not missing values."""
+        mask = self.masks[field]
+        if mask is None:
+            return self._size
+        return self._size - mask.count(1)
+
+    def sum(self, field):
+        """ Return sum of not missing values of numeric field."""
+        if numpy is not None and self.kinds[field] in ("int", "float"):
+            values = self.column(field)
+            if self.masks[field] is not None:
+                values = values[numpy.frombuffer(self.masks[field], dtype=numpy.uint8) == 0]
+            return values.sum().item()
+        return sum(self.iter_present(field))
+
+    def mean(self, field):
+        """ Return mean of not missing values of numeric field or None."""
+        n = self.count(field)
+        if not n:
+            return None
+        return float(self.sum(field)) / n
+
+    def filter(self, field, func):
+        """ Return indices of rows where func(value) is true, missing values are skipped."""
+        if self.kinds[field] in ("int", "float"):
+            values = self.columns[field]
+        else:
+            values = (self.get_value(field, i) for i in range(self._size))
+        mask = self.masks[field]
+        if mask is None:
+            return [i for i, value in enumerate(values) if func(value)]
+        return [i for i, value in enumerate(values) if not mask[i] and func(value)]
+
+    def select(self, indices):
+        """ Return a new table with given rows."""
+        indices = list(indices)
+        table = self.__class__(self.model_class)
+        for field in self.fields:
+            column = self.columns[field]
+            if self.kinds[field] in ("int", "float"):
+                table.columns[field] = array(column.typecode, [column[i] for i in indices])
+            else:
+                table.columns[field].extend([column.get(i) for i in indices])
+            if self.masks[field] is not None:
+                mask = self.masks[field]
+                table.masks[field] = bytearray([mask[i] for i in indices])
+        table._size = len(indices)
+        return table
+
+    def get_size(self):
+        """ Return approximate size of column data in bytes."""
+        size = 0
+        for field in self.fields:
+            column = self.columns[field]
+            if isinstance(column, array):
+                size += column.itemsize * len(column)
+            else:
+                size += column.get_size()
+            if self.masks[field] is not None:
+                size += len(self.masks[field])
+        return size
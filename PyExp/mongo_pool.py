@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" Shared MongoDB clients and batched writes.
+
+    Clients are created by pymongo.MongoClient or by mongo_client_factory
+    if it is set (e.g. mongomock.MongoClient in tests).
+
+    Functions:
+
+    - get_mongo_client(uri=None, **options), client shared in the current process
+    - close_mongo_clients()
+    - iter_batches(items, batch_size)
+    - insert_batch(collection, documents, ordered=False) -> (not inserted indexes, n failed)
+    - mongo_insert_many(collection, documents, batch_size=1000, ordered=False)
+    - mongo_upsert_many(collection, pairs, batch_size=1000, ordered=False)
+
+"""
+import os
+import itertools
+import threading
+try:
+    import pymongo
+except ImportError:
+    pymongo = None
+try:
+    from logbook import Logger
+except:
+    print("Install logbook module")
+
+mongo_logger = Logger('mongo logger')
+
+# set to a callable with MongoClient signature to use other clients
+mongo_client_factory = None
+
+_mongo_clients = {}
+_mongo_clients_lock = threading.Lock()
+
+
+def get_mongo_client(uri=None, **options):
+    """ Return client for uri and options shared in the current process.
+    MongoClient isn't fork-safe, so a new client is created after fork.
+    """
+    key = (uri, tuple(sorted(options.items())))
+    with _mongo_clients_lock:
+        client, pid = _mongo_clients.get(key, (None, None))
+        if client is None or pid != os.getpid():
+            factory = mongo_client_factory
+            if factory is None:
+                if pymongo is None:
+                    raise Exception("Install pymongo module")
+                factory = pymongo.MongoClient
+            client = factory(uri, **options)
+            _mongo_clients[key] = (client, os.getpid())
+        return client
+
+
+def close_mongo_clients():
+    """ Close and forget clients of the current process."""
+    with _mongo_clients_lock:
+        for client, pid in _mongo_clients.values():
+            if pid == os.getpid():
+                client.close()
+        _mongo_clients.clear()
+
+
+def iter_batches(items, batch_size):
+    """ Yield lists of up to batch_size items."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _get_error_details(e):
+    """ Return details of bulk write error or None for other errors."""
+    details = getattr(e, "details", None)
+    if isinstance(details, dict) and "writeErrors" in details:
+        return details
+    return None
+
+
+def insert_batch(collection, documents, ordered=False):
+    """ Insert documents with a single insert_many() call.
+    Ordered insert stops at the first failed document.
+    :return: (indexes of not inserted documents, number of failed documents)
+    """
+    try:
+        collection.insert_many(documents, ordered=ordered)
+        return [], 0
+    except Exception as e:
+        details = _get_error_details(e)
+        if details is None:
+            raise
+        errors = details["writeErrors"]
+        mongo_logger.warning("Failed to insert %s documents: %s" % (len(errors), errors[0].get("errmsg")))
+        failed = sorted(error["index"] for error in errors)
+        if ordered and failed:
+            return list(range(failed[0], len(documents))), len(errors)
+        return failed, len(errors)
+
+
+def mongo_insert_many(collection, documents, batch_size=1000, ordered=False):
+    """ Insert documents with insert_many() by batches.
+    With unordered writes a failed document (e.g. duplicate key) doesn't stop others.
+    :return: {"inserted": n, "failed": n}
+    """
+    report = {"inserted": 0, "failed": 0}
+    for batch in iter_batches(documents, batch_size):
+        not_inserted, n_failed = insert_batch(collection, batch, ordered=ordered)
+        report["inserted"] += len(batch) - len(not_inserted)
+        report["failed"] += n_failed
+        if ordered and n_failed:
+            break
+    return report
+
+
+def _upsert_one_by_one(collection, pairs, ordered, report):
+    """ Replace or insert documents with replace_one() calls."""
+    for key, document in pairs:
+        try:
+            result = collection.replace_one(key, document, upsert=True)
+        except Exception as e:
+            if getattr(e, "details", None) is None:
+                raise
+            report["failed"] += 1
+            mongo_logger.warning("Failed to upsert document: %s" % e)
+            if ordered:
+                break
+            continue
+        report["matched"] += result.matched_count
+        report["modified"] += result.modified_count
+        if result.upserted_id is not None:
+            report["upserted"] += 1
+    return report
+
+
+def mongo_upsert_many(collection, pairs, batch_size=1000, ordered=False):
+    """ Replace or insert documents with bulk_write() by batches.
+    Without pymongo (e.g. with mongomock clients from mongo_client_factory)
+    documents are replaced one by one with replace_one().
+    :param pairs: iterable of (filter, document)
+    :return: {"matched": n, "modified": n, "upserted": n, "failed": n}
+    """
+    report = {"matched": 0, "modified": 0, "upserted": 0, "failed": 0}
+    if pymongo is None:
+        return _upsert_one_by_one(collection, pairs, ordered, report)
+    for batch in iter_batches(pairs, batch_size):
+        requests = [pymongo.ReplaceOne(key, document, upsert=True) for key, document in batch]
+        try:
+            result = collection.bulk_write(requests, ordered=ordered)
+            report["matched"] += result.matched_count
+            report["modified"] += result.modified_count
+            report["upserted"] += result.upserted_count
+        except Exception as e:
+            details = _get_error_details(e)
+            if details is None:
+                raise
+            report["matched"] += details.get("nMatched", 0)
+            report["modified"] += details.get("nModified", 0)
+            report["upserted"] += details.get("nUpserted", 0)
+            report["failed"] += len(details["writeErrors"])
+            mongo_logger.warning("Failed to upsert %s documents: %s" % (len(details["writeErrors"]), details["writeErrors"][0].get("errmsg")))
+            if ordered:
+                break
+    return report
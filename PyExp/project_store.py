@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" Storage backends for ProjectManager.
+
+    Classes:
+
+    - AbstractProjectStore(object)
+    - YamlProjectStore(AbstractProjectStore), a yaml file per project
+    - SQLiteProjectStore(AbstractProjectStore), all projects in a single sqlite file
+
+    Functions:
+
+    - migrate_projects(source_store, target_store)
+
+"""
+import os
+import json
+import sqlite3
+import threading
+from PyExp.yaml_codec import yaml_load
+from PyExp.yaml_codec import yaml_dump
+
+
+class AbstractProjectStore(object):
+    """ Interface for project storage.
+    A project is a dictionary with optional status dictionary (step name -> status).
+    If shared_data is set, loaded data is shared with the store cache and
+    saved data is kept there, so callers must not modify them.
+    """
+
+    shared_data = False
+
+    def exists(self, pid):
+        """ Check project existence."""
+        raise NotImplementedError
+
+    def load(self, pid):
+        """ Return project data or None if project doesn't exist."""
+        raise NotImplementedError
+
+    def save(self, pid, project_data):
+        """ Replace project data."""
+        raise NotImplementedError
+
+    def remove(self, pid):
+        """ Remove project."""
+        raise NotImplementedError
+
+    def get_all_pids(self):
+        """ Return list of project pids."""
+        raise NotImplementedError
+
+    def get_all_projects(self):
+        """ Return list of project file names as it is shown by ProjectManager.get_all_projects()."""
+        return ["%s.yaml" % pid for pid in self.get_all_pids()]
+
+    def update_status(self, pid, step_name, status):
+        """ Update status of one step of existing project."""
+        project_data = self.load(pid)
+        if project_data is None:
+            raise Exception("Project %s doesn't exist" % pid)
+        project_data = dict(project_data)
+        project_data["status"] = dict(project_data.get("status") or {})
+        project_data["status"][step_name] = status
+        self.save(pid, project_data)
+
+    def get_pids_by_status(self, step_name, value, negate=False):
+        """ Return pids of projects with status of step equal to value.
+        With negate flag return projects with other status including absent one,
+        e.g. all projects where step is not finished.
+        """
+        result = []
+        for pid in self.get_all_pids():
+            status = (self.load(pid) or {}).get("status") or {}
+            if (status.get(step_name) == value) != negate:
+                result.append(pid)
+        return result
+
+    def invalidate_cache(self, pid=None):
+        """ Drop cached projects, if the store has cache."""
+        pass
+
+
+class YamlProjectStore(AbstractProjectStore):
+    """ Each project is a yaml file in projects_folder.
+    Project PID is a yaml file name.
+    Parsed project files are cached in process by file path and
+    (inode, mtime, size), see invalidate_cache().
+    Cached data is returned without copying.
+    """
+
+    project_cache = {}
+    shared_data = True
+
+    def __init__(self, projects_folder):
+        self.projects_folder = projects_folder
+
+    def _get_file_path(self, pid):
+        return os.path.join(self.projects_folder, "%s.yaml" % pid)
+
+    def _get_file_stamp(self, file_path):
+        """ Return (inode, mtime, size) of file or None if file doesn't exist."""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return (st.st_ino, getattr(st, "st_mtime_ns", st.st_mtime), st.st_size)
+
+    def exists(self, pid):
+        return os.path.isfile(self._get_file_path(pid))
+
+    def load(self, pid):
+        """ Load project yaml file using the in-process cache.
+        File is parsed again only if its inode, mtime or size were changed.
+        Return cached project data or None if file doesn't exist.
+        """
+        file_path = self._get_file_path(pid)
+        stamp = self._get_file_stamp(file_path)
+        if stamp is None:
+            return None
+        cached = self.project_cache.get(file_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(file_path, "r") as fh:
+            project_data = yaml_load(fh)
+        self.project_cache[file_path] = (stamp, project_data)
+        return project_data
+
+    def save(self, pid, project_data):
+        """ Write project to temporary file and rename it over project file.
+        project_data is kept in the cache.
+        """
+        file_path = self._get_file_path(pid)
+        temp_path = "%s.%s.tmp" % (file_path, os.getpid())
+        with open(temp_path, "w") as fh:
+            yaml_dump(project_data, fh)
+        os.rename(temp_path, file_path)
+        stamp = self._get_file_stamp(file_path)
+        if stamp is not None:
+            self.project_cache[file_path] = (stamp, project_data)
+
+    def remove(self, pid):
+        os.remove(self._get_file_path(pid))
+        self.invalidate_cache(pid)
+
+    def get_all_pids(self):
+        result = []
+        for name in os.listdir(self.projects_folder):
+            if name.endswith(".yaml"):
+                result.append(name[:-len(".yaml")])
+        return result
+
+    def get_all_projects(self):
+        """ Get a list of project file names."""
+        result = []
+        for root, dirs, files in os.walk(self.projects_folder, topdown=False):
+            result.extend(files)
+        return list(set(result))
+
+    def invalidate_cache(self, pid=None):
+        """ Remove project from the in-process cache.
+        Without pid all cached projects are removed.
+        """
+        if pid is None:
+            self.project_cache.clear()
+            return
+        self.project_cache.pop(self._get_file_path(pid), None)
+
+
+class SQLiteProjectStore(AbstractProjectStore):
+    """ All projects are kept in a single sqlite file.
+    Project data without status is saved as json in projects table,
+    each step status is a separate row in status table indexed by (step, value),
+    so status updates and status queries don't touch whole projects.
+    Values are json encoded, not json serializable values are saved as strings.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """ Connection is opened lazily for each thread and reopened in forked processes,
+        sqlite connections can't be shared between threads."""
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            local.connection = sqlite3.connect(self.db_path, timeout=60)
+            local.pid = os.getpid()
+            with local.connection:
+                local.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS projects (pid TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                local.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS status (pid TEXT NOT NULL, step TEXT NOT NULL, value TEXT, "
+                    "PRIMARY KEY (pid, step))")
+                local.connection.execute(
+                    "CREATE INDEX IF NOT EXISTS status_step_value ON status (step, value)")
+        return local.connection
+
+    def _encode(self, value):
+        return json.dumps(value, default=str, sort_keys=True)
+
+    def exists(self, pid):
+        cursor = self.connection.execute("SELECT 1 FROM projects WHERE pid = ?", (pid,))
+        return cursor.fetchone() is not None
+
+    def load(self, pid):
+        cursor = self.connection.execute("SELECT data FROM projects WHERE pid = ?", (pid,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        project_data = json.loads(row[0])
+        project_data["status"] = {}
+        cursor = self.connection.execute("SELECT step, value FROM status WHERE pid = ?", (pid,))
+        for step, value in cursor:
+            project_data["status"][step] = json.loads(value)
+        return project_data
+
+    def save(self, pid, project_data):
+        """ Replace project data and update given step statuses,
+        status rows of other steps are kept."""
+        data = dict(project_data)
+        status = data.pop("status", None) or {}
+        with self.connection as connection:
+            connection.execute("INSERT OR REPLACE INTO projects (pid, data) VALUES (?, ?)",
+                               (pid, self._encode(data)))
+            connection.executemany("INSERT OR REPLACE INTO status (pid, step, value) VALUES (?, ?, ?)",
+                                   [(pid, step, self._encode(value)) for step, value in status.items()])
+
+    def remove(self, pid):
+        with self.connection as connection:
+            connection.execute("DELETE FROM projects WHERE pid = ?", (pid,))
+            connection.execute("DELETE FROM status WHERE pid = ?", (pid,))
+
+    def get_all_pids(self):
+        return [row[0] for row in self.connection.execute("SELECT pid FROM projects ORDER BY pid")]
+
+    def update_status(self, pid, step_name, status):
+        with self.connection as connection:
+            cursor = connection.execute("INSERT OR REPLACE INTO status (pid, step, value) "
+                                        "SELECT pid, ?, ? FROM projects WHERE pid = ?",
+                                        (step_name, self._encode(status), pid))
+            if cursor.rowcount == 0:
+                raise Exception("Project %s doesn't exist" % pid)
+
+    def get_pids_by_status(self, step_name, value, negate=False):
+        if negate:
+            query = ("SELECT pid FROM projects WHERE pid NOT IN "
+                     "(SELECT pid FROM status WHERE step = ? AND value = ?) ORDER BY pid")
+        else:
+            query = "SELECT pid FROM status WHERE step = ? AND value = ? ORDER BY pid"
+        cursor = self.connection.execute(query, (step_name, self._encode(value)))
+        return [row[0] for row in cursor]
+
+    def close(self):
+        """ Close connection of the current thread."""
+        if getattr(self._local, "connection", None) is not None:
+            self._local.connection.close()
+            self._local.connection = None
+
+
+def migrate_projects(source_store, target_store):
+    """ Copy all projects from source store to target store.
+    :return: number of copied projects
+    """
+    n = 0
+    for pid in source_store.get_all_pids():
+        target_store.save(pid, source_store.load(pid))
+        n += 1
+    return n
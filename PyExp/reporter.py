@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" Background reporting to the status server.
+
+    Classes:
+
+    - ServerReporter(object)
+
+    Functions:
+
+    - get_reporter(**kwargs), shared reporter of the current process
+    - flush_reporter(timeout=30), wait for data queued in the current process
+    - send_data(url, data, attempts=3, backoff=1.0, timeout=10), blocking send
+
+"""
+import os
+import time
+import json
+import atexit
+import threading
+from collections import OrderedDict
+try:
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+except ImportError:
+    from urllib import urlencode
+    from urllib2 import urlopen
+try:
+    from logbook import Logger
+except:
+    print("Install logbook module")
+
+reporter_logger = Logger('reporter logger')
+
+
+def _post(url, data, timeout):
+    """ POST form encoded data and return response body."""
+    body = urlencode(data).encode("utf-8")
+    return urlopen(url, body, timeout).read()
+
+
+def send_data(url, data, attempts=3, backoff=1.0, timeout=10):
+    """ Send data to url in the current thread with exponential backoff.
+    :return: True if data was sent
+    """
+    for attempt in range(attempts):
+        try:
+            reporter_logger.info("Sending data to url %s..." % url)
+            response = _post(url, data, timeout)
+            reporter_logger.info("Data sent to url %s with response: %s" % (url, response))
+            return True
+        except Exception as e:
+            reporter_logger.warning("Failed to send data to url %s: %s" % (url, e))
+            if attempt + 1 < attempts:
+                time.sleep(backoff * 2 ** attempt)
+    return False
+
+
+class ServerReporter(object):
+    """ Sends data to server from a background thread, so slow or
+    unreachable server never stalls computation.
+
+    - put() only adds data to a bounded queue, the oldest item is dropped if queue is full
+    - items with the same key are coalesced: a newer item replaces the pending one
+    - with batch_size > 1 items for the same url are sent in one request
+      as json list in "batch" field
+    - failed requests are retried with exponential backoff
+    - pending items are flushed on close() and on exit
+
+    >>> reporter = ServerReporter()
+    >>> reporter.put(url, {"pid": pid, "project": project}, key=pid)
+    >>> reporter.close()
+    """
+
+    def __init__(self, max_queue=10000, batch_size=1, attempts=5, backoff=1.0, max_backoff=60, timeout=10, autostart=True):
+        self.max_queue = max_queue
+        self.batch_size = max(1, batch_size)
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.autostart = autostart
+        self.pid = os.getpid()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._counter = 0
+        self._closing = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def put(self, url, data, key=None):
+        """ Queue data for sending to url.
+        :param key: pending data for the same url and key is replaced
+        """
+        with self._condition:
+            if key is None:
+                self._counter += 1
+                key = ("__item__", self._counter)
+            full_key = (url, key)
+            if full_key in self._pending:
+                self._pending[full_key] = data
+            else:
+                if len(self._pending) >= self.max_queue:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                    reporter_logger.warning("Reporter queue is full, the oldest item is dropped")
+                self._pending[full_key] = data
+            self._condition.notify_all()
+        if self.autostart:
+            self.start()
+
+    def start(self):
+        """ Start sending thread."""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="ServerReporter")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def flush(self, timeout=None):
+        """ Wait until all queued data is sent or dropped.
+        :return: True if the queue is empty
+        """
+        if self._pending:
+            self.start()
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending or self._in_flight:
+                remains = None if end is None else end - time.time()
+                if remains is not None and remains <= 0:
+                    return False
+                self._condition.wait(remains)
+        return True
+
+    def close(self, timeout=30):
+        """ Flush queued data and stop sending thread."""
+        self.flush(timeout)
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        """ Pop up to batch_size pending items for the url of the oldest item."""
+        url = None
+        batch = []
+        for full_key in list(self._pending.keys()):
+            if url is None:
+                url = full_key[0]
+            if full_key[0] != url:
+                continue
+            batch.append(self._pending.pop(full_key))
+            if len(batch) == self.batch_size:
+                break
+        return url, batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closing:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                url, batch = self._next_batch()
+                self._in_flight = len(batch)
+            try:
+                self._send(url, batch)
+            finally:
+                with self._condition:
+                    self._in_flight = 0
+                    self._condition.notify_all()
+
+    def _send(self, url, batch):
+        """ Send batch with exponential backoff."""
+        if len(batch) == 1:
+            data = batch[0]
+        else:
+            data = {"batch": json.dumps(batch, default=str)}
+        for attempt in range(self.attempts):
+            try:
+                response = _post(url, data, self.timeout)
+                reporter_logger.info("Data sent to url %s with response: %s" % (url, response))
+                self.sent += len(batch)
+                return True
+            except Exception as e:
+                reporter_logger.warning("Failed to send data to url %s: %s" % (url, e))
+                if attempt + 1 < self.attempts:
+                    time.sleep(min(self.max_backoff, self.backoff * 2 ** attempt))
+        reporter_logger.error("Data for url %s is dropped after %s attempts" % (url, self.attempts))
+        self.failed += len(batch)
+        return False
+
+
+_reporter = None
+_reporter_lock = threading.Lock()
+
+
+def get_reporter(**kwargs):
+    """ Return reporter shared in the current process.
+    A new reporter is created after fork. Arguments are used only on creation.
+    """
+    global _reporter
+    with _reporter_lock:
+        if _reporter is None or _reporter.pid != os.getpid():
+            _reporter = ServerReporter(**kwargs)
+        return _reporter
+
+
+def flush_reporter(timeout=30):
+    """ Wait until data queued by the reporter of the current process is sent.
+    Use it in worker processes which exit without atexit handlers, e.g. pool workers.
+    :return: True if the queue is empty
+    """
+    reporter = _reporter
+    if reporter is None or reporter.pid != os.getpid():
+        return True
+    return reporter.flush(timeout)
+
+
+@atexit.register
+def _close_reporter():
+    if _reporter is not None and _reporter.pid == os.getpid():
+        _reporter.close()
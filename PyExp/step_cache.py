@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" Content-addressed cache of step results.
+
+    Step key is a hash of step name, core function source and version,
+    step input and fingerprints of project files (settings files and folders).
+    Files created or changed by the step (or only its declared outputs) are kept
+    in the cache and restored when the step with the same key is executed again.
+
+    Classes:
+
+    - StepCache(object)
+
+"""
+import os
+import json
+import time
+import shutil
+import inspect
+import hashlib
+import threading
+try:
+    from logbook import Logger
+except:
+    print("Install logbook module")
+
+cache_logger = Logger('step cache logger')
+
+
+def _hash_file(file_path, block_size=1024 * 1024):
+    """ Return sha1 of file content."""
+    h = hashlib.sha1()
+    with open(file_path, "rb") as fh:
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def _get_cf_id(cf):
+    """ Return identity of core function: name, version attribute and source hash.
+    Set cf.version to invalidate cached results without code changes.
+    """
+    name = "%s.%s" % (getattr(cf, "__module__", None), getattr(cf, "__qualname__", getattr(cf, "__name__", cf)))
+    try:
+        source = inspect.getsource(cf)
+    except (TypeError, OSError):
+        source = name
+    return [name, str(getattr(cf, "version", "")), hashlib.sha1(source.encode("utf-8")).hexdigest()]
+
+
+def _stable_repr(value):
+    """ Json representation of step input, objects are replaced with their class names."""
+    return json.dumps(value, sort_keys=True, default=lambda x: x.__class__.__name__)
+
+
+class StepCache(object):
+    """ Cache of step results in cache_folder limited by max_size bytes,
+    least recently used entries are removed first.
+
+    - fingerprint="stat" uses file size and mtime, fingerprint="content" uses sha1 of file content
+    - with link=True outputs are hard linked instead of copied, don't use it
+      if steps modify outputs in place
+    - if step.outputs (names of settings files and folders) are given
+      only changed files among them are cached
+
+    Each entry is a folder with meta.json (step name, result, output paths)
+    and files/ with output copies. Paths inside project folder are
+    kept relative to it, so projects with the same data share entries.
+
+    >>> cache = StepCache("/data/step_cache", max_size=50 * 1024 ** 3)
+    >>> exp = Experiment(settings, project, manager=manager, step_cache=cache)
+    """
+
+    def __init__(self, cache_folder, max_size=10 * 1024 ** 3, fingerprint="stat", link=False):
+        if not fingerprint in ("stat", "content"):
+            raise Exception("Unknown fingerprint type: %s" % fingerprint)
+        self.cache_folder = os.path.abspath(cache_folder)
+        self.max_size = max_size
+        self.fingerprint = fingerprint
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # total size of entries, it is counted on the first put
+        self._size = None
+        if not os.path.isdir(self.cache_folder):
+            os.makedirs(self.cache_folder)
+
+    ### Keys ###
+
+    def _relative(self, path, settings):
+        base = settings.get("full_path_to")
+        path = os.path.abspath(path)
+        if base:
+            base = os.path.abspath(base)
+            if path.startswith(base + os.sep):
+                return os.path.relpath(path, base)
+        return path
+
+    def _absolute(self, path, settings):
+        if os.path.isabs(path):
+            return path
+        return os.path.join(settings["full_path_to"], path)
+
+    def get_project_files(self, settings):
+        """ Return paths of existing files from settings files and folders."""
+        result = set()
+        for file_path in (settings.get("files") or {}).values():
+            if isinstance(file_path, str) and os.path.isfile(file_path):
+                result.add(os.path.abspath(file_path))
+        for folder in (settings.get("folders") or {}).values():
+            if not isinstance(folder, str) or not os.path.isdir(folder):
+                continue
+            for root, dirs, files in os.walk(folder):
+                if os.path.abspath(root).startswith(self.cache_folder):
+                    dirs[:] = []
+                    continue
+                for name in files:
+                    result.add(os.path.abspath(os.path.join(root, name)))
+        return sorted(result)
+
+    def get_fingerprints(self, settings):
+        """ Return {relative path: fingerprint} for project files."""
+        result = {}
+        for file_path in self.get_project_files(settings):
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            if self.fingerprint == "content":
+                value = [st.st_size, _hash_file(file_path)]
+            else:
+                value = [st.st_size, getattr(st, "st_mtime_ns", st.st_mtime)]
+            result[self._relative(file_path, settings)] = value
+        return result
+
+    def get_key(self, step, settings):
+        """ Return (key, fingerprints) for step.
+        Known outputs of the step from previous runs are not part of the key.
+        """
+        fingerprints = self.get_fingerprints(settings)
+        outputs = set(self._load_outputs(step.name))
+        inputs = sorted((path, value) for path, value in fingerprints.items() if not path in outputs)
+        data = [step.name, _get_cf_id(step.cf), _stable_repr(step.input), inputs]
+        key = hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+        return key, fingerprints
+
+    def _get_outputs_file(self, step_name):
+        name = hashlib.sha1(step_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_folder, "outputs", "%s.json" % name)
+
+    def _load_outputs(self, step_name):
+        file_path = self._get_outputs_file(step_name)
+        if not os.path.isfile(file_path):
+            return []
+        with open(file_path) as fh:
+            return json.load(fh)
+
+    def _save_outputs(self, step_name, outputs):
+        file_path = self._get_outputs_file(step_name)
+        folder = os.path.dirname(file_path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        outputs = sorted(set(self._load_outputs(step_name)) | set(outputs))
+        temp_path = "%s.%s.tmp" % (file_path, threading.current_thread().ident)
+        with open(temp_path, "w") as fh:
+            json.dump(outputs, fh)
+        os.rename(temp_path, file_path)
+
+    ### Entries ###
+
+    def _get_entry_folder(self, key):
+        return os.path.join(self.cache_folder, key[:2], key)
+
+    def get(self, key):
+        """ Return entry meta data or None if key isn't cached.
+        Entry becomes the most recently used one.
+        """
+        meta_file = os.path.join(self._get_entry_folder(key), "meta.json")
+        try:
+            with open(meta_file) as fh:
+                entry = json.load(fh)
+            os.utime(meta_file, None)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def restore(self, key, entry, settings):
+        """ Copy or link cached outputs of entry to project."""
+        folder = os.path.join(self._get_entry_folder(key), "files")
+        for path, name in entry["outputs"]:
+            target = self._absolute(path, settings)
+            target_folder = os.path.dirname(target)
+            if target_folder and not os.path.isdir(target_folder):
+                os.makedirs(target_folder)
+            self._copy(os.path.join(folder, name), target)
+
+    def _copy(self, source, target):
+        """ Copy file with mtime or hard link it if link flag is set."""
+        if os.path.lexists(target):
+            os.remove(target)
+        if self.link:
+            try:
+                os.link(source, target)
+                return
+            except OSError:
+                pass
+        shutil.copy2(source, target)
+
+    def _get_declared_paths(self, step, settings):
+        """ Return absolute paths of step outputs from settings files and folders."""
+        result = []
+        for name in step.outputs:
+            path = (settings.get("files") or {}).get(name) or (settings.get("folders") or {}).get(name)
+            if path is None:
+                raise Exception("Unknown output %s of step %s" % (name, step.name))
+            result.append(os.path.abspath(path))
+        return result
+
+    def _is_declared(self, path, declared):
+        return any(path == x or path.startswith(x + os.sep) for x in declared)
+
+    def put(self, key, step, settings, fingerprints, result):
+        """ Save step result and files created or changed after fingerprints were taken.
+        If step.outputs are given only files among them are saved.
+        :return: True if entry was saved
+        """
+        try:
+            result_json = json.dumps(result)
+        except (TypeError, ValueError):
+            cache_logger.warning("Result of step %s isn't json serializable, it isn't cached" % step.name)
+            return False
+        after = self.get_fingerprints(settings)
+        outputs = sorted(path for path, value in after.items() if fingerprints.get(path) != value)
+        if step.outputs:
+            declared = self._get_declared_paths(step, settings)
+            outputs = [path for path in outputs
+                       if self._is_declared(os.path.abspath(self._absolute(path, settings)), declared)]
+        entry_folder = self._get_entry_folder(key)
+        temp_folder = "%s.%s.tmp" % (entry_folder, threading.current_thread().ident)
+        if os.path.isdir(temp_folder):
+            shutil.rmtree(temp_folder)
+        os.makedirs(os.path.join(temp_folder, "files"))
+        entry = {
+            "step": step.name,
+            "result": json.loads(result_json),
+            "outputs": [],
+            "created": time.time(),
+        }
+        size = 0
+        for i, path in enumerate(outputs):
+            name = str(i)
+            file_path = os.path.join(temp_folder, "files", name)
+            self._copy(self._absolute(path, settings), file_path)
+            size += os.path.getsize(file_path)
+            entry["outputs"].append([path, name])
+        entry["size"] = size
+        with open(os.path.join(temp_folder, "meta.json"), "w") as fh:
+            json.dump(entry, fh)
+        with self._lock:
+            old_size = 0
+            if os.path.isdir(entry_folder):
+                old_size = self._get_entry_size(entry_folder)
+                shutil.rmtree(entry_folder)
+            os.rename(temp_folder, entry_folder)
+            self._save_outputs(step.name, outputs)
+            if self._size is None:
+                self._size = self.get_size()
+            else:
+                self._size += size - old_size
+            if self._size > self.max_size:
+                self.evict()
+        return True
+
+    ### Size management ###
+
+    def _get_entry_size(self, folder):
+        """ Return size of entry output files from its meta.json,
+        files are counted for entries without saved size."""
+        try:
+            with open(os.path.join(folder, "meta.json")) as fh:
+                return json.load(fh)["size"]
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        size = 0
+        for root, dirs, files in os.walk(folder):
+            for file_name in files:
+                size += os.path.getsize(os.path.join(root, file_name))
+        return size
+
+    def _get_entries(self):
+        """ Return list of (last use time, size, folder) for all entries."""
+        result = []
+        for prefix in os.listdir(self.cache_folder):
+            prefix_folder = os.path.join(self.cache_folder, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_folder):
+                continue
+            for name in os.listdir(prefix_folder):
+                folder = os.path.join(prefix_folder, name)
+                meta_file = os.path.join(folder, "meta.json")
+                if name.endswith(".tmp") or not os.path.isfile(meta_file):
+                    continue
+                result.append((os.path.getmtime(meta_file), self._get_entry_size(folder), folder))
+        return result
+
+    def get_size(self):
+        """ Return total size of cached entries in bytes."""
+        return sum(size for mtime, size, folder in self._get_entries())
+
+    def evict(self):
+        """ Remove least recently used entries until cache fits max_size.
+        It is called by put() only when the cache is over max_size.
+        :return: number of removed entries
+        """
+        entries = sorted(self._get_entries())
+        total = sum(size for mtime, size, folder in entries)
+        n = 0
+        for mtime, size, folder in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= size
+            n += 1
+        self._size = total
+        if n:
+            cache_logger.info("Removed %s step cache entries" % n)
+        return n
+
+    def clear(self):
+        """ Remove all entries."""
+        with self._lock:
+            shutil.rmtree(self.cache_folder, ignore_errors=True)
+            os.makedirs(self.cache_folder)
+            self._size = 0
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#@created: 18.10.2026
+#@author: Aleksey Komissarov
+#@contact: ad3002@gmail.com
+""" YAML loading and dumping for configs and projects.
+
+    Safe loader and dumper are used, libyaml backed ones (CSafeLoader, CSafeDumper)
+    are selected if pyyaml was built with libyaml, otherwise pure python ones.
+
+    Functions:
+
+    - yaml_load(stream)
+    - yaml_dump(data, stream=None, **kwargs)
+
+"""
+try:
+    import yaml
+except:
+    print("Install pyyaml module")
+try:
+    from yaml import CSafeLoader as _SafeLoader
+    from yaml import CSafeDumper as _SafeDumper
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+    from yaml import SafeDumper as _SafeDumper
+    LIBYAML = False
+
+
+class ProjectLoader(_SafeLoader):
+    """ Safe loader which also reads python tuple and string tags
+    written by old yaml.dump calls."""
+    pass
+
+
+def _construct_tuple(loader, node):
+    return loader.construct_sequence(node)
+
+
+def _construct_string(loader, node):
+    return loader.construct_scalar(node)
+
+
+ProjectLoader.add_constructor("tag:yaml.org,2002:python/tuple", _construct_tuple)
+ProjectLoader.add_constructor("tag:yaml.org,2002:python/unicode", _construct_string)
+ProjectLoader.add_constructor("tag:yaml.org,2002:python/str", _construct_string)
+
+
+class ProjectDumper(_SafeDumper):
+    """ Safe dumper which writes tuples as lists
+    and other not plain objects (e.g. step results) as strings."""
+    pass
+
+
+def _represent_unknown(dumper, data):
+    """ Represent dict and list subclasses as plain ones, other objects as str(data)."""
+    if isinstance(data, dict):
+        return dumper.represent_dict(data)
+    if isinstance(data, (list, tuple)):
+        return dumper.represent_list(data)
+    return dumper.represent_str(str(data))
+
+
+ProjectDumper.add_representer(tuple, yaml.representer.SafeRepresenter.represent_list)
+ProjectDumper.add_representer(None, _represent_unknown)
+
+
+def yaml_load(stream):
+    """ Load yaml from string or file object."""
+    return yaml.load(stream, Loader=ProjectLoader)
+
+
+def yaml_dump(data, stream=None, **kwargs):
+    """ Dump data to yaml. Without stream return yaml string.
+    Block style is used by default."""
+    kwargs.setdefault("default_flow_style", False)
+    return yaml.dump(data, stream, Dumper=ProjectDumper, **kwargs)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Compare writing and reading of AbstractModel collections
+per object (str(model), set_with_list), in bulk (dump_many, load_many)
+and in binary format (dump_binary, load_binary).
+
+Usage:
+
+    python benchmarks/bench_models.py [repeats]
+"""
+import io
+import sys
+import time
+from PyExp.abstract_model import AbstractModel
+from PyExp.model_io import dump_many
+from PyExp.model_io import load_many
+from PyExp.model_io import dump_binary
+from PyExp.model_io import load_binary
+
+
+class RepeatModel(AbstractModel):
+
+    dumpable_attributes = ["name", "chrm", "start", "end", "gc", "period", "positions", "family"]
+    int_attributes = ["start", "end", "period"]
+    float_attributes = ["gc"]
+    list_attributes = ["positions"]
+    list_attributes_types = {"positions": int}
+
+
+def create_models(n):
+    """ Synthetic repeats."""
+    result = []
+    for i in range(n):
+        model = RepeatModel()
+        model.set_with_list(["repeat_%s" % i, "chr%s" % (i % 20), str(i * 100), str(i * 100 + 171),
+                             str((i % 100) / 100.0), "171", "1,5,%s" % i, "alpha"])
+        result.append(model)
+    return result
+
+
+def measure(f, repeats):
+    start = time.time()
+    for i in range(repeats):
+        f()
+    return (time.time() - start) / repeats
+
+
+def write_per_object(models):
+    fh = io.StringIO()
+    for model in models:
+        fh.write(str(model))
+    return fh.getvalue()
+
+
+def read_per_object(text):
+    result = []
+    for line in io.StringIO(text):
+        model = RepeatModel()
+        model.set_with_list(line.strip().split("\t"))
+        result.append(model)
+    return result
+
+
+def main(repeats):
+    print("models\tstr_save\tbulk_save\tbin_save\tset_load\tbulk_load\tbin_load (ms)")
+    for n in [1000, 10000, 100000]:
+        models = create_models(n)
+        text = write_per_object(models)
+        str_save = measure(lambda: write_per_object(models), repeats)
+        bulk_save = measure(lambda: dump_many(models, io.StringIO()), repeats)
+        bin_save = measure(lambda: dump_binary(models, io.BytesIO()), repeats)
+        data = io.BytesIO()
+        dump_binary(models, data)
+        data = data.getvalue()
+        set_load = measure(lambda: read_per_object(text), repeats)
+        bulk_load = measure(lambda: list(load_many(io.StringIO(text), RepeatModel)), repeats)
+        bin_load = measure(lambda: list(load_binary(io.BytesIO(data), RepeatModel)), repeats)
+        print("%s\t%.2f\t%.2f\t%.2f\t%.2f\t%.2f\t%.2f" % (n,
+                                                        str_save * 1000,
+                                                        bulk_save * 1000,
+                                                        bin_save * 1000,
+                                                        set_load * 1000,
+                                                        bulk_load * 1000,
+                                                        bin_load * 1000))
+
+
+if __name__ == '__main__':
+    repeats = 5
+    if len(sys.argv) > 1:
+        repeats = int(sys.argv[1])
+    main(repeats)
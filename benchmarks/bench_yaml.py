@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Compare load and save throughput of project yaml files
+with pure python and libyaml backed safe loader/dumper.
+
+Usage:
+
+    python benchmarks/bench_yaml.py [repeats]
+"""
+import sys
+import time
+import yaml
+from PyExp.yaml_codec import yaml_load
+from PyExp.yaml_codec import yaml_dump
+from PyExp.yaml_codec import LIBYAML
+
+
+def create_project(n_steps):
+    """ Synthetic project with n_steps entries in status block."""
+    project = {
+        "pid": "project_%s" % n_steps,
+        "path_to": "data/project_%s" % n_steps,
+        "description": "synthetic project",
+        "status": {},
+    }
+    for i in range(n_steps):
+        project["status"]["step_%s" % i] = "ok" if i % 3 else {"result": i, "files": ["a.txt", "b.txt"]}
+    return project
+
+
+def measure(f, repeats):
+    start = time.time()
+    for i in range(repeats):
+        f()
+    return (time.time() - start) / repeats
+
+
+def main(repeats):
+    print("libyaml available: %s" % LIBYAML)
+    print("steps\tkb\tpy_load\tc_load\tpy_save\tc_save (ms per project)")
+    for n_steps in [10, 100, 1000, 10000]:
+        project = create_project(n_steps)
+        text = yaml_dump(project)
+        py_load = measure(lambda: yaml.load(text, Loader=yaml.SafeLoader), repeats)
+        c_load = measure(lambda: yaml_load(text), repeats)
+        py_save = measure(lambda: yaml.dump(project, Dumper=yaml.SafeDumper, default_flow_style=False), repeats)
+        c_save = measure(lambda: yaml_dump(project), repeats)
+        print("%s\t%s\t%.2f\t%.2f\t%.2f\t%.2f" % (n_steps,
+                                                len(text) // 1024,
+                                                py_load * 1000,
+                                                c_load * 1000,
+                                                py_save * 1000,
+                                                c_save * 1000))
+
+
+if __name__ == '__main__':
+    repeats = 5
+    if len(sys.argv) > 1:
+        repeats = int(sys.argv[1])
+    main(repeats)
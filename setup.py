@@ -24,11 +24,15 @@ setup(
     url='http://github.com/ad3002/PyExp',
     license='BSD',
     description='A microframework for small computational experiments.',
+    python_requires='>=3.8',
     install_requires=[
         'pyyaml >= 3.0',
         'simplejson >= 1.0',
         'logbook >= 0.7',
     ],
+    extras_require={
+        'mongo': ['pymongo >= 3.0'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
@@ -36,6 +40,8 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Topic :: Scientific/Engineering :: Bio-Informatics',
     ],
 )
\ No newline at end of file
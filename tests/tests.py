@@ -1,12 +1,51 @@
-import sys, os
+import sys, os, time
 sys.path.append("/Users/ad3002/Dropbox/workspace")
 sys.path.append("c:/Users/Master/Dropbox/workspace")
 
 import unittest
+import shutil
+import pickle
+import tempfile
+import threading
+import gzip
+import zlib
+import struct
+import io
+import json
+import importlib
+import tracemalloc
+import yaml
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from urlparse import parse_qs
 from PyExp.experiments.abstract_experiment import AbstractStep
 from PyExp.experiments.abstract_experiment import AbstractExperimentSettings
 from PyExp.experiments.abstract_experiment import AbstractExperiment
+from PyExp.experiments.abstract_experiment import ProcessRunner
 from PyExp.managers.abstract_manager import ProjectManager, ProjectManagerException
+from PyExp import yaml_codec
+from PyExp.project_store import YamlProjectStore, SQLiteProjectStore, migrate_projects
+from PyExp.reporter import ServerReporter, get_reporter, flush_reporter
+from PyExp.step_cache import StepCache
+from PyExp.abstract_reader import AbstractFileIO, WiseOpener, external_sort, get_line_chunks, get_compression
+from PyExp.abstract_reader import MappedFile, AbstractFolderIO
+from PyExp.abstract_reader import sc_process_folder, sc_process_folder_to_other, sc_process_folder_online
+from PyExp.abstract_reader import sc_copy_files, sc_move_files, copy_file
+from PyExp.line_index import LineIndex
+from PyExp.abstract_model import AbstractModel, compile_model
+from PyExp.model_table import ModelTable
+from PyExp.model_io import dump_many, load_many
+from PyExp.model_io import dump_binary, load_binary, BinaryModelWriter, BinaryModelReader
+from PyExp.abstract_model import AbstractMongoModel
+from PyExp import mongo_pool
+from PyExp.app import _pop_jobs_option
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
 
 STEPS = [
             {
@@ -43,6 +82,304 @@ STEPS = [
             },
         ]
 
+
+def parallel_step(settings, project):
+    if project["pid"] == "broken_project":
+        raise ValueError("broken project")
+    return "ok"
+
+
+PARALLEL_STEPS = [
+            {
+                'stage': "Parallel Stage",
+                'name': "step_parallel",
+                'cf': parallel_step,
+                'check': None,
+            },
+        ]
+
+
+DAG_TIMES = []
+
+
+def sleep_step(settings, project):
+    start = time.time()
+    time.sleep(0.3)
+    DAG_TIMES.append((start, time.time()))
+    return "ok"
+
+
+DAG_STEPS = [
+            {'name': "annotate_a", 'cf': sleep_step, 'check': None},
+            {'name': "annotate_b", 'cf': sleep_step, 'check': None},
+            {'name': "annotate_c", 'cf': sleep_step, 'check': None, 'cost': 2},
+            {'name': "report", 'cf': sleep_step, 'check': None, 'pre': ["annotate_a", "annotate_b"],
+             'requires': ["annotate_c"]},
+            {'name': "cycle_a", 'cf': sleep_step, 'check': None, 'pre': "cycle_b"},
+            {'name': "cycle_b", 'cf': sleep_step, 'check': None, 'pre': "cycle_a"},
+        ]
+
+
+CACHED_CALLS = []
+
+
+def write_step(settings, project):
+    CACHED_CALLS.append(project["pid"])
+    with open(settings["files"]["test_file"], "w") as fh:
+        fh.write("result of %s\n" % project["pid"])
+    return "ok"
+
+
+def write_and_sleep(file_path, text):
+    start = time.time()
+    folder = os.path.dirname(file_path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(file_path, "w") as fh:
+        fh.write(text)
+    time.sleep(0.2)
+    DAG_TIMES.append((start, time.time()))
+
+
+def write_a_step(settings, project):
+    write_and_sleep(settings["files"]["test_file"], "a\n")
+    return "ok"
+
+
+def write_b_step(settings, project):
+    write_and_sleep(os.path.join(settings["folders"]["test_folder"], "b.txt"), "b\n")
+    return "ok"
+
+
+CACHED_STEPS = [
+            {'name': "write_test_file", 'cf': write_step, 'check': None},
+            {'name': "write_a", 'cf': write_a_step, 'check': None},
+            {'name': "write_b", 'cf': write_b_step, 'check': None},
+            {'name': "write_a_declared", 'cf': write_a_step, 'check': None, 'outputs': ["test_file"]},
+            {'name': "write_b_declared", 'cf': write_b_step, 'check': None, 'outputs': ["test_folder"]},
+        ]
+
+
+def line_stats(line, column=0):
+    return (os.getpid(), line.split("\t")[column])
+
+
+def upper_text(text, name=None, suffix=""):
+    if name.startswith("broken"):
+        raise ValueError("broken file")
+    return text.decode("utf-8").upper() + suffix
+
+
+def upper_lines(lines, name=None):
+    for line in lines:
+        yield line.upper()
+
+
+def count_chunks(chunks, name=None):
+    n = 0
+    for chunk in chunks:
+        n += 1
+    yield "%s\n" % n
+
+
+class RepeatModel(AbstractModel):
+
+    dumpable_attributes = ["name", "start", "gc", "positions", "note"]
+    int_attributes = ["start"]
+    float_attributes = ["gc"]
+    list_attributes = ["positions"]
+    list_attributes_types = {"positions": int}
+
+
+SlottedRepeatModel = compile_model(RepeatModel, name="SlottedRepeatModel")
+
+
+class CompactRepeatModel(AbstractModel):
+
+    dumpable_attributes = ["name", "start", "gc", "positions", "note"]
+    int_attributes = ["start"]
+    float_attributes = ["gc"]
+    list_attributes = ["positions"]
+    list_attributes_types = {"positions": int}
+    use_slots = True
+
+
+class CustomStrModel(SlottedRepeatModel):
+
+    def __str__(self):
+        return "custom"
+
+
+class PreprocessedModel(RepeatModel):
+
+    def preprocess_data(self):
+        self.name = self.name.upper()
+
+
+class InitModel(RepeatModel):
+
+    def __init__(self):
+        super(InitModel, self).__init__()
+        self.loaded = True
+
+
+class ShortModel(RepeatModel):
+
+    def __init__(self):
+        super(ShortModel, self).__init__()
+        self.dumpable_attributes = ["name", "start", "note"]
+        self.int_attributes = ["start", "note"]
+
+
+class LateModel(AbstractModel):
+
+    dumpable_attributes = ["name", "start"]
+
+
+class LateChildModel(LateModel):
+    pass
+
+
+LateModel.int_attributes = ["start"]
+
+
+class TaggedModel(AbstractModel):
+
+    dumpable_attributes = ["name", "tags", "scores", "start"]
+    int_attributes = ["start"]
+    list_attributes = ["tags", "scores"]
+    list_attributes_types = {"tags": str, "scores": float}
+
+
+class MongoRepeatModel(AbstractMongoModel):
+
+    dumpable_attributes = ["name", "start", "positions"]
+    int_attributes = ["start"]
+    list_attributes = ["positions"]
+    list_attributes_types = {"positions": int}
+    mongo_db = "test"
+    mongo_collection = "repeats"
+    mongo_key_attributes = ["name"]
+
+
+class WriteResult(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class RecordingCollection(object):
+    """ In-memory collection recording insert_many() batches, documents with duplicated name fail.
+    Queries support only equality and $gte.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.documents = []
+        self.n_ids = 0
+
+    def _match(self, document, query):
+        for key, value in query.items():
+            if isinstance(value, dict):
+                if key not in document or document[key] < value["$gte"]:
+                    return False
+            elif document.get(key) != value:
+                return False
+        return True
+
+    def _find(self, query):
+        return [document for document in self.documents if self._match(document, query)]
+
+    def _insert(self, document):
+        if "_id" not in document:
+            self.n_ids += 1
+            document["_id"] = self.n_ids
+        if self._find({"name": document["name"]}):
+            e = Exception("duplicate key")
+            e.details = {"errmsg": "duplicate key"}
+            raise e
+        self.documents.append(dict(document))
+
+    def insert_one(self, document):
+        self._insert(document)
+        return WriteResult(inserted_id=document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        self.batches.append((len(documents), ordered))
+        errors = []
+        for i, document in enumerate(documents):
+            try:
+                self._insert(document)
+            except Exception as e:
+                errors.append({"index": i, "errmsg": e.details["errmsg"]})
+                if ordered:
+                    break
+        if errors:
+            e = Exception("bulk write error")
+            e.details = {"writeErrors": errors}
+            raise e
+        return WriteResult(inserted_ids=[document["_id"] for document in documents])
+
+    def find_one(self, query):
+        found = self._find(query)
+        return dict(found[0]) if found else None
+
+    def find(self, query, batch_size=None):
+        return [dict(document) for document in self._find(query)]
+
+    def count_documents(self, query):
+        return len(self._find(query))
+
+    def replace_one(self, query, document, upsert=False):
+        found = self._find(query)
+        if found:
+            modified = int(any(found[0].get(key) != value for key, value in document.items()))
+            document = dict(document, _id=found[0]["_id"])
+            self.documents[self.documents.index(found[0])] = document
+            return WriteResult(matched_count=1, modified_count=modified, upserted_id=None)
+        if not upsert:
+            return WriteResult(matched_count=0, modified_count=0, upserted_id=None)
+        document = dict(document)
+        self._insert(document)
+        return WriteResult(matched_count=0, modified_count=0, upserted_id=document["_id"])
+
+    def update_one(self, query, update):
+        found = self._find(query)
+        if not found:
+            return WriteResult(matched_count=0, modified_count=0)
+        modified = int(any(found[0].get(key) != value for key, value in update["$set"].items()))
+        found[0].update(update["$set"])
+        return WriteResult(matched_count=1, modified_count=modified)
+
+    def delete_one(self, query):
+        found = self._find(query)
+        if found:
+            self.documents.remove(found[0])
+        return WriteResult(deleted_count=len(found[:1]))
+
+
+class RecordingDatabase(object):
+
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, RecordingCollection())
+
+
+class RecordingClient(object):
+    """ Client with RecordingCollection collections."""
+
+    def __init__(self, uri=None, **options):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, RecordingDatabase())
+
+    def close(self):
+        pass
+
+
 class TestExperiment(AbstractExperiment):
     def init_steps(self):
         self.all_steps = STEPS
@@ -260,6 +597,1293 @@ class AbstractExperimentTest(unittest.TestCase):
     def test_execution(self):
         pass
 
-      
+
+class ParallelExperiment(AbstractExperiment):
+    def init_steps(self):
+        self.all_steps = PARALLEL_STEPS
+
+
+def create_test_manager(folder):
+    config_path = os.path.join(folder, "config.yaml")
+    with open(config_path, "w") as fh:
+        fh.write("projects_folder: %s\n" % os.path.join(folder, "projects"))
+        fh.write("path_work_folder: %s\n" % os.path.join(folder, "data"))
+    return ProjectManager(TestExperimentSettings(), config_path=config_path)
+
+
+class ManagerTestCase(unittest.TestCase):
+    """ Test case with a project manager in a temporary folder."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.manager = create_test_manager(self.folder)
+
+    def tearDown(self):
+        self.manager.invalidate_cache()
+        shutil.rmtree(self.folder)
+
+
+class ParallelExecutionTest(ManagerTestCase):
+
+    def setUp(self):
+        super(ParallelExecutionTest, self).setUp()
+        self.pids = ["project_a", "broken_project", "project_b"]
+        for pid in self.pids:
+            self.manager.add_project(pid, {"pid": pid, "path_to": pid})
+
+    def test_execute_parallel(self):
+        project, settings = self.manager.get_project("project_a")
+        exp = ParallelExperiment(settings, project, manager=self.manager)
+        exp.add_step(exp.build_step(exp.find_step("step_parallel")))
+        result = exp.execute_parallel(threads=2, pids=self.pids)
+        self.assertEqual(sorted(result["finished"]), ["project_a", "project_b"])
+        self.assertEqual(list(result["failed"]), ["broken_project"])
+        self.assertTrue("broken project" in result["failed"]["broken_project"])
+        self.assertEqual(result["finished"]["project_b"]["step_parallel"], "ok")
+        project, settings = self.manager.get_project("project_b")
+        self.assertEqual(project["status"]["step_parallel"], "ok")
+
+
+class DagExperiment(AbstractExperiment):
+    def init_steps(self):
+        self.all_steps = DAG_STEPS
+
+
+class NoInitExperiment(DagExperiment):
+    """ Experiment which doesn't call AbstractExperiment.__init__."""
+
+    def __init__(self, settings, project, manager):
+        self.settings = settings
+        self.project = project
+        self.pid = project["pid"]
+        self.manager = manager
+        self.name = "no init"
+        self.logger = None
+        self.force = False
+        self.sp = 0
+        self.sid2step = {}
+        self.init_steps()
+
+
+class DagExecutionTest(ManagerTestCase):
+
+    def setUp(self):
+        super(DagExecutionTest, self).setUp()
+        self.manager.add_project("dag", {"pid": "dag", "path_to": "dag"})
+        project, settings = self.manager.get_project("dag")
+        self.exp = DagExperiment(settings, project, manager=self.manager)
+        del DAG_TIMES[:]
+
+    def test_execute_dag(self):
+        for name in ["annotate_a", "annotate_b", "annotate_c", "report"]:
+            self.exp.add_step(self.exp.build_step(self.exp.find_step(name)))
+        self.assertEqual(self.exp.get_steps_graph(), {0: [], 1: [], 2: [], 3: [2, 0, 1]})
+        result = self.exp.execute_dag(workers=3, slots=4)
+        times = sorted(DAG_TIMES)
+        annotations, report = times[:3], times[3]
+        self.assertTrue(max(x[0] for x in annotations) < min(x[1] for x in annotations))
+        self.assertTrue(report[0] >= max(x[1] for x in annotations))
+        self.assertEqual(len(result["steps"]), 2)
+        self.assertEqual(result["steps"][-1], "report")
+        self.assertTrue(result["elapsed"] >= 0.6)
+        project, settings = self.manager.get_project("dag")
+        for name in ["annotate_a", "annotate_b", "annotate_c", "report"]:
+            self.assertEqual(project["status"][name], "ok")
+
+    def test_execute_dag_sqlite(self):
+        store = SQLiteProjectStore(os.path.join(self.folder, "projects.db"))
+        manager = ProjectManager(TestExperimentSettings(), config_path=self.manager.config_path, store=store)
+        manager.add_project("dag", {"pid": "dag", "path_to": "dag"})
+        project, settings = manager.get_project("dag")
+        exp = DagExperiment(settings, project, manager=manager)
+        for name in ["annotate_a", "annotate_b", "annotate_c", "report"]:
+            exp.add_step(exp.build_step(exp.find_step(name)))
+        exp.execute_dag(workers=3)
+        self.assertEqual(manager.get_pids_by_status("report", "ok"), ["dag"])
+        store.close()
+
+    def test_without_init(self):
+        exp = NoInitExperiment(self.exp.settings, self.exp.project, self.manager)
+        exp.add_step(exp.build_step(exp.find_step("annotate_a")))
+        exp.execute()
+        project, settings = self.manager.get_project("dag")
+        self.assertEqual(project["status"]["annotate_a"], "ok")
+
+    def test_status_saving(self):
+        saves = []
+        save = self.manager.store.save
+        self.manager.store.save = lambda pid, data: saves.append(pid) or save(pid, data)
+        self.exp.add_step(self.exp.build_step(self.exp.find_step("annotate_a")))
+        self.exp.execute()
+        self.assertEqual(saves, ["dag"])
+        self.exp.project["status"]["custom"] = "edited"
+        self.exp.logger_update_project("dag", self.exp.project)
+        project, settings = self.manager.get_project("dag")
+        self.assertEqual(project["status"], {"annotate_a": "ok", "custom": "edited"})
+
+    def test_cycle(self):
+        for name in ["cycle_a", "cycle_b"]:
+            self.exp.add_step(self.exp.build_step(self.exp.find_step(name)))
+        self.assertRaises(Exception, self.exp.execute_dag)
+
+
+class CachedExperiment(AbstractExperiment):
+    def init_steps(self):
+        self.all_steps = CACHED_STEPS
+
+
+class StepCacheTest(ManagerTestCase):
+
+    def setUp(self):
+        super(StepCacheTest, self).setUp()
+        self.manager.add_project("cached", {"pid": "cached", "path_to": "cached"}, init=True)
+        self.cache = StepCache(os.path.join(self.folder, "cache"))
+        del CACHED_CALLS[:]
+
+    def execute(self):
+        project, settings = self.manager.get_project("cached")
+        exp = CachedExperiment(settings, project, manager=self.manager, step_cache=self.cache)
+        exp.add_step(exp.build_step(exp.find_step("write_test_file")))
+        exp.execute()
+        return settings["files"]["test_file"]
+
+    def test_restore(self):
+        file_path = self.execute()
+        self.assertEqual(CACHED_CALLS, ["cached"])
+        os.remove(file_path)
+        self.execute()
+        self.assertEqual(CACHED_CALLS, ["cached"])
+        self.assertEqual(self.cache.hits, 1)
+        with open(file_path) as fh:
+            self.assertEqual(fh.read(), "result of cached\n")
+        project, settings = self.manager.get_project("cached")
+        self.assertEqual(project["status"]["write_test_file"], "ok")
+
+    def test_changed_input(self):
+        file_path = self.execute()
+        folder = os.path.join(os.path.dirname(file_path), "test", "folder")
+        os.makedirs(folder)
+        with open(os.path.join(folder, "input.txt"), "w") as fh:
+            fh.write("new input")
+        self.execute()
+        self.assertEqual(CACHED_CALLS, ["cached", "cached"])
+
+    def test_eviction(self):
+        self.execute()
+        self.assertTrue(self.cache.get_size() > 0)
+        self.cache.max_size = 0
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(self.cache.get_size(), 0)
+
+    def test_put_without_scan(self):
+        self.execute()
+        scans = []
+        get_entries = self.cache._get_entries
+        self.cache._get_entries = lambda: scans.append(1) or get_entries()
+        self.execute_dag(["write_a_declared"])
+        self.assertEqual(scans, [])
+        self.cache.max_size = 0
+        self.execute_dag(["write_b_declared"])
+        self.assertEqual(scans, [1])
+        self.assertEqual(self.cache.get_size(), 0)
+
+    def execute_dag(self, names):
+        project, settings = self.manager.get_project("cached")
+        exp = CachedExperiment(settings, project, manager=self.manager, step_cache=self.cache)
+        for name in names:
+            exp.add_step(exp.build_step(exp.find_step(name)))
+        del DAG_TIMES[:]
+        exp.execute_dag(workers=2)
+        return sorted(DAG_TIMES)
+
+    def get_cached_outputs(self):
+        result = {}
+        for mtime, size, folder in self.cache._get_entries():
+            with open(os.path.join(folder, "meta.json")) as fh:
+                entry = json.load(fh)
+            result[entry["step"]] = [path for path, name in entry["outputs"]]
+        return result
+
+    def test_dag_without_outputs(self):
+        times = self.execute_dag(["write_a", "write_b"])
+        self.assertTrue(times[1][0] >= times[0][1])
+        self.assertEqual(self.get_cached_outputs(), {"write_a": ["test.txt"],
+                                                     "write_b": [os.path.join("test", "folder", "b.txt")]})
+
+    def test_dag_declared_outputs(self):
+        times = self.execute_dag(["write_a_declared", "write_b_declared"])
+        self.assertTrue(times[1][0] < times[0][1])
+        self.assertEqual(self.get_cached_outputs(), {"write_a_declared": ["test.txt"],
+                                                     "write_b_declared": [os.path.join("test", "folder", "b.txt")]})
+
+
+class ConfigTest(ManagerTestCase):
+
+    def test_shared_config(self):
+        manager = self.manager
+        other = ProjectManager(TestExperimentSettings(), config_path=manager.config_path)
+        self.assertEqual(manager.config, other.config)
+        self.assertEqual(pickle.loads(pickle.dumps(manager.config)), manager.config)
+        with open(manager.config_path, "a") as fh:
+            fh.write("foo: bar\n")
+        self.assertFalse("foo" in other.config)
+        other.reload_config()
+        self.assertEqual(other.config["foo"], "bar")
+        manager = ProjectManager(TestExperimentSettings(), config_path=manager.config_path)
+        self.assertEqual(manager.config, other.config)
+
+    def test_changed_config(self):
+        settings = TestExperimentSettings()
+        manager = ProjectManager(settings, config_path=self.manager.config_path)
+        manager.config["url_status_update"] = "http://localhost"
+        manager.config["projects_folder"] = os.path.join(self.folder, "other")
+        self.assertEqual(settings.config["url_status_update"], "http://localhost")
+        self.assertFalse("url_status_update" in self.manager.config)
+        other = ProjectManager(TestExperimentSettings(), config_path=self.manager.config_path)
+        self.assertEqual(other.config, self.manager.config)
+
+
+class ProjectCacheTest(ManagerTestCase):
+
+    def setUp(self):
+        super(ProjectCacheTest, self).setUp()
+        self.manager.add_project("cached", {"pid": "cached", "path_to": "cached"})
+
+    def test_cache(self):
+        file_path = os.path.join(self.manager.projects_folder, "cached.yaml")
+        project, settings = self.manager.get_project("cached")
+        self.assertTrue(file_path in self.manager.store.project_cache)
+        project["status"]["step"] = "changed"
+        project, settings = self.manager.get_project("cached")
+        self.assertEqual(project["status"], {})
+        project["status"]["step"] = "saved"
+        self.manager.save("cached", project)
+        project["status"]["step"] = "not saved"
+        project, settings = self.manager.get_project("cached")
+        self.assertEqual(project["status"]["step"], "saved")
+        store = self.manager.store
+        self.assertTrue(store.load("cached") is store.load("cached"))
+        with open(file_path, "a") as fh:
+            fh.write("foo: bar\n")
+        project, settings = self.manager.get_project("cached")
+        self.assertEqual(project["foo"], "bar")
+        self.manager.invalidate_cache("cached")
+        self.assertFalse(file_path in self.manager.store.project_cache)
+        self.manager.remove_project("cached")
+        self.assertRaises(ProjectManagerException, self.manager.get_project, "cached")
+
+
+class SQLiteProjectStoreTest(ManagerTestCase):
+
+    def setUp(self):
+        super(SQLiteProjectStoreTest, self).setUp()
+        for i in range(3):
+            pid = "project_%s" % i
+            self.manager.add_project(pid, {"pid": pid, "path_to": pid})
+            self.manager.update_status(pid, "step_a", "ok" if i else None)
+
+    def test_migration(self):
+        db_path = os.path.join(self.folder, "projects.db")
+        store = SQLiteProjectStore(db_path)
+        n = migrate_projects(YamlProjectStore(self.manager.projects_folder), store)
+        self.assertEqual(n, 3)
+        manager = ProjectManager(TestExperimentSettings(), config_path=self.manager.config_path, store=store)
+        self.assertEqual(manager.get_all_pids(), ["project_0", "project_1", "project_2"])
+        self.assertEqual(manager.get_all_projects(), sorted(self.manager.get_all_projects()))
+        project, settings = manager.get_project("project_1")
+        self.assertEqual(project["status"], {"step_a": "ok"})
+        self.assertEqual(project["path_to"], "project_1")
+        manager.update_status("project_2", "step_a", "failed")
+        self.assertEqual(manager.get_pids_by_status("step_a", "ok"), ["project_1"])
+        self.assertEqual(manager.get_pids_by_status("step_a", "ok", negate=True), ["project_0", "project_2"])
+        self.assertEqual(self.manager.get_pids_by_status("step_a", "ok", negate=True), ["project_0"])
+        project["status"]["step_b"] = 42
+        manager.save("project_1", project)
+        project, settings = manager.get_project("project_1")
+        self.assertEqual(project["status"], {"step_a": "ok", "step_b": 42})
+        manager.remove_project("project_1")
+        self.assertRaises(ProjectManagerException, manager.get_project, "project_1")
+        for m in (manager, self.manager):
+            self.assertRaises(Exception, m.update_status, "unknown", "step_a", "ok")
+
+
+class StepResult(object):
+
+    def __str__(self):
+        return "step result"
+
+
+class YamlCodecTest(unittest.TestCase):
+
+    def tearDown(self):
+        importlib.reload(yaml_codec)
+
+    def check_round_trip(self, codec):
+        data = {
+            "tuple": (1, "a", (2, 3)),
+            "unicode": u"последовательность \u2713",
+            "status": {"step": StepResult()},
+            "none": None,
+        }
+        loaded = codec.yaml_load(codec.yaml_dump(data))
+        self.assertEqual(loaded["tuple"], [1, "a", [2, 3]])
+        self.assertEqual(loaded["unicode"], data["unicode"])
+        self.assertEqual(loaded["status"], {"step": "step result"})
+        self.assertEqual(loaded["none"], None)
+        self.assertEqual(codec.yaml_load("a: !!python/tuple [1, 2]\nb: !!python/unicode abc\n"),
+                         {"a": [1, 2], "b": "abc"})
+
+    def test_round_trip(self):
+        self.check_round_trip(yaml_codec)
+
+    def test_pure_python(self):
+        saved = {}
+        for name in ("CSafeLoader", "CSafeDumper"):
+            if hasattr(yaml, name):
+                saved[name] = getattr(yaml, name)
+                delattr(yaml, name)
+        try:
+            codec = importlib.reload(yaml_codec)
+        finally:
+            for name, value in saved.items():
+                setattr(yaml, name, value)
+        self.assertFalse(codec.LIBYAML)
+        self.assertTrue(issubclass(codec.ProjectDumper, yaml.SafeDumper))
+        self.check_round_trip(codec)
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        self.server.received.append(parse_qs(body))
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class ServerReporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), StatusHandler)
+        self.server.received = []
+        self.url = "http://127.0.0.1:%s/update" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_coalescing(self):
+        reporter = ServerReporter(autostart=False)
+        for i in range(3):
+            reporter.put(self.url, {"pid": "a", "value": i}, key="a")
+        reporter.put(self.url, {"pid": "b", "value": 0}, key="b")
+        reporter.start()
+        self.assertTrue(reporter.flush(10))
+        reporter.close()
+        self.assertEqual(self.server.received, [{"pid": ["a"], "value": ["2"]},
+                                                {"pid": ["b"], "value": ["0"]}])
+
+    def test_batch(self):
+        reporter = ServerReporter(batch_size=10, autostart=False)
+        for i in range(5):
+            reporter.put(self.url, {"value": i})
+        reporter.close(10)
+        self.assertEqual(len(self.server.received), 1)
+        self.assertTrue("batch" in self.server.received[0])
+        self.assertEqual(reporter.sent, 5)
+
+    def test_flush_reporter(self):
+        get_reporter().put(self.url, {"value": 1})
+        self.assertTrue(flush_reporter(10))
+        self.assertEqual(self.server.received[-1], {"value": ["1"]})
+
+    def test_unreachable(self):
+        url = "http://127.0.0.1:1/update"
+        reporter = ServerReporter(attempts=2, backoff=0.01)
+        start = time.time()
+        reporter.put(url, {"value": 1})
+        self.assertTrue(time.time() - start < 1)
+        reporter.close(10)
+        self.assertEqual(reporter.failed, 1)
+
+
+class ProcessRunnerTest(unittest.TestCase):
+
+    def test_run_asap(self):
+        runner = ProcessRunner()
+        commands = ["exit %s" % (i % 3) for i in range(7)]
+        results = runner.run_asap(list(commands), cpu=3)
+        self.assertEqual([x["command"] for x in results], commands)
+        self.assertEqual([x["returncode"] for x in results], [0, 1, 2, 0, 1, 2, 0])
+        starts = [x["start"] for x in results]
+        self.assertEqual(starts, sorted(starts))
+        for x in results:
+            self.assertTrue(x["elapsed"] >= 0)
+        results = runner.run_asap(["exit 1"], mock=True)
+        self.assertEqual(results[0]["returncode"], None)
+
+    def test_gather(self):
+        runner = ProcessRunner()
+        lines = []
+        errors = []
+        commands = ["printf 'a\\nb'", "echo error >&2; exit 3", "sleep 10"]
+        results = runner.gather(commands, cpu=2, timeout=1, stdout=lines.append, stderr=errors.append)
+        self.assertEqual([x["command"] for x in results], commands)
+        self.assertEqual(lines, [b"a\n", b"b"])
+        self.assertEqual(errors, [b"error\n"])
+        self.assertEqual(results[1]["returncode"], 3)
+        self.assertTrue(results[2]["timeout"])
+        self.assertFalse(results[0]["timeout"])
+        results = runner.map("exit %s", [0, 1])
+        self.assertEqual([x["returncode"] for x in results], [0, 1])
+
+
+class LazyFileIOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.folder, "input.tsv.gz")
+        with WiseOpener(self.input_file, "w") as fh:
+            for i in range(1000):
+                fh.write(("%s\t%s\n" % (i, i * i)).encode("utf-8"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_pipeline(self):
+        reader = AbstractFileIO(lazy=True)
+        reader.read_from_file(self.input_file)
+        reader.filter_with_iter(lambda line: int(line.split(b"\t")[0]) % 2 == 0)
+        reader.process_with_iter(lambda line: line.replace(b"\t", b","))
+        self.assertEqual(reader.N, 500)
+        output_file = os.path.join(self.folder, "output.csv.gz")
+        reader.write_to_file(output_file)
+        with WiseOpener(output_file, "rb") as fh:
+            lines = fh.readlines()
+        self.assertEqual(len(lines), 500)
+        self.assertEqual(lines[2], b"4,16\n")
+
+    def test_lazy_source(self):
+        consumed = []
+        def source():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+        reader = AbstractFileIO(lazy=True)
+        reader.read_as_iter(source())
+        reader.process_with_iter(lambda x: x * 2)
+        self.assertEqual(consumed, [])
+        result = reader.do_with_iter(lambda x: x + 1)
+        self.assertEqual(next(result), 1)
+        self.assertEqual(consumed, [0])
+        self.assertEqual(list(result)[-1], 19)
+
+    def test_one_shot_source(self):
+        reader = AbstractFileIO(lazy=True)
+        reader.read_as_iter(x for x in ["a\n", "b\n"])
+        self.assertEqual(reader.N, 2)
+        self.assertRaises(Exception, reader.write_to_file, os.path.join(self.folder, "output.txt"))
+        reader = AbstractFileIO(lazy=True)
+        reader.read_as_iter(["a\n", "b\n"])
+        reader.read_as_iter(lambda: iter(["c\n"]))
+        self.assertEqual(reader.N, 3)
+        output_file = os.path.join(self.folder, "output.txt")
+        reader.write_to_file(output_file)
+        with open(output_file) as fh:
+            self.assertEqual(fh.read(), "a\nb\nc\n")
+
+
+class ExternalSortTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_external_sort(self):
+        items = [(i * 7919) % 1000 for i in range(1000)]
+        result = list(external_sort(items, lambda x: x % 10, max_memory=1000, temp_folder=self.folder))
+        self.assertEqual(result, sorted(items, key=lambda x: x % 10))
+        result = list(external_sort(items, lambda x: x, reverse=True, max_memory=1000, temp_folder=self.folder))
+        self.assertEqual(result, sorted(items, reverse=True))
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def count_runs(self, items, **kwargs):
+        result = external_sort(items, lambda x: x, max_memory=10000, temp_folder=self.folder, **kwargs)
+        first = next(result)
+        run_folder, = os.listdir(self.folder)
+        n_runs = len(os.listdir(os.path.join(self.folder, run_folder)))
+        self.assertEqual([first] + list(result), sorted(items))
+        return n_runs
+
+    def test_item_size(self):
+        items = [("x" * 1000, (i * 7919) % 100) for i in range(100)]
+        self.assertTrue(self.count_runs(items) >= 10)
+        self.assertEqual(self.count_runs(items, sizeof=lambda item: 1000), 10)
+        reader = AbstractFileIO()
+        reader._data = list(items)
+        self.assertRaises(Exception, reader.sort, lambda x: x, max_memory=10000)
+
+    def test_sort_file(self):
+        input_file = os.path.join(self.folder, "input.tsv")
+        with open(input_file, "w") as fh:
+            for i in range(2000):
+                fh.write("%s\t%s\n" % ((i * 7919) % 2000, i))
+        sort_func = lambda line: int(line.split("\t")[0])
+        reader = AbstractFileIO()
+        reader.read_from_file(input_file)
+        reader.sort(sort_func)
+        expected_file = os.path.join(self.folder, "expected.tsv")
+        reader.write_to_file(expected_file)
+        output_file = os.path.join(self.folder, "output.tsv")
+        reader.sort_file(input_file, output_file, sort_func, max_memory=10000, temp_folder=self.folder)
+        with open(output_file) as fh, open(expected_file) as expected_fh:
+            self.assertEqual(fh.read(), expected_fh.read())
+
+
+class ParallelFileIOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.folder, "input.tsv")
+        with open(self.input_file, "w") as fh:
+            for i in range(5000):
+                fh.write("%s\t%s\n" % (i, "A" * (i % 50)))
+        self.expected = [str(i) for i in range(5000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_line_chunks(self):
+        chunks = get_line_chunks(self.input_file, 1000)
+        self.assertTrue(len(chunks) > 10)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], os.path.getsize(self.input_file))
+        with open(self.input_file, "rb") as fh:
+            for start, end in chunks:
+                fh.seek(start - 1 if start else 0)
+                self.assertTrue(start == 0 or fh.read(1) == b"\n")
+
+    def test_file_ranges(self):
+        reader = AbstractFileIO(lazy=True)
+        reader.read_from_file(self.input_file)
+        result = list(reader.do_with_iter_online(line_stats, n_workers=3, pool_chunksize=4096))
+        self.assertEqual([x[1] for x in result], self.expected)
+        self.assertTrue(len(set(x[0] for x in result)) > 1)
+
+    def test_in_memory(self):
+        reader = AbstractFileIO()
+        reader.read_from_file(self.input_file)
+        result = reader.do_with_iter(line_stats, n_workers=2, pool_chunksize=100)
+        self.assertEqual([x[1] for x in result], self.expected)
+        reader.process_with_iter(line_stats, n_workers=2, pool_chunksize=100, column=0)
+        self.assertEqual([x[1] for x in reader.data], self.expected)
+
+    def test_cf_arguments(self):
+        reader = AbstractFileIO()
+        reader.read_from_file(self.input_file)
+        result = reader.do_with_iter(lambda x, workers, chunksize: (workers, chunksize), workers=4, chunksize=8)
+        self.assertEqual(set(result), set([(4, 8)]))
+
+
+class WiseOpenerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data = b"".join(b"line %d\n" % i for i in range(10000))
+
+    def tearDown(self):
+        WiseOpener.use_external = True
+        shutil.rmtree(self.folder)
+
+    def check_formats(self):
+        for suffix in [".gz", ".bz2", ".xz", ".zst", ".lz4"]:
+            file_name = os.path.join(self.folder, "data%s" % suffix)
+            try:
+                with WiseOpener(file_name, "w", level=1, threads=2) as fh:
+                    fh.write(self.data)
+            except Exception as e:
+                if "Install" in str(e):
+                    continue
+                raise
+            self.assertEqual(get_compression(file_name), suffix[1:])
+            with WiseOpener(file_name) as fh:
+                self.assertEqual(fh.readlines()[-1], b"line 9999\n")
+            with WiseOpener(file_name, "rb") as fh:
+                self.assertEqual(fh.read(), self.data)
+
+    def test_external(self):
+        self.check_formats()
+
+    def test_modules(self):
+        WiseOpener.use_external = False
+        self.check_formats()
+
+    def test_magic(self):
+        file_name = os.path.join(self.folder, "data.gz")
+        with WiseOpener(file_name, "w") as fh:
+            fh.write(self.data)
+        renamed_file = os.path.join(self.folder, "data.txt")
+        os.rename(file_name, renamed_file)
+        with WiseOpener(renamed_file) as fh:
+            self.assertEqual(fh.readline(), b"line 0\n")
+        with open(file_name, "w") as fh:
+            fh.write("plain text\n")
+        with WiseOpener(file_name) as fh:
+            self.assertEqual(fh.readline(), "plain text\n")
+
+
+class MappedFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, "reads.fa")
+        with open(self.file_name, "wb") as fh:
+            fh.write(b"comment\n>read1\nACGT\nAC\n>read2\nGGGG")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_lines(self):
+        with MappedFile(self.file_name) as mf:
+            lines = [line.tobytes() for line in mf.iter_lines()]
+            self.assertEqual(lines, [b"comment\n", b">read1\n", b"ACGT\n", b"AC\n", b">read2\n", b"GGGG"])
+            records = [bytes(record) for record in mf.iter_records(b">")]
+            self.assertEqual(records, [b">read1\nACGT\nAC\n", b">read2\nGGGG"])
+            offset = mf.find(b">read2")
+            self.assertEqual(mf.line_at(offset).tobytes(), b">read2\n")
+            self.assertEqual(mf.read_at(offset + 7, 4).tobytes(), b"GGGG")
+        reader = AbstractFileIO()
+        self.assertEqual(len(list(reader.read_online_mapped(self.file_name))), 6)
+
+    def test_empty(self):
+        empty_file = os.path.join(self.folder, "empty.txt")
+        open(empty_file, "w").close()
+        with MappedFile(empty_file) as mf:
+            self.assertEqual(list(mf.iter_lines()), [])
+            self.assertEqual(list(mf.iter_records()), [])
+
+
+def write_bgzf(file_name, data, block_size=1000):
+    with open(file_name, "wb") as fh:
+        for start in range(0, len(data) + 1, block_size):
+            block = data[start:start + block_size]
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            cdata = compressor.compress(block) + compressor.flush()
+            fh.write(b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00")
+            fh.write(struct.pack("<H", len(cdata) + 25))
+            fh.write(cdata)
+            fh.write(struct.pack("<II", zlib.crc32(block) & 0xffffffff, len(block)))
+
+
+class LineIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.lines = [(">read%s\n%s\n" % (i, "ACGT" * (i % 7))).encode("utf-8") for i in range(3000)]
+        self.data = b"".join(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def check_index(self, file_name):
+        with LineIndex(file_name) as index:
+            self.assertEqual(len(index), 6000)
+            self.assertEqual(index.get(2), b">read1\n")
+            self.assertEqual(index.get(-1), self.data.split(b"\n")[-2] + b"\n")
+            self.assertEqual(b"".join(index.slice(0, 6000)), self.data)
+        with LineIndex(file_name, marker=b">", index_file=file_name + ".records") as index:
+            self.assertEqual(len(index), 3000)
+            self.assertEqual(index.get(1500), self.lines[1500])
+            self.assertEqual(index.slice(10, 13), self.lines[10:13])
+            sample = index.sample(5, seed=1)
+            self.assertEqual(len(sample), 5)
+            self.assertTrue(all(x in self.lines for x in sample))
+            ranges = index.get_ranges(4)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], 3000)
+            self.assertEqual(len(ranges), 4)
+
+    def test_plain(self):
+        file_name = os.path.join(self.folder, "reads.fa")
+        with open(file_name, "wb") as fh:
+            fh.write(self.data)
+        self.check_index(file_name)
+        self.assertTrue(os.path.isfile(file_name + ".pyidx"))
+        # index is rebuilt after file change
+        with open(file_name, "ab") as fh:
+            fh.write(b">extra\n")
+        os.utime(file_name, (0, 0))
+        with LineIndex(file_name) as index:
+            self.assertEqual(index.get(6000), b">extra\n")
+
+    def test_gzip(self):
+        file_name = os.path.join(self.folder, "reads.fa.gz")
+        with gzip.open(file_name, "wb") as fh:
+            fh.write(self.data)
+        self.check_index(file_name)
+
+    def test_bgzf(self):
+        file_name = os.path.join(self.folder, "reads.fa.bgz")
+        write_bgzf(file_name, self.data)
+        self.check_index(file_name)
+        with LineIndex(file_name) as index:
+            self.assertEqual(index.kind, "bgzf")
+
+
+class FolderScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for sub in ["a", "a/b", "c"]:
+            os.makedirs(os.path.join(self.folder, sub))
+            for name in ["x.fa", "y.fa.gz", "z.txt"]:
+                with open(os.path.join(self.folder, sub, name), "w") as fh:
+                    fh.write(sub)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_walk(self):
+        reader = AbstractFolderIO(self.folder)
+        expected = [(root, sorted(dirs), sorted(files)) for root, dirs, files in os.walk(self.folder, topdown=False)]
+        result = [(root, sorted(dirs), sorted(files)) for root, dirs, files in reader.walk()]
+        self.assertEqual(sorted(result), sorted(expected))
+        self.assertEqual(len(reader.get_filenames()), 9)
+
+    def test_masks(self):
+        self.assertEqual(len(AbstractFolderIO(self.folder, mask=r"\.fa$").get_files()), 3)
+        self.assertEqual(len(AbstractFolderIO(self.folder, mask=".fa").get_files()), 6)
+        self.assertEqual(len(AbstractFolderIO(self.folder, mask="^[xz]").get_files()), 6)
+        self.assertEqual(len(AbstractFolderIO(self.folder, glob="*.fa*").get_files()), 6)
+        self.assertEqual(len(AbstractFolderIO(self.folder, suffix=(".gz", ".txt")).get_files()), 6)
+        self.assertEqual(list(AbstractFolderIO(self.folder, mask="b").iter_folders()), ["b"])
+
+    def test_refresh(self):
+        reader = AbstractFolderIO(self.folder, refresh=False)
+        self.assertEqual(len(reader.get_files()), 9)
+        snapshot = reader.snapshot
+        for path in snapshot.dirs:
+            snapshot.dirs[path] = snapshot.dirs[path][:4] + (time.time() + 10,)
+        self.assertEqual(snapshot.refresh(), 0)
+        with open(os.path.join(self.folder, "a", "b", "new.fa"), "w") as fh:
+            fh.write("new")
+        os.utime(os.path.join(self.folder, "a", "b"), (0, 0))
+        self.assertEqual(len(reader.get_files()), 9)
+        self.assertEqual(len(AbstractFolderIO(self.folder).get_files()), 10)
+        self.assertEqual(len(reader.get_files()), 10)
+
+
+class ProcessFolderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.input_folder = os.path.join(self.folder, "input")
+        self.output_folder = os.path.join(self.folder, "output")
+        os.makedirs(self.input_folder)
+        os.makedirs(self.output_folder)
+        for name in ["a.txt", "b.txt", "c.txt", "broken.txt"]:
+            with open(os.path.join(self.input_folder, name), "w") as fh:
+                fh.write("text of %s" % name)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_to_other(self):
+        for executor in ["thread", "process"]:
+            summary = sc_process_folder_to_other(self.input_folder, self.output_folder, upper_text,
+                                                 {"suffix": "!"}, workers=2, executor=executor)
+            self.assertEqual(len(summary["processed"]), 3)
+            self.assertEqual(list(summary["failed"]), [os.path.join(self.input_folder, "broken.txt")])
+            with open(os.path.join(self.output_folder, "a.txt")) as fh:
+                self.assertEqual(fh.read(), "TEXT OF A.TXT!")
+        self.assertEqual(sorted(os.listdir(self.output_folder)), ["a.txt", "b.txt", "c.txt"])
+        summary = sc_process_folder_to_other(self.input_folder, self.output_folder, upper_text, {},
+                                             workers=2, skip_newer=True)
+        self.assertEqual(len(summary["skipped"]), 3)
+        self.assertEqual(len(summary["failed"]), 1)
+
+    def test_in_place(self):
+        summary = sc_process_folder(self.input_folder, upper_text, {}, mask="^[ab]", workers=2)
+        self.assertEqual(len(summary["processed"]), 2)
+        with open(os.path.join(self.input_folder, "b.txt")) as fh:
+            self.assertEqual(fh.read(), "TEXT OF B.TXT")
+        self.assertEqual(len(os.listdir(self.input_folder)), 4)
+
+    def test_online(self):
+        summary = sc_process_folder_online(self.input_folder, upper_lines, {}, mask="^[ac]",
+                                           output_folder=self.output_folder, workers=2)
+        self.assertEqual(len(summary["processed"]), 2)
+        with open(os.path.join(self.output_folder, "c.txt")) as fh:
+            self.assertEqual(fh.read(), "TEXT OF C.TXT")
+        big_file = os.path.join(self.input_folder, "big.txt.gz")
+        with WiseOpener(big_file, "w") as fh:
+            fh.write(b"A" * 100000)
+        summary = sc_process_folder_online(self.input_folder, count_chunks, {}, mask="gz$", chunksize=1024)
+        self.assertEqual(summary["processed"], [big_file])
+        with WiseOpener(big_file) as fh:
+            self.assertEqual(fh.read(), b"98\n")
+
+
+class TransferFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "source")
+        self.target = os.path.join(self.folder, "target")
+        os.makedirs(os.path.join(self.source, "sub"))
+        os.makedirs(self.target)
+        for name in ["a.dat", "b.dat", "sub/c.dat"]:
+            with open(os.path.join(self.source, name), "wb") as fh:
+                fh.write(os.urandom(100000))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_copy_file(self):
+        source = os.path.join(self.source, "a.dat")
+        target = os.path.join(self.target, "a.dat")
+        self.assertEqual(copy_file(source, target), 100000)
+        with open(source, "rb") as fh, open(target, "rb") as target_fh:
+            self.assertEqual(fh.read(), target_fh.read())
+        self.assertEqual(os.path.getmtime(source), os.path.getmtime(target))
+
+    def test_copy_and_move(self):
+        report = sc_copy_files(self.source, self.target, workers=2)
+        self.assertEqual(report["copied"], 3)
+        self.assertEqual(report["bytes"], 300000)
+        self.assertTrue(report["throughput"] > 0)
+        self.assertEqual(sorted(os.listdir(self.target)), ["a.dat", "b.dat", "c.dat"])
+        report = sc_copy_files(self.source, self.target, workers=2, skip_identical=True)
+        self.assertEqual(report["skipped"], 3)
+        report = sc_copy_files(self.source, self.target)
+        self.assertEqual(report["copied"], 3)
+        with open(os.path.join(self.source, "b.dat"), "ab") as fh:
+            fh.write(b"changed")
+        report = sc_move_files(self.source, self.target, mask="dat$", workers=2, skip_identical=True)
+        self.assertEqual(report["moved"], 1)
+        self.assertEqual(report["skipped"], 2)
+        self.assertEqual(os.path.getsize(os.path.join(self.target, "b.dat")), 100007)
+        self.assertEqual(os.listdir(os.path.join(self.source, "sub")), [])
+
+    def test_same_file(self):
+        os.link(os.path.join(self.source, "a.dat"), os.path.join(self.target, "a.dat"))
+        for skip_identical in (False, True):
+            report = sc_move_files(self.source, self.source, mask="b.dat$", skip_identical=skip_identical)
+            self.assertEqual(report["skipped"], 1)
+            report = sc_move_files(self.source, self.target, mask="a.dat$", skip_identical=skip_identical)
+            self.assertEqual(report["skipped"], 1)
+            report = sc_copy_files(self.source, self.target, mask="a.dat$", skip_identical=skip_identical)
+            self.assertEqual(report["skipped"], 1)
+        self.assertEqual(os.path.getsize(os.path.join(self.source, "b.dat")), 100000)
+        self.assertEqual(os.path.getsize(os.path.join(self.source, "a.dat")), 100000)
+        self.assertEqual(os.path.getsize(os.path.join(self.target, "a.dat")), 100000)
+
+
+class CompiledModelTest(unittest.TestCase):
+
+    def test_set_with_list(self):
+        for model_class in (RepeatModel, SlottedRepeatModel):
+            model = model_class()
+            model.set_with_list(["r1", "10", "0.5", "1,2,3", "None"])
+            self.assertEqual(model.start, 10)
+            self.assertEqual(model.gc, 0.5)
+            self.assertEqual(model.positions, [1, 2, 3])
+            self.assertEqual(model.note, None)
+            self.assertEqual(str(model), "r1\t10\t0.5\t1,2,3\tNone\n")
+            model.positions = None
+            self.assertEqual(str(model), "r1\t10\t0.5\t\tNone\n")
+            self.assertRaises(Exception, model.set_with_list, ["r1"])
+
+    def test_set_with_dict(self):
+        model = SlottedRepeatModel()
+        model.set_with_dict({"name": "r2", "start": "5", "positions": "", "gc": "None"})
+        self.assertEqual(model.as_dict(), {"name": "r2", "start": 5, "gc": None, "positions": None, "note": None})
+
+    def test_slots(self):
+        model = SlottedRepeatModel()
+        model.set_with_list(["r1", "10", "0.5", "1,2,3", "None"])
+        self.assertEqual(SlottedRepeatModel.__slots__, ("name", "start", "gc", "positions", "note"))
+        self.assertEqual(model.__dict__, {})
+        model.other = 1
+        self.assertEqual(model["other"], 1)
+        self.assertTrue(isinstance(model, RepeatModel))
+
+    def get_allocated_memory(self, model_class):
+        tracemalloc.start()
+        try:
+            models = []
+            for i in range(1000):
+                model = model_class()
+                model.set_with_list(["r1", "10", "0.5", "1,2,3", "None"])
+                str(model)
+                models.append(model)
+            return tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+    def test_without_dict(self):
+        model = CompactRepeatModel()
+        model.set_with_list(["r1", "10", "0.5", "1,2,3", "None"])
+        self.assertEqual(str(model), "r1\t10\t0.5\t1,2,3\tNone\n")
+        self.assertFalse(hasattr(model, "__dict__"))
+        self.assertRaises(AttributeError, setattr, model, "other", 1)
+        self.assertEqual(pickle.loads(pickle.dumps(model)).as_dict(), model.as_dict())
+        self.assertTrue(self.get_allocated_memory(CompactRepeatModel) < 0.9 * self.get_allocated_memory(RepeatModel))
+
+    def test_overridden_methods(self):
+        model = CustomStrModel()
+        self.assertEqual(str(model), "custom")
+        self.assertEqual(CustomStrModel.__slots__, ())
+
+    def test_instance_attributes(self):
+        model = ShortModel()
+        model.set_with_list(["r1", "10", "7"])
+        self.assertEqual((model.start, model.note), (10, 7))
+        self.assertEqual(str(model), "r1\t10\t7\n")
+        model.set_with_dict({"note": "8"})
+        self.assertEqual(model.note, 8)
+
+    def test_changed_class_attributes(self):
+        for model_class in (LateModel, LateChildModel):
+            model = model_class()
+            model.set_with_list(["r1", "10"])
+            self.assertEqual(model.start, 10)
+        LateModel.dumpable_attributes = ["start", "name"]
+        try:
+            model = LateChildModel()
+            model.set_with_list(["5", "r1"])
+            self.assertEqual(model.start, 5)
+            self.assertEqual(str(model), "5\tr1\n")
+        finally:
+            LateModel.dumpable_attributes = ["name", "start"]
+
+    def test_pickle(self):
+        model = SlottedRepeatModel()
+        model.set_with_list(["r1", "10", "0.5", "1,2,3", "None"])
+        loaded = pickle.loads(pickle.dumps(model))
+        self.assertEqual(loaded.as_dict(), model.as_dict())
+
+
+class ModelTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, "repeats.tsv.gz")
+        with gzip.open(self.file_name, "wt") as fh:
+            for i in range(10):
+                gc = "None" if i == 3 else str(i / 10.0)
+                fh.write("r%s\t%s\t%s\t%s\tnote\n" % (i, i * 10, gc, ",".join(str(x) for x in range(i))))
+            fh.write("\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_load(self):
+        table = ModelTable.from_file(RepeatModel, self.file_name, chunksize=3)
+        self.assertEqual(len(table), 10)
+        self.assertEqual(table.kinds, {"name": "str", "start": "int", "gc": "float", "positions": "list", "note": "str"})
+        self.assertEqual(list(table.column("start")), [i * 10 for i in range(10)])
+        self.assertEqual(table.get_mask("gc"), bytearray([0, 0, 0, 1, 0, 0, 0, 0, 0, 0]))
+        self.assertEqual(table.get_mask("start"), None)
+
+    def test_rows(self):
+        table = ModelTable.from_file(RepeatModel, self.file_name)
+        model = table[-1]
+        self.assertTrue(isinstance(model, RepeatModel))
+        self.assertEqual(model.as_dict(), {"name": "r9", "start": 90, "gc": 0.9,
+                                           "positions": list(range(9)), "note": "note"})
+        self.assertEqual(table[3].gc, None)
+        self.assertEqual(table[0].positions, [])
+        self.assertEqual([model.name for model in table], ["r%s" % i for i in range(10)])
+        self.assertRaises(IndexError, table.__getitem__, 10)
+
+    def test_aggregation(self):
+        table = ModelTable.from_file(RepeatModel, self.file_name)
+        self.assertEqual(table.sum("start"), 450)
+        self.assertEqual(table.count("gc"), 9)
+        self.assertAlmostEqual(table.mean("gc"), 4.2 / 9)
+        indices = table.filter("gc", lambda x: x > 0.25)
+        self.assertEqual(indices, [4, 5, 6, 7, 8, 9])
+        selected = table.select(indices)
+        self.assertEqual(len(selected), 6)
+        self.assertEqual(selected[0].name, "r4")
+        self.assertEqual(selected.count("gc"), 6)
+
+    def test_append(self):
+        table = ModelTable(RepeatModel)
+        model = RepeatModel()
+        model.set_with_list(["r1", "10", "None", "1,2", "x"])
+        table.append(model)
+        table.append_rows([["r2", "20", "0.5", "3", "None"]])
+        self.assertEqual(str(table[0]), str(model))
+        self.assertEqual(table[1].note, None)
+        self.assertEqual(table.get_mask("gc"), bytearray([1, 0]))
+        self.assertRaises(Exception, table.append_rows, [["r3"]])
+        self.assertRaises(ValueError, table.append_rows, [["r3", "30", "None", "4", "y"], ["r4", "40", "bad", "5", "z"]])
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.get_size(), table.select([0, 1]).get_size())
+        self.assertEqual(table.get_mask("gc"), bytearray([1, 0]))
+        table.append_rows([["r3", "30", "0.1", "4", "y"]])
+        self.assertEqual([model.name for model in table], ["r1", "r2", "r3"])
+        self.assertEqual(list(table.column("start")), [10, 20, 30])
+
+
+class ModelIOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.models = []
+        for i in range(25):
+            model = SlottedRepeatModel() if i % 2 else RepeatModel()
+            model.set_with_list(["r%s" % i, str(i), "0.%s" % i, ",".join(str(x) for x in range(1 + i % 4)), " x "])
+            self.models.append(model)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_dump_many(self):
+        fh = io.StringIO()
+        self.assertEqual(dump_many(self.models, fh, chunksize=4), 25)
+        self.assertEqual(fh.getvalue(), "".join(str(model) for model in self.models))
+        fh = io.BytesIO()
+        dump_many(self.models, fh)
+        self.assertEqual(fh.getvalue().decode("utf-8"), "".join(str(model) for model in self.models))
+
+    def test_instance_attributes(self):
+        models = []
+        for i in range(3):
+            model = ShortModel() if i == 1 else RepeatModel()
+            model.set_with_list(["r%s" % i, "1", "2"] if i == 1 else ["r%s" % i, "1", "0.5", "1,2", "x"])
+            models.append(model)
+        fh = io.StringIO()
+        dump_many(models, fh)
+        self.assertEqual(fh.getvalue(), "".join(map(str, models)))
+        self.assertEqual(fh.getvalue().split("\n")[1], "r1\t1\t2")
+
+    def test_preprocess_data(self):
+        model = PreprocessedModel()
+        model.set_with_list(["r1", "1", "0.5", "1", "None"])
+        fh = io.StringIO()
+        dump_many([model], fh)
+        self.assertEqual(fh.getvalue(), "R1\t1\t0.5\t1\tNone\n")
+
+    def test_load_many(self):
+        file_name = os.path.join(self.folder, "models.tsv.gz")
+        dump_many(self.models, file_name)
+        loaded = list(load_many(file_name, RepeatModel, chunksize=7))
+        self.assertEqual(len(loaded), 25)
+        self.assertEqual([str(model) for model in loaded], [str(model) for model in self.models])
+        self.assertEqual(loaded[3].positions, [0, 1, 2, 3])
+        self.assertEqual(loaded[3].note, "x")
+        loaded = list(load_many(io.StringIO("r1\t1\t0.5\t1\tNone\r\n\n"), InitModel))
+        self.assertEqual(loaded[0].loaded, True)
+        self.assertEqual(loaded[0].note, None)
+        self.assertRaises(Exception, list, load_many(io.StringIO("r1\t1\n"), RepeatModel))
+
+
+class BinaryModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.models = []
+        for i in range(30):
+            model = RepeatModel()
+            model.set_with_list(["r%s" % i, str(i - 10), "0.%s" % i, ",".join(str(x) for x in range(i % 5 + 1)), "None"])
+            self.models.append(model)
+        self.models[3].name = None
+        self.models[4].positions = None
+        self.models[5].start = None
+        self.models[6].name = "\u0434\u043d\u043a"
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        for name in ["models.pyexp", "models.pyexp.gz", "models.pyexp.xz"]:
+            file_name = os.path.join(self.folder, name)
+            self.assertEqual(dump_binary(self.models, file_name), 30)
+            loaded = list(load_binary(file_name, RepeatModel))
+            self.assertEqual([model.as_dict() for model in loaded], [model.as_dict() for model in self.models])
+        self.assertEqual(loaded[3].name, None)
+        self.assertEqual(loaded[4].positions, None)
+        self.assertEqual(loaded[5].start, None)
+        self.assertEqual(loaded[6].name, "\u0434\u043d\u043a")
+
+    def test_schema(self):
+        fh = io.BytesIO()
+        with BinaryModelWriter(fh, TaggedModel, buffer_size=10) as writer:
+            for i in range(3):
+                model = TaggedModel()
+                model.set_with_list(["t%s" % i, "a,b%s" % i, "0.5,1.5", str(i)])
+                writer.write(model)
+        fh.seek(0)
+        reader = BinaryModelReader(fh)
+        self.assertEqual(reader.schema, [["name", "str", None], ["tags", "list", "str"],
+                                         ["scores", "list", "float"], ["start", "int", None]])
+        self.assertEqual(list(reader), [{"name": "t%s" % i, "tags": ["a", "b%s" % i], "scores": [0.5, 1.5], "start": i}
+                                        for i in range(3)])
+        fh.seek(0)
+        self.assertRaises(Exception, BinaryModelReader, fh, RepeatModel)
+
+    def test_errors(self):
+        self.assertRaises(Exception, BinaryModelReader, io.BytesIO(b"name\t1\n"))
+        fh = io.BytesIO()
+        dump_binary(self.models, fh)
+        self.assertRaises(Exception, list, load_binary(io.BytesIO(fh.getvalue()[:-3]), RepeatModel))
+        self.assertRaises(Exception, dump_binary, [], io.BytesIO())
+
+
+class MongoBatchTest(unittest.TestCase):
+
+    def test_write_to_mongodb(self):
+        collection = RecordingCollection()
+        reader = AbstractFileIO()
+        documents = ({"name": "r%s" % i} for i in range(25))
+        self.assertEqual(reader.write_to_mongodb(collection, documents, batch_size=10), 25)
+        self.assertEqual(collection.batches, [(10, False), (10, False), (5, False)])
+
+    def test_insert_errors(self):
+        collection = RecordingCollection()
+        documents = [{"name": "r%s" % (i % 8)} for i in range(10)]
+        report = mongo_pool.mongo_insert_many(collection, documents, batch_size=4)
+        self.assertEqual(report, {"inserted": 8, "failed": 2})
+        models = []
+        for i in range(5):
+            model = MongoRepeatModel()
+            model.set_with_list(["m%s" % (i % 3), str(i), "1"])
+            models.append(model)
+        report = MongoRepeatModel.mongo_insert_many(models, batch_size=3, collection=RecordingCollection())
+        self.assertEqual(report, {"inserted": 3, "failed": 2})
+
+    def test_insert_ids(self):
+        models = []
+        for name in ["a", "b", "a", "c", "d"]:
+            model = MongoRepeatModel()
+            model.set_with_list([name, "1", "1"])
+            models.append(model)
+        report = MongoRepeatModel.mongo_insert_many(models, collection=RecordingCollection())
+        self.assertEqual(report, {"inserted": 4, "failed": 1})
+        self.assertEqual([getattr(model, "_id", None) is not None for model in models], [True, True, False, True, True])
+        for model in models:
+            model._id = None
+        report = MongoRepeatModel.mongo_insert_many(models, ordered=True, collection=RecordingCollection())
+        self.assertEqual(report, {"inserted": 2, "failed": 1})
+        self.assertEqual([model._id is not None for model in models], [True, True, False, False, False])
+        documents = [{"name": name} for name in ["a", "b", "a", "c"]]
+        report = mongo_pool.mongo_insert_many(RecordingCollection(), documents, ordered=True)
+        self.assertEqual(report, {"inserted": 2, "failed": 1})
+
+    def test_client_pool(self):
+        created = []
+
+        def factory(uri, **options):
+            client = mongomock.MongoClient() if mongomock else object()
+            created.append((uri, options))
+            return client
+        mongo_pool.mongo_client_factory = factory
+        try:
+            client = mongo_pool.get_mongo_client("mongodb://host", w=1)
+            self.assertTrue(client is mongo_pool.get_mongo_client("mongodb://host", w=1))
+            mongo_pool.get_mongo_client("mongodb://host")
+            self.assertEqual(created, [("mongodb://host", {"w": 1}), ("mongodb://host", {})])
+        finally:
+            mongo_pool.mongo_client_factory = None
+            mongo_pool._mongo_clients.clear()
+
+
+class MongoModelTest(unittest.TestCase):
+    """ Models with RecordingClient, RecordingCollection has no bulk_write(),
+    so upserts are done one by one as without pymongo.
+    """
+
+    client_factory = RecordingClient
+    use_bulk_write = False
+
+    def setUp(self):
+        mongo_pool.mongo_client_factory = self.client_factory
+        self.pymongo = mongo_pool.pymongo
+        if not self.use_bulk_write:
+            mongo_pool.pymongo = None
+        self.models = []
+        for i in range(25):
+            model = MongoRepeatModel()
+            model.set_with_list(["r%s" % i, str(i), "1,%s" % i])
+            self.models.append(model)
+
+    def tearDown(self):
+        mongo_pool.close_mongo_clients()
+        mongo_pool.mongo_client_factory = None
+        mongo_pool.pymongo = self.pymongo
+
+    def test_insert_many(self):
+        report = MongoRepeatModel.mongo_insert_many(self.models, batch_size=10)
+        self.assertEqual(report, {"inserted": 25, "failed": 0})
+        self.assertTrue(self.models[0]._id is not None)
+        loaded = list(MongoRepeatModel.mongo_find({"start": {"$gte": 20}}))
+        self.assertEqual(sorted(model.name for model in loaded), ["r20", "r21", "r22", "r23", "r24"])
+        self.assertEqual(loaded[0].positions, [1, loaded[0].start])
+        self.assertEqual(MongoRepeatModel.get_mongo_collection().count_documents({}), 25)
+
+    def test_upsert_many(self):
+        report = MongoRepeatModel.mongo_upsert_many(self.models[:10], batch_size=4)
+        self.assertEqual(report["upserted"], 10)
+        for model in self.models:
+            model.start += 100
+        report = MongoRepeatModel.mongo_upsert_many(self.models, batch_size=4)
+        self.assertEqual(report["matched"], 10)
+        self.assertEqual(report["upserted"], 15)
+        collection = MongoRepeatModel.get_mongo_collection()
+        self.assertEqual(collection.count_documents({}), 25)
+        self.assertEqual(collection.find_one({"name": "r3"})["start"], 103)
+
+    def test_single_model(self):
+        model = self.models[0]
+        model.mongo_add()
+        loaded = MongoRepeatModel()
+        self.assertTrue(loaded.mongo_get(model._id))
+        self.assertEqual(loaded.as_dict(), model.as_dict())
+        model.start = 7
+        self.assertEqual(model.mongo_update_fields(["start"]), 1)
+        self.assertTrue(loaded.mongo_get({"name": "r0"}))
+        self.assertEqual(loaded.start, 7)
+        self.assertEqual(self.models[1].mongo_update(), 0)
+        self.assertEqual(model.mongo_remove(), 1)
+        self.assertFalse(loaded.mongo_get({"name": "r0"}))
+        self.assertEqual(MongoRepeatModel.get_mongo_collection().count_documents({}), 1)
+
+
+@unittest.skipIf(mongomock is None, "mongomock isn't installed")
+class MongomockModelTest(MongoModelTest):
+    """ Models with mongomock, upserts use bulk_write() if pymongo is installed."""
+
+    client_factory = mongomock.MongoClient if mongomock else None
+    use_bulk_write = True
+
+
+class JobsOptionTest(unittest.TestCase):
+
+    def test_pop_jobs_option(self):
+        args = ["force", "step", "0", "10", "dataset", "--jobs", "4"]
+        self.assertEqual(_pop_jobs_option(args), 4)
+        self.assertEqual(args, ["force", "step", "0", "10", "dataset"])
+        args = ["--jobs=2", "force", "step", "dataset"]
+        self.assertEqual(_pop_jobs_option(args), 2)
+        self.assertEqual(args, ["force", "step", "dataset"])
+        self.assertEqual(_pop_jobs_option(["force", "step", "dataset"]), 1)
+
+    def test_wrong_jobs_option(self):
+        for args in [["force", "--jobs"], ["force", "--jobs", "many"], ["--jobs=0", "force"]]:
+            self.assertRaises(ValueError, _pop_jobs_option, args)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()